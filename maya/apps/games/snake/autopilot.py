@@ -0,0 +1,491 @@
+"""
+Autopilot for the attract mode. Plays a GameGrid by itself:
+
+    pilot = Autopilot(grid)
+    grid.queueDirection(pilot.nextDirection())
+    grid.update()
+
+The pilot runs A* from the head to the apple, guided by the steps to the apple ignoring the
+snake. On an open arena those are the wrapped distance, with no search at all. With walls they
+come from a DistanceMap, a breadth first search from the apple that only spreads as far as A*
+asks and is kept between ticks, so a search cut short by the budget carries on next tick rather
+than starting again. A path is only taken if the tail can still be reached once the apple is
+eaten, and is then followed without searching again until the apple moves. When no safe path is
+found the pilot follows a Hamiltonian cycle of the arena, or chases its tail.
+
+Cells are flat indices, x * height + y, matching GameGrid.grid[x][y] and the maze wall
+bitboard. The arena wraps around at the edges, as the game does.
+"""
+import heapq
+from collections import deque
+
+from majic_tools.maya.apps.games.snake import stats, tracing
+
+# ------------------------------------------------------------------------------------------------ #
+
+# plan time per tick, in seconds
+#
+DEFAULT_BUDGET = 0.001
+
+# clock is checked every this many searched cells
+#
+_BUDGET_CHECK = 64
+
+# ticks to wait before searching for the apple again, after no safe path was found
+#
+RETRY_TICKS = 4
+
+# ------------------------------------------------------------------------------------------------ #
+
+def neighbourMap(width, height, walls=0):
+    """
+    Neighbours of every cell, up, down, left, right, wrapping at the edges.
+
+    :param int walls: wall bitboard. Walls are left out as neighbours
+    """
+    neighbours = []
+    for x in range(width):
+        for y in range(height):
+            cells = (x * height + (y - 1) % height,
+                     x * height + (y + 1) % height,
+                     ((x - 1) % width) * height + y,
+                     ((x + 1) % width) * height + y)
+            neighbours.append(tuple(cell for cell in cells if not walls >> cell & 1))
+    return neighbours
+
+
+_cycles = {}
+
+
+def hamiltonianCycle(width, height):
+    """
+    Next cell of every cell along a cycle visiting the whole arena once, or None if the arena
+    has no cycle of this form, when width and height are both odd. Cached per size.
+
+    Columns are walked down and up in turn from row 1, then row 0 leads back to the start:
+
+        0 <- <- <- <-
+        v ^ v ^ v ^ ^
+        v ^ v ^ v ^ ^
+        > ^ > ^ > ^
+    """
+    key = (width, height)
+    if key in _cycles:
+        return _cycles[key]
+
+    if width < 2 or height < 2 or (width % 2 and height % 2):
+        _cycles[key] = None
+        return None
+
+    # walk columns if width is even, otherwise rows, transposing the cells
+    #
+    transpose = width % 2 == 1
+    columns, rows = (height, width) if transpose else (width, height)
+
+    order = []
+    for column in range(columns):
+        column_rows = range(1, rows) if column % 2 == 0 else range(rows - 1, 0, -1)
+        order.extend((column, row) for row in column_rows)
+    order.extend((column, 0) for column in range(columns - 1, -1, -1))
+
+    if transpose:
+        order = [(row, column) for column, row in order]
+
+    cells = [x * height + y for x, y in order]
+    cycle = [0] * (width * height)
+    for index, cell in enumerate(cells):
+        cycle[cell] = cells[(index + 1) % len(cells)]
+
+    _cycles[key] = cycle
+    return cycle
+
+# ------------------------------------------------------------------------------------------------ #
+
+class _OverBudget(Exception):
+    pass
+
+
+class DistanceMap(object):
+    """
+    Steps from a source cell to every cell, ignoring the snake. Filled in by a breadth first
+    search that stops once the cell asked for is reached, and resumes from there on the next
+    question, so each cell is searched once however many questions are asked.
+    """
+
+    def __init__(self, neighbours, source):
+        """
+        :param list neighbours: neighbours of every cell, as given by neighbourMap
+        :param int source: cell to measure from
+        """
+        self.neighbours = neighbours
+        self.source = source
+        self.distances = [-1] * len(neighbours)
+        self.distances[source] = 0
+        self._queue = deque([source])
+
+
+    def distance(self, cell, deadline=None):
+        """
+        Steps from the source to a cell, or -1 if it can't be reached.
+
+        :param float deadline: clock time to stop searching at, raising _OverBudget. The
+                               search carries on from there next time
+        """
+        distances = self.distances
+        if distances[cell] >= 0 or not self._queue:
+            return distances[cell]
+
+        neighbours = self.neighbours
+        queue = self._queue
+        clock = tracing.monotonic
+        searched = 0
+
+        while queue and distances[cell] < 0:
+            searched += 1
+            if deadline is not None and searched % _BUDGET_CHECK == 0 and clock() > deadline:
+                raise _OverBudget()
+
+            current = queue.popleft()
+            distance = distances[current] + 1
+            for neighbour in neighbours[current]:
+                if distances[neighbour] < 0:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+
+        return distances[cell]
+
+# ------------------------------------------------------------------------------------------------ #
+
+class Autopilot(object):
+    """Chooses a direction for a GameGrid snake each tick."""
+
+    def __init__(self, grid, budget=DEFAULT_BUDGET):
+        """
+        :param GameGrid grid: grid to play
+        :param float budget: seconds allowed for planning per tick. If a search runs over,
+                             the pilot falls back to the cycle or its tail for that tick
+        """
+        self.grid = grid
+        self.budget = budget
+
+        self.width = 0
+        self.height = 0
+        self.walls = 0
+        self.neighbours = []
+        self.cycle = None
+
+        # snake body, head first, and the order each cell was entered in. A cell's counter,
+        # the ticks until it is free, is length - (head_serial - serial)
+        #
+        self._body = deque()
+        self._serial = {}
+        self._head_serial = 0
+        self._length = 0
+
+        self._apple = None
+        self._apple_map = None
+        self._path = deque()
+        self._retry = 0
+
+        # stats
+        #
+        self.plans = 0
+        self.reused = 0
+        self.fallbacks = 0
+        self.plan_times = stats.RollingWindow()
+
+
+    def reset(self):
+        self._body.clear()
+        self._serial.clear()
+        self._apple = None
+        self._apple_map = None
+        self._path.clear()
+        self._retry = 0
+
+    # -------------------------------------------------------------------------------------------- #
+
+    def _resize(self):
+        self.width, self.height = self.grid.width, self.grid.height
+        self.walls = self.grid.walls
+        self.neighbours = neighbourMap(self.width, self.height, self.walls)
+
+        # the cycle crosses every cell, so only works without walls
+        #
+        self.cycle = hamiltonianCycle(self.width, self.height) if not self.walls else None
+        self.reset()
+
+
+    def _rebuildBody(self):
+        """Read the whole body from the grid. Only needed when the snake jumps, on restart."""
+        self._body.clear()
+        self._serial.clear()
+
+        height = self.height
+        cells = []
+        for x, column in enumerate(self.grid.grid):
+            for y, block in enumerate(column.rows):
+                if block.counter > 0:
+                    cells.append((block.counter, x * height + y))
+        cells.sort(reverse=True)
+
+        self._length = self.grid.length
+        self._head_serial = len(cells)
+        for index, (_, cell) in enumerate(cells):
+            self._body.append(cell)
+            self._serial[cell] = self._head_serial - index
+
+        self._path.clear()
+
+
+    def _sync(self):
+        """Follow the snake's last move, reading only the head rather than the whole grid."""
+        grid = self.grid
+        if (grid.width, grid.height, grid.walls) != (self.width, self.height, self.walls):
+            self._resize()
+
+        x, y = self.grid.position
+        head = x * self.height + y
+
+        body = self._body
+        if body and head == body[0]:
+            return
+
+        if not body or head not in self.neighbours[body[0]] or head in self._serial:
+            self._rebuildBody()
+            return
+
+        self._head_serial += 1
+        self._length = self.grid.length
+        body.appendleft(head)
+        self._serial[head] = self._head_serial
+
+        while len(body) > self._length:
+            del self._serial[body.pop()]
+
+
+    def counter(self, cell):
+        """Ticks until a cell is free of the snake, 0 if it is free now."""
+        serial = self._serial.get(cell)
+        if serial is None:
+            return 0
+        return max(0, self._length - (self._head_serial - serial))
+
+
+    def _updateApple(self):
+        """Start a new distance map when the apple moves. Returns True if it moved."""
+        apple = self.grid.apple
+        if apple is None:
+            self._apple = None
+            return False
+
+        x, y = apple
+        cell = x * self.height + y
+        if cell == self._apple:
+            return False
+
+        self._apple = cell
+        self._apple_map = DistanceMap(self.neighbours, cell) if self.walls else None
+        self._path.clear()
+        self._retry = 0
+        return True
+
+    # -------------------------------------------------------------------------------------------- #
+
+    def direction(self, cell, next_cell):
+        """Direction tuple of a step between neighbouring cells."""
+        height = self.height
+        dx = next_cell // height - cell // height
+        dy = next_cell % height - cell % height
+
+        # steps across the wrapped edge
+        #
+        if dx > 1:
+            dx = -1
+        elif dx < -1:
+            dx = 1
+        if dy > 1:
+            dy = -1
+        elif dy < -1:
+            dy = 1
+
+        return dx, dy
+
+
+    @tracing.traced(tracing.TICK, 'Autopilot.nextDirection')
+    def nextDirection(self):
+        """Direction the snake should take on the next tick."""
+        start = tracing.monotonic()
+        self._sync()
+        self._updateApple()
+
+        head = self._body[0]
+
+        # keep following the planned path, it stays valid until the apple moves
+        #
+        path = self._path
+        if path and path[0] in self.neighbours[head] and self.counter(path[0]) <= 1:
+            self.reused += 1
+            next_cell = path.popleft()
+
+        else:
+            path.clear()
+            deadline = start + self.budget
+
+            apple_path = None
+            if self._apple is not None and self._retry <= 0:
+                try:
+                    apple_path = self.findPath(head, deadline)
+                except _OverBudget:
+                    # not a failure, the distance map carries on from here next tick
+                    #
+                    pass
+                else:
+                    if apple_path and not self.reachesTail(apple_path, True, deadline):
+                        apple_path = None
+                    if apple_path is None:
+                        self._retry = RETRY_TICKS
+
+            if apple_path:
+                self.plans += 1
+                path.extend(apple_path)
+                next_cell = path.popleft()
+            else:
+                self._retry -= 1
+                self.fallbacks += 1
+                next_cell = self.fallback(head, deadline)
+
+        self.plan_times.add((tracing.monotonic() - start) * 1000.0)
+
+        if next_cell is None:
+            return self.grid.direction
+        return self.direction(head, next_cell)
+
+
+    def findPath(self, head, deadline):
+        """
+        A* from the head to the apple, guided by the steps to the apple ignoring the snake.
+
+        :return: list of cells after the head, ending at the apple, or None
+        :raises _OverBudget: if the distance map ran out of time, it carries on next call
+        """
+        # without walls the steps on the wrapping arena are exact
+        #
+        if self._apple_map is None:
+            return self.search(head, self._apple, self.wrappedDistance(self._apple),
+                               self.counter, deadline)
+
+        apple_map = self._apple_map
+        distances = apple_map.distances
+
+        def heuristic(cell):
+            distance = distances[cell]
+            return distance if distance >= 0 else apple_map.distance(cell, deadline)
+
+        if heuristic(head) < 0:
+            return None
+        return self.search(head, self._apple, heuristic, self.counter, deadline)
+
+
+    def wrappedDistance(self, goal):
+        """Heuristic function giving the steps to goal on the open, wrapping arena."""
+        width, height = self.width, self.height
+        goal_x, goal_y = divmod(goal, height)
+
+        def distance(cell):
+            x, y = divmod(cell, height)
+            dx = abs(x - goal_x)
+            dy = abs(y - goal_y)
+            return min(dx, width - dx) + min(dy, height - dy)
+
+        return distance
+
+
+    def search(self, start, goal, heuristic, counter, deadline):
+        """
+        A* over the arena. A body cell can be entered once the tail has left it, which is
+        when the path length reaches its counter.
+
+        :param int start: cell to search from
+        :param int goal: cell to reach
+        :param heuristic: function giving a lower bound of steps from a cell to the goal
+        :param counter: function giving the ticks until a cell is free
+        :param float deadline: clock time to give up at
+        :return: list of cells after start, ending at goal, or None
+        """
+        neighbours = self.neighbours
+        clock = tracing.monotonic
+
+        steps = {start: 0}
+        came_from = {}
+        heap = [(heuristic(start), 0, start)]
+        searched = 0
+
+        while heap:
+            _, g, cell = heapq.heappop(heap)
+            if cell == goal:
+                path = []
+                while cell != start:
+                    path.append(cell)
+                    cell = came_from[cell]
+                path.reverse()
+                return path
+
+            if g > steps.get(cell, g):
+                continue
+
+            searched += 1
+            if searched % _BUDGET_CHECK == 0 and clock() > deadline:
+                return None
+
+            g += 1
+            for neighbour in neighbours[cell]:
+                if g < counter(neighbour):
+                    continue
+                if g < steps.get(neighbour, g + 1):
+                    steps[neighbour] = g
+                    came_from[neighbour] = cell
+                    heapq.heappush(heap, (g + heuristic(neighbour), g, neighbour))
+
+        return None
+
+
+    def reachesTail(self, path, grow, deadline):
+        """
+        True if, after moving the snake along path, its head can still reach its tail.
+
+        :param list path: cells the head moves through
+        :param bool grow: True if the snake eats an apple at the end of the path
+        :param float deadline: clock time to give up at
+        """
+        length = self._length + (1 if grow else 0)
+        body = (list(reversed(path)) + list(self._body))[:length]
+        if len(body) < 2:
+            return True
+
+        counters = dict((cell, length - index) for index, cell in enumerate(body))
+        tail = body[-1]
+
+        found = self.search(body[0], tail, self.wrappedDistance(tail),
+                            lambda cell: counters.get(cell, 0), deadline)
+        return found is not None
+
+
+    def fallback(self, head, deadline):
+        """
+        Next cell when there is no safe path to the apple: along the Hamiltonian cycle if the
+        tail stays in reach, otherwise any neighbour that keeps the tail in reach.
+        """
+        counter = self.counter
+
+        cells = list(self.neighbours[head])
+        if self.cycle is not None:
+            cells.remove(self.cycle[head])
+            cells.insert(0, self.cycle[head])
+
+        free = [cell for cell in cells if counter(cell) <= 1]
+        for cell in free:
+            if self.reachesTail([cell], False, deadline):
+                return cell
+
+        return free[0] if free else None
@@ -0,0 +1,422 @@
+"""
+Benchmarks for the Snake render and simulation hot paths.
+
+Runs without Maya or a display, under the offscreen Qt platform:
+
+    QT_QPA_PLATFORM=offscreen python -m majic_tools.maya.apps.games.snake.benchmark -o run.json
+    python -m majic_tools.maya.apps.games.snake.benchmark -o new.json --compare run.json
+
+Each benchmark records the best and median time per call, the number of QPainter calls made
+per call and the allocations made by a single call. Results are stored as json, and two runs
+can be compared with a regression threshold.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import timeit
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import PySide2
+import PySide2.QtCore as qc
+import PySide2.QtGui as qg
+import PySide2.QtWidgets as qw
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from majic_tools.maya.apps.games.snake import snake, images, font, lcd, autopilot
+
+# ------------------------------------------------------------------------------------------------ #
+
+SEED = 1234
+
+ARENA_SIZES = [(104, 84), (208, 168), (416, 336)]
+SNAKE_LENGTHS = [10, 20]
+
+DEFAULT_THRESHOLD = 0.1
+
+# ------------------------------------------------------------------------------------------------ #
+
+class CountingPainter(object):
+    """Wraps a QPainter and counts every method called on it."""
+
+    def __init__(self, painter, device=None):
+        self._painter = painter
+        self.device = device
+        self.calls = 0
+
+
+    def __getattr__(self, name):
+        attr = getattr(self._painter, name)
+        if not callable(attr):
+            return attr
+
+        def _call(*args, **kwargs):
+            self.calls += 1
+            return attr(*args, **kwargs)
+
+        return _call
+
+
+    def close(self):
+        """End painting before the paint device is released."""
+        if self._painter.isActive():
+            self._painter.end()
+
+
+class Host(qw.QWidget):
+    """Parent widget for game widgets, holding the game data they read."""
+
+    def __init__(self, data):
+        super(Host, self).__init__()
+        self.data = data
+
+
+def arenaData(screen_width, screen_height, snake_length):
+    """Create SnakeData for a custom arena size."""
+    return type('BenchmarkData', (snake.SnakeData,),
+                {'screen_width': screen_width,
+                 'screen_height': screen_height,
+                 'width': screen_width * lcd.cellSize(snake.SnakeData),
+                 'height': screen_height * lcd.cellSize(snake.SnakeData),
+                 'snake_length': snake_length})
+
+# ------------------------------------------------------------------------------------------------ #
+
+class Benchmark(object):
+    """
+    A single timed case. setup() returns the function to time and the CountingPainter it
+    paints with, if any.
+    """
+
+    def __init__(self, name, setup, params=None, number=100):
+        self.name = name
+        self.setup = setup
+        self.params = params or {}
+        self.number = number
+
+
+    @property
+    def key(self):
+        params = ','.join('{}={}'.format(k, self.params[k]) for k in sorted(self.params))
+        return '{}[{}]'.format(self.name, params) if params else self.name
+
+
+    def run(self, repeat=5):
+        random.seed(SEED)
+        function, counter = self.setup(**self.params)
+
+        # painter calls for a single call
+        #
+        painter_calls = None
+        if counter is not None:
+            counter.calls = 0
+            function()
+            painter_calls = counter.calls
+
+        allocations, method = measureAllocations(function)
+
+        timer = timeit.Timer(function)
+        times = [t / self.number for t in timer.repeat(repeat=repeat, number=self.number)]
+        times.sort()
+
+        if counter is not None:
+            counter.close()
+
+        return {'params': self.params,
+                'number': self.number,
+                'repeat': repeat,
+                'min': times[0],
+                'median': times[len(times) // 2],
+                'painter_calls': painter_calls,
+                'allocations': allocations,
+                'allocation_method': method}
+
+
+def measureAllocations(function):
+    """
+    Count allocations made by one call. Uses tracemalloc where available, otherwise the growth
+    in gc tracked objects.
+
+    :return: (count, method name)
+    """
+    gc.collect()
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        function()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        count = sum(max(0, stat.count_diff) for stat in after.compare_to(before, 'lineno'))
+        return count, 'tracemalloc'
+
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        function()
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+
+    return max(0, after - before), 'gc_objects'
+
+# ------------------------------------------------------------------------------------------------ #
+
+def _imagePainter(width=snake.SnakeData.width, height=snake.SnakeData.height):
+    canvas = qg.QImage(width, height, qg.QImage.Format_ARGB32_Premultiplied)
+    canvas.fill(0)
+    return CountingPainter(qg.QPainter(canvas), canvas)
+
+
+def _raster():
+    return lcd.LcdRaster(snake.SnakeData.screen_width, snake.SnakeData.screen_height)
+
+
+def setupPaintPixel(pixels=1000):
+    raster = _raster()
+    positions = [(random.randint(0, 103), random.randint(0, 83)) for _ in range(pixels)]
+
+    def run():
+        for x, y in positions:
+            snake.paintPixel(raster, x, y)
+
+    return run, None
+
+
+def setupLcdDraw(pixels=1000, scale=1, device_pixel_ratio=1.0, compositor=lcd.QT):
+    data = type('BenchmarkData', (snake.SnakeData,), {'scale': scale})
+    painter = _imagePainter(int(data.screen_width * lcd.cellSize(data) * device_pixel_ratio),
+                            int(data.screen_height * lcd.cellSize(data) * device_pixel_ratio))
+
+    raster = _raster()
+    for _ in range(pixels):
+        snake.paintPixel(raster, random.randint(0, 103), random.randint(0, 83))
+
+    def run():
+        # the compositor is global, set it for this case only
+        #
+        previous = lcd.compositor
+        lcd.compositor = compositor
+        try:
+            lcd.draw(painter, raster, data, device_pixel_ratio)
+        finally:
+            lcd.compositor = previous
+
+    return run, painter
+
+
+def setupImagePaint(image='title', invert=False):
+    painter = _raster()
+    if image == 'title':
+        source = images.title
+    else:
+        source = font.main_font.getImage('High Scores')
+    paint_area = [0, 0, snake.SnakeData.screen_width, snake.SnakeData.screen_height]
+
+    def run():
+        source.paint(painter, paint_area, invert, snake.paintPixel)
+
+    return run, None
+
+
+def setupFontGetImage(font_name='main', length=10, cached=False):
+    text_font = font.main_font if font_name == 'main' else font.small_font
+    text = ''.join(random.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for _ in range(length))
+
+    def run():
+        text_font.getImage(text, cached)
+
+    return run, None
+
+
+def _grid(screen_width, screen_height, snake_length):
+    host = Host(arenaData(screen_width, screen_height, snake_length))
+    grid = snake.GameGrid(host)
+    grid.host = host
+    grid.start()
+    return grid
+
+
+def setupGridUpdate(screen_width=104, screen_height=84, snake_length=10):
+    grid = _grid(screen_width, screen_height, snake_length)
+    turns = [grid.moveDown, grid.moveRight, grid.moveUp, grid.moveRight]
+    state = {'tick': 0}
+
+    def run():
+        # turn every few ticks so the snake sweeps the arena
+        #
+        state['tick'] += 1
+        if state['tick'] % 5 == 0:
+            turns[(state['tick'] // 5) % len(turns)]()
+
+        if grid.update() is False:
+            grid.start()
+
+    return run, None
+
+
+def setupAutopilot(screen_width=104, screen_height=84, snake_length=10):
+    grid = _grid(screen_width, screen_height, snake_length)
+    pilot = autopilot.Autopilot(grid)
+
+    def run():
+        grid.queueDirection(pilot.nextDirection())
+        if grid.update() is False:
+            grid.start()
+
+    return run, None
+
+
+def setupFreeBlocks(screen_width=104, screen_height=84, snake_length=10, dimensions=(1, 1)):
+    grid = _grid(screen_width, screen_height, snake_length)
+
+    def run():
+        grid.freeBlocks(dimensions)
+
+    return run, None
+
+# ------------------------------------------------------------------------------------------------ #
+
+def benchmarks():
+    """All benchmark cases."""
+    cases = [Benchmark('paintPixel', setupPaintPixel, {'pixels': 1000}, number=20),
+             Benchmark('Image.paint', setupImagePaint, {'image': 'title', 'invert': False}, 20),
+             Benchmark('Image.paint', setupImagePaint, {'image': 'text', 'invert': True}, 20)]
+
+    compositors = [lcd.QT] + ([lcd.NUMPY] if lcd.numpy is not None else [])
+    for compositor in compositors:
+        for scale in (1, 2, 4):
+            for device_pixel_ratio in (1.0, 2.0):
+                params = {'pixels': 1000,
+                          'scale': scale,
+                          'device_pixel_ratio': device_pixel_ratio,
+                          'compositor': compositor}
+                cases.append(Benchmark('lcd.draw', setupLcdDraw, params, 20))
+
+    for font_name in ('main', 'small'):
+        for length in (3, 10, 30):
+            for cached in (False, True):
+                params = {'font_name': font_name, 'length': length, 'cached': cached}
+                cases.append(Benchmark('Font.getImage', setupFontGetImage, params, 200))
+
+    for screen_width, screen_height in ARENA_SIZES:
+        for snake_length in SNAKE_LENGTHS:
+            params = {'screen_width': screen_width,
+                      'screen_height': screen_height,
+                      'snake_length': snake_length}
+            cases.append(Benchmark('GameGrid.update', setupGridUpdate, params, 50))
+            cases.append(Benchmark('Autopilot.nextDirection', setupAutopilot, params, 50))
+
+        for dimensions in ((1, 1), (2, 1)):
+            params = {'screen_width': screen_width,
+                      'screen_height': screen_height,
+                      'snake_length': SNAKE_LENGTHS[0],
+                      'dimensions': dimensions}
+            cases.append(Benchmark('GameGrid.freeBlocks', setupFreeBlocks, params, 20))
+
+    return cases
+
+
+def run(pattern=None, repeat=5):
+    """
+    Run benchmarks and return the results as a json serializable dict.
+
+    :param str pattern: only run benchmarks whose key contains this string
+    :param int repeat: number of timing repeats per benchmark
+    """
+    app = qw.QApplication.instance() or qw.QApplication(sys.argv[:1])
+
+    results = {}
+    for case in benchmarks():
+        if pattern and pattern not in case.key:
+            continue
+        results[case.key] = case.run(repeat)
+        print '{:<80} {:>10.1f}us'.format(case.key, results[case.key]['min'] * 1e6)
+
+    return {'meta': {'created': time.time(),
+                     'python': platform.python_version(),
+                     'qt': qc.qVersion(),
+                     'pyside': PySide2.__version__,
+                     'platform': platform.platform(),
+                     'qpa': os.environ.get('QT_QPA_PLATFORM'),
+                     'seed': SEED},
+            'results': results}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two runs. A benchmark regresses if its best time grew by more than threshold, or
+    it makes more painter calls than before.
+
+    :return: (report lines, list of regressed keys)
+    """
+    lines = []
+    regressions = []
+
+    for key in sorted(current['results']):
+        new = current['results'][key]
+        old = baseline['results'].get(key)
+        if old is None:
+            lines.append('{:<80} new'.format(key))
+            continue
+
+        change = (new['min'] - old['min']) / old['min'] if old['min'] else 0.0
+
+        status = 'ok'
+        if change > threshold:
+            status = 'SLOWER'
+        elif change < -threshold:
+            status = 'faster'
+
+        if (new['painter_calls'] or 0) > (old['painter_calls'] or 0):
+            status = 'MORE CALLS'
+
+        if status in ('SLOWER', 'MORE CALLS'):
+            regressions.append(key)
+
+        lines.append('{:<80} {:>+7.1%} {}'.format(key, change, status))
+
+    return lines, regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Snake render and simulation benchmarks.')
+    parser.add_argument('-o', '--output', help='json file to write results to')
+    parser.add_argument('-c', '--compare', help='json results of a previous run to compare to')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slow down before a benchmark counts as a regression')
+    parser.add_argument('-k', '--filter', help='only run benchmarks containing this string')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    options = parser.parse_args(args)
+
+    results = run(options.filter, options.repeat)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, sort_keys=True, indent=2, separators=(',', ': '))
+
+    if options.compare:
+        with open(options.compare, 'r') as f:
+            baseline = json.load(f)
+
+        lines, regressions = compare(baseline, results, options.threshold)
+        print '\n'.join(lines)
+        if regressions:
+            print '{} regression(s) over {:.0%}'.format(len(regressions), options.threshold)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
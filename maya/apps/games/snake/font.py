@@ -1,10 +1,20 @@
+from collections import OrderedDict
+
 from majic_tools.maya.apps.games.snake.images import Image
+from majic_tools.maya.apps.games.snake import stats
 
 
 class Font(object):
+    cache_size = 256
+
     def __init__(self, data, height):
         self.height = height
 
+        # text images are never changed after creation, so they can be shared
+        #
+        self._cache = OrderedDict()
+        self.cache_stats = stats.cacheStats('font {}'.format(height))
+
         # process symbols
         #
         self._data = {}
@@ -14,7 +24,32 @@ class Font(object):
             self._data[letter] = [bin_str[i * width:(i + 1) * width] for i in range(height)]
 
 
-    def getImage(self, text):
+    def getImage(self, text, cache=True):
+        """
+        Get an image of the given text.
+
+        :param str text: text to draw
+        :param bool cache: if False, always build a new image and don't store it. For text that
+                           changes every time, like stats, so it doesn't push out other text.
+        """
+        if not cache:
+            return self._createImage(text)
+
+        image = self._cache.get(text)
+        if image is not None:
+            self.cache_stats.hit()
+            return image
+
+        self.cache_stats.miss()
+
+        image = self._cache[text] = self._createImage(text)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return image
+
+
+    def _createImage(self, text):
         # compose new gris from text
         #
         grid = ['' for _ in range(self.height)]
@@ -1,6 +1,11 @@
+from collections import OrderedDict
+
 import PySide2.QtCore as qc
+import PySide2.QtGui as qg
 import PySide2.QtWidgets as qw
 
+from majic_tools.maya.apps.games.snake import tracing, stats
+
 # ------------------------------------------------------------------------------------------------ #
 
 class GameData(dict):
@@ -12,6 +17,176 @@ class GameData(dict):
 
     background_color = (100, 100, 100)
 
+    # maximum number of paint flushes per second
+    #
+    frame_cap = 60
+    scheduler = None
+
+    # opt-in frame tracing, see tracing.Tracer.enable
+    #
+    tracer = tracing.tracer
+
+# ------------------------------------------------------------------------------------------------ #
+
+class FrameScheduler(qc.QObject):
+    """
+    Collects paint requests from game widgets and flushes them once per frame. Any number of
+    requests made for the same widget between two frames results in a single repaint.
+    """
+
+    def __init__(self, frame_cap=60, parent=None):
+        super(FrameScheduler, self).__init__(parent)
+
+        self._dirty = OrderedDict()
+
+        self._timer = qc.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+        self._clock = qc.QElapsedTimer()
+        self._clock.start()
+        self._last_flush = None
+
+        self.frame_interval = 0
+        self.setFrameCap(frame_cap)
+
+        # statistics
+        #
+        self.requested = 0
+        self.painted = 0
+        self.frames = 0
+        self.frame_times = stats.RollingWindow()
+
+        # requests dropped without a repaint, for hidden, deleted or discarded widgets
+        #
+        self.skipped = 0
+
+
+    def setFrameCap(self, frame_cap):
+        """Set the maximum number of frames flushed per second. 0 or None removes the cap."""
+        self.frame_cap = frame_cap
+        self.frame_interval = int(1000.0 / frame_cap) if frame_cap else 0
+
+
+    def markDirty(self, widget, rect=None):
+        """
+        Mark a widget, or a rectangle inside it, as needing a repaint on the next frame.
+
+        :param QWidget widget: widget to repaint
+        :param rect: optional x, y, width, height in widget coordinates. If None the whole
+                     widget is repainted.
+        """
+        self.requested += 1
+
+        key = id(widget)
+        if key in self._dirty:
+            _, region = self._dirty[key]
+
+            # whole widget already dirty, nothing to add
+            #
+            if region is None:
+                return
+
+            if rect is None:
+                self._dirty[key] = (widget, None)
+            else:
+                self._dirty[key] = (widget, region.united(qg.QRegion(*rect)))
+            return
+
+        region = None if rect is None else qg.QRegion(*rect)
+        self._dirty[key] = (widget, region)
+
+        self._schedule()
+
+
+    def _schedule(self):
+        """Start the flush timer so the next frame respects the frame cap."""
+        if self._timer.isActive():
+            return
+
+        delay = 0
+        if self._last_flush is not None:
+            elapsed = self._clock.elapsed() - self._last_flush
+            delay = max(0, self.frame_interval - elapsed)
+
+        self._timer.start(delay)
+
+
+    @tracing.traced(tracing.PAINT, 'FrameScheduler.flush')
+    def flush(self):
+        """Repaint every dirty widget once."""
+        self._timer.stop()
+
+        dirty = self._dirty
+        self._dirty = OrderedDict()
+
+        self._last_flush = self._clock.elapsed()
+        if not dirty:
+            return
+
+        self.frames += 1
+
+        with stats.Timer(self.frame_times):
+            for widget, region in dirty.values():
+                # widget might have been deleted since it was marked
+                #
+                try:
+                    if not widget.isVisible():
+                        self.skipped += 1
+                        continue
+
+                    if region is None:
+                        widget.repaint()
+                    else:
+                        widget.repaint(region)
+                except RuntimeError:
+                    self.skipped += 1
+                    continue
+
+                self.painted += 1
+
+
+    def discard(self, widget):
+        """Remove any pending paint request for the given widget."""
+        if self._dirty.pop(id(widget), None) is not None:
+            self.skipped += 1
+
+
+    @property
+    def saved(self):
+        """Number of repaints avoided by coalescing requests."""
+        return self.requested - self.painted - self.skipped - len(self._dirty)
+
+
+    def stats(self):
+        return {'requested': self.requested,
+                'painted': self.painted,
+                'saved': self.saved,
+                'skipped': self.skipped,
+                'frames': self.frames,
+                'pending': len(self._dirty)}
+
+
+    def resetStats(self):
+        self.requested = 0
+        self.painted = 0
+        self.skipped = 0
+        self.frames = 0
+        self.frame_times.clear()
+
+
+def markDirty(widget, rect=None):
+    """
+    Request a repaint of the given widget through the game scheduler. Falls back to a direct
+    repaint if no game has created a scheduler yet.
+    """
+    scheduler = GameData.scheduler
+    if scheduler is None:
+        widget.repaint()
+        return
+
+    scheduler.markDirty(widget, rect)
+
 # ------------------------------------------------------------------------------------------------ #
 
 class Game(qw.QDialog):
@@ -34,6 +209,11 @@ class Game(qw.QDialog):
         self.setFixedWidth(self.data.width)
         self.setFixedHeight(self.data.height)
 
+        # create shared frame scheduler, all level widgets paint through it
+        #
+        self.scheduler = FrameScheduler(self.data.frame_cap, self)
+        GameData.scheduler = self.scheduler
+
         self.widget_stack = qw.QStackedWidget()
         self.layout().addWidget(self.widget_stack)
 
@@ -84,6 +264,7 @@ class Game(qw.QDialog):
         return len(src_level.connections) - 1
 
 
+    @tracing.traced(tracing.LEVEL)
     def _switch(self, current_level_id, signal_id):
         """Switch to another level based on predefined connections."""
         # end current level
@@ -106,8 +287,11 @@ class Game(qw.QDialog):
 
         # switch levels
         #
-        current_level.end()
-        next_level.start()
+        tracer = self.data.tracer
+        with tracer.span('{}.end'.format(type(current_level).__name__), tracing.LEVEL):
+            current_level.end()
+        with tracer.span('{}.start'.format(type(next_level).__name__), tracing.LEVEL):
+            next_level.start()
 
 
     def keyPressEvent(self, event):
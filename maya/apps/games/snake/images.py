@@ -42,7 +42,7 @@ class Image(object):
         """
         Paint the given image as pixels. Image defines lines of pixels that create an image.
 
-        :param QPainter painter: the painter object for the widget
+        :param painter: painter or raster passed on to paint_callback
         :param paint_area: x, y, width, height of paintable area
         :param invert: if True, switch which pixels to draw
         :param paint_callback: function to draw/paint the pixel
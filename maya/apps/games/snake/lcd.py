@@ -0,0 +1,377 @@
+"""
+LCD rendering. Widgets paint pixels into a logical screen_width x screen_height raster, which
+is drawn to the widget in one go: the raster is scaled up with nearest neighbour sampling and
+masks a cached layer of lit LCD cells, each pixel with its drop shadow.
+
+The cell layer is built once per device cell size, so a large or HiDPI window costs the same
+number of painter calls per frame as the default size.
+
+If NumPy is available, frames are composed as arrays instead, see NumpyLcdLook.
+
+Content that rarely changes, such as the arena border or the score, is painted through a
+Layer, which keeps the composed image until the layer's key changes.
+"""
+from contextlib import contextmanager
+
+import PySide2.QtCore as qc
+import PySide2.QtGui as qg
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from majic_tools.maya.apps.games.snake import stats
+
+# ------------------------------------------------------------------------------------------------ #
+
+QT = 'qt'
+NUMPY = 'numpy'
+
+# ------------------------------------------------------------------------------------------------ #
+
+class PaintStats(object):
+    """
+    Running count of painter calls, read by the performance hud. A frame composed by NumPy
+    counts as one call, as it stands in for the painter calls of the Qt compositor.
+    """
+    painter_calls = 0
+
+
+class LcdRaster(object):
+    """One frame of logical pixels. A pixel is lit if its byte is non zero."""
+
+    __slots__ = ('width', 'height', 'pixels')
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height)
+
+
+    def setPixel(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y * self.width + x] = 1
+
+
+    def clear(self):
+        self.pixels[:] = bytearray(len(self.pixels))
+
+
+    def rows(self):
+        """First and last row holding a lit pixel, or None if no pixel is lit."""
+        pixels = self.pixels
+        remaining = len(pixels.lstrip(b'\x00'))
+        if not remaining:
+            return None
+
+        first = (len(pixels) - remaining) // self.width
+        last = (len(pixels.rstrip(b'\x00')) - 1) // self.width
+        return first, last
+
+# ------------------------------------------------------------------------------------------------ #
+
+class LcdLook(object):
+    """
+    Appearance of lit pixels at one device cell size. A cell is pixel_width + pixel_spacing
+    logical units wide, the pixel is drawn with its outline, one unit bigger than
+    pixel_width, and the shadow is the same square offset by one unit.
+    """
+
+    def __init__(self, data, device_cell):
+        self.data = data
+        self.device_cell = device_cell
+
+        self.tile = self._createTile()
+        self._layers = {}
+
+
+    def _createTile(self):
+        data = self.data
+        unit = float(self.device_cell) / (data.pixel_width + data.pixel_spacing)
+        size = int(round((data.pixel_width + 1) * unit))
+        offset = max(1, int(round(unit)))
+
+        tile = qg.QImage(self.device_cell, self.device_cell, qg.QImage.Format_ARGB32_Premultiplied)
+        tile.fill(0)
+
+        painter = qg.QPainter(tile)
+        painter.fillRect(0, 0, size, size, qg.QColor(*data.pixel_color))
+        painter.fillRect(offset, offset, size, size, qg.QColor(*data.shadow_color))
+        painter.end()
+
+        return tile
+
+
+    def layer(self, width, height):
+        """Lit cells covering width x height logical pixels. Cached per size."""
+        key = (width, height)
+        layer = self._layers.get(key)
+        if layer is not None:
+            return layer
+
+        layer = qg.QImage(width * self.device_cell, height * self.device_cell,
+                          qg.QImage.Format_ARGB32_Premultiplied)
+        layer.fill(0)
+
+        painter = qg.QPainter(layer)
+        painter.fillRect(layer.rect(), qg.QBrush(self.tile))
+        painter.end()
+
+        self._layers[key] = layer
+        return layer
+
+
+    def compose(self, raster):
+        """
+        Build the device image of a raster. Only rows between the first and last lit pixel
+        are composed.
+
+        :return: (QImage, first row) or (None, 0) if nothing is lit
+        """
+        rows = raster.rows()
+        if rows is None:
+            return None, 0
+
+        first, last = rows
+        width = raster.width
+        height = last - first + 1
+
+        # 1 byte per pixel mask, lit pixels opaque
+        #
+        mask_data = bytes(raster.pixels[first * width:(last + 1) * width])
+        mask = qg.QImage(mask_data, width, height, width, qg.QImage.Format_Indexed8)
+        mask.setColorTable([0, 0xffffffff])
+        mask = mask.convertToFormat(qg.QImage.Format_ARGB32_Premultiplied)
+
+        image = mask.scaled(width * self.device_cell, height * self.device_cell,
+                            qc.Qt.IgnoreAspectRatio, qc.Qt.FastTransformation)
+
+        # keep lit cells where the mask is opaque
+        #
+        painter = qg.QPainter(image)
+        painter.setCompositionMode(qg.QPainter.CompositionMode_SourceIn)
+        painter.drawImage(0, 0, self.layer(raster.width, raster.height))
+        painter.end()
+
+        PaintStats.painter_calls += 2
+        return image, first
+
+
+class NumpyLcdLook(LcdLook):
+    """
+    Composes frames with NumPy. The lit pixels are scaled up to a device mask, the shadow is
+    the mask shifted by one unit, and the two are blended through a 4 colour palette into a
+    premultiplied ARGB array that the QImage wraps without a copy.
+    """
+
+    def __init__(self, data, device_cell):
+        super(NumpyLcdLook, self).__init__(data, device_cell)
+
+        unit = float(self.device_cell) / (data.pixel_width + data.pixel_spacing)
+        size = int(round((data.pixel_width + 1) * unit))
+
+        self.offset = max(1, int(round(unit)))
+        self.cell = numpy.zeros((device_cell, device_cell), numpy.uint8)
+        self.cell[:size, :size] = 1
+
+        self.palette = self._createPalette()
+
+        # the last frame, kept alive while its QImage is being drawn
+        #
+        self._frame = None
+
+
+    def _createPalette(self):
+        """
+        Premultiplied ARGB colours for no pixel, pixel, shadow and shadow over pixel, indexed
+        by pixel + 2 * shadow.
+        """
+        main = self.data.pixel_color[:3]
+        shadow = self.data.shadow_color[:3]
+        alpha = self.data.shadow_color[3] / 255.0 if len(self.data.shadow_color) > 3 else 1.0
+
+        def argb(color, a=1.0):
+            value = int(round(a * 255)) << 24
+            for shift, channel in zip((16, 8, 0), color):
+                value |= int(round(channel * a)) << shift
+            return value
+
+        blend = [s * alpha + m * (1.0 - alpha) for s, m in zip(shadow, main)]
+
+        return numpy.array([0, argb(main), argb(shadow, alpha), argb(blend)], numpy.uint32)
+
+
+    def compose(self, raster):
+        rows = raster.rows()
+        if rows is None:
+            return None, 0
+
+        first, last = rows
+        width = raster.width
+        height = last - first + 1
+        cell = self.device_cell
+
+        lit = numpy.frombuffer(raster.pixels, numpy.uint8)[first * width:(last + 1) * width]
+        lit = lit.reshape(height, width).astype(bool).view(numpy.uint8)
+
+        # every lit pixel becomes a cell sized square, the shadow is the same squares shifted
+        #
+        pixels = (lit[:, None, :, None] & self.cell[None, :, None, :])
+        pixels = pixels.reshape(height * cell, width * cell)
+
+        offset = self.offset
+        index = pixels.copy()
+        index[offset:, offset:] += pixels[:-offset, :-offset] << 1
+
+        frame = self._frame = self.palette.take(index)
+
+        image = qg.QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0],
+                          qg.QImage.Format_ARGB32_Premultiplied)
+
+        PaintStats.painter_calls += 1
+        return image, first
+
+
+_COMPOSITORS = {QT: LcdLook,
+                NUMPY: NumpyLcdLook}
+
+# frame compositor, QT or NUMPY
+#
+compositor = NUMPY if numpy is not None else QT
+
+_looks = {}
+_look_stats = stats.cacheStats('lcd look')
+
+
+def look(data, device_cell):
+    """Get the cached look for a device cell size, for the current compositor."""
+    key = (compositor, device_cell, data.pixel_width, data.pixel_spacing, data.pixel_color,
+           data.shadow_color)
+    lcd_look = _looks.get(key)
+    if lcd_look is None:
+        _look_stats.miss()
+        lcd_look = _looks[key] = _COMPOSITORS[compositor](data, device_cell)
+    else:
+        _look_stats.hit()
+    return lcd_look
+
+
+def cellSize(data):
+    """Logical size of a pixel cell."""
+    return (data.pixel_width + data.pixel_spacing) * data.scale
+
+
+def deviceCellSize(data, device_pixel_ratio):
+    """
+    Size of a pixel cell in whole device pixels. Frames are composed at this size, then
+    mapped back so they keep their logical size.
+    """
+    return max(1, int(round(cellSize(data) * device_pixel_ratio)))
+
+
+def _blit(painter, image, first_row, data, device_cell):
+    cell = cellSize(data)
+
+    image.setDevicePixelRatio(float(device_cell) / cell)
+    painter.drawImage(qc.QPointF(0, first_row * cell), image)
+
+    PaintStats.painter_calls += 1
+
+
+def draw(painter, raster, data, device_pixel_ratio=1.0):
+    """
+    Draw a raster with an open QPainter.
+
+    :param QPainter painter: painter of the target widget or image
+    :param LcdRaster raster: logical pixels to draw
+    :param data: game data holding the pixel look and scale
+    :param float device_pixel_ratio: device pixels per logical pixel of the target
+    """
+    device_cell = deviceCellSize(data, device_pixel_ratio)
+    image, first_row = look(data, device_cell).compose(raster)
+    if image is not None:
+        _blit(painter, image, first_row, data, device_cell)
+
+
+_layer_stats = stats.cacheStats('lcd layer')
+
+
+class Layer(object):
+    """
+    A raster whose composed image is kept between paints. The raster is only painted and
+    composed again when the key passed to paint changes, or the device cell size does, when
+    the window is scaled or moved to a screen with another pixel ratio.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.device_cell = None
+
+        self._image = None
+        self._first_row = 0
+
+
+    def invalidate(self):
+        self.key = None
+        self._image = None
+
+
+    def draw(self, painter, data, device_pixel_ratio, key, paint_function):
+        """
+        Draw the layer with an open QPainter.
+
+        :param QPainter painter: painter of the target widget or image
+        :param data: game data holding the screen size, pixel look and scale
+        :param float device_pixel_ratio: device pixels per logical pixel of the target
+        :param key: any comparable value describing the content. The layer is rebuilt when
+                    it changes
+        :param paint_function: function taking an LcdRaster to paint the layer on
+        """
+        device_cell = deviceCellSize(data, device_pixel_ratio)
+        key = (key, data.screen_width, data.screen_height)
+
+        if key != self.key or device_cell != self.device_cell:
+            _layer_stats.miss()
+
+            raster = LcdRaster(data.screen_width, data.screen_height)
+            paint_function(raster)
+
+            # copy, the numpy compositor reuses its buffer for the next frame
+            #
+            image, self._first_row = look(data, device_cell).compose(raster)
+            self._image = image.copy() if image is not None else None
+
+            self.key = key
+            self.device_cell = device_cell
+        else:
+            _layer_stats.hit()
+
+        if self._image is not None:
+            _blit(painter, self._image, self._first_row, data, device_cell)
+
+
+    def paint(self, widget, key, paint_function):
+        """Paint the layer to a widget from its paintEvent. See draw."""
+        painter = qg.QPainter(widget)
+        self.draw(painter, widget.data, widget.devicePixelRatioF(), key, paint_function)
+        painter.end()
+
+
+@contextmanager
+def paint(widget):
+    """
+    Paint a widget as LCD pixels. Yields a raster to set pixels on, which is drawn to the
+    widget once the block ends.
+
+        with lcd.paint(self) as painter:
+            paintPixel(painter, x, y)
+    """
+    data = widget.data
+    raster = LcdRaster(data.screen_width, data.screen_height)
+
+    yield raster
+
+    painter = qg.QPainter(widget)
+    draw(painter, raster, data, widget.devicePixelRatioF())
+    painter.end()
@@ -0,0 +1,161 @@
+"""
+Maze levels. Walls are kept as a bitboard, a Python int with one bit per arena cell, using the
+same flat index as the autopilot, x * height + y. Testing a cell is a shift and a mask.
+
+Mazes are stored one per line in a text file:
+
+    # name width height rows
+    Box 24 17 1ffffff-1800001-...
+
+rows are hex numbers, one per arena row from the top, with a leading 1 bit followed by width
+bits, the same format as images.Image. The file is only read when a maze is first needed, and
+each maze is only decoded when it is first asked for.
+"""
+import os
+
+# ------------------------------------------------------------------------------------------------ #
+
+DEFAULT_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mazes.txt')
+
+# ------------------------------------------------------------------------------------------------ #
+
+class Maze(object):
+    def __init__(self, name, width, height, walls=0):
+        """
+        :param str name: maze name, shown in the mode menu
+        :param int width: arena width in cells
+        :param int height: arena height in cells
+        :param int walls: wall bitboard
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.walls = walls
+
+
+    @classmethod
+    def fromRows(cls, name, rows):
+        """
+        Create a maze from rows of text, a # for every wall:
+
+            Maze.fromRows('Box', ['####',
+                                  '#..#',
+                                  '####'])
+        """
+        width, height = len(rows[0]), len(rows)
+
+        walls = 0
+        for y, row in enumerate(rows):
+            for x, char in enumerate(row):
+                if char == '#':
+                    walls |= 1 << (x * height + y)
+
+        return cls(name, width, height, walls)
+
+
+    @classmethod
+    def decode(cls, name, width, height, rows_str):
+        """Create a maze from its hex rows string."""
+        walls = 0
+        for y, row in enumerate(rows_str.split('-')):
+            bits = int(row, 16)
+            for x in range(width):
+                if bits >> (width - 1 - x) & 1:
+                    walls |= 1 << (x * height + y)
+
+        return cls(name, width, height, walls)
+
+
+    def encode(self):
+        """Hex rows string of the maze, as stored in the maze file."""
+        rows = []
+        for y in range(self.height):
+            bits = 1
+            for x in range(self.width):
+                bits = (bits << 1) | self.isWall(x, y)
+            rows.append('{:x}'.format(bits))
+        return '-'.join(rows)
+
+
+    def isWall(self, x, y):
+        return self.walls >> (x * self.height + y) & 1
+
+
+    def cells(self):
+        """(x, y) of every wall."""
+        walls = self.walls
+        height = self.height
+
+        cells = []
+        while walls:
+            low_bit = walls & -walls
+            index = low_bit.bit_length() - 1
+            cells.append(divmod(index, height))
+            walls ^= low_bit
+
+        return cells
+
+
+    def fits(self, width, height):
+        return self.width == width and self.height == height
+
+
+class MazeLibrary(object):
+    """Mazes of a maze file, read on first use."""
+
+    def __init__(self, filepath=DEFAULT_FILEPATH):
+        self.filepath = filepath
+
+        self._entries = None
+        self._mazes = {}
+
+
+    def _read(self):
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = []
+        if not os.path.isfile(self.filepath):
+            return self._entries
+
+        with open(self.filepath, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+
+                name, width, height, rows_str = line.split()
+                self._entries.append((name, int(width), int(height), rows_str))
+
+        return self._entries
+
+
+    def names(self):
+        return [entry[0] for entry in self._read()]
+
+
+    def get(self, name):
+        """Get a maze by name, decoding it on first use. Returns None for unknown names."""
+        maze = self._mazes.get(name)
+        if maze is not None:
+            return maze
+
+        for entry_name, width, height, rows_str in self._read():
+            if entry_name == name:
+                maze = self._mazes[name] = Maze.decode(name, width, height, rows_str)
+                return maze
+
+        return None
+
+
+    def save(self, mazes):
+        """Write mazes to the maze file, replacing its contents."""
+        lines = ['# name width height rows']
+        for maze in mazes:
+            lines.append('{} {} {} {}'.format(maze.name, maze.width, maze.height, maze.encode()))
+
+        with open(self.filepath, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        self._entries = None
+        self._mazes = {}
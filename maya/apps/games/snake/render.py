@@ -0,0 +1,242 @@
+"""
+Headless frame rendering. Renders any level of the game into a QImage, or a NumPy array,
+without showing a window, so it runs under the offscreen Qt platform on a CI box:
+
+    QT_QPA_PLATFORM=offscreen mayapy -c "..."
+
+    renderer = OffscreenRenderer()
+    arena = renderer.level(snake.Arena)
+    renderer.start(arena)
+    frames = renderer.renderFrames(arena, 120, fps=60)
+    renderer.export(frames, 'C:/temp/replay')
+
+Level timers are driven from a virtual clock rather than the event loop, so a sequence of
+frames is the same on every run and can be rendered as fast as the machine allows.
+"""
+import os
+import sys
+import random
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import PySide2.QtCore as qc
+import PySide2.QtGui as qg
+import PySide2.QtWidgets as qw
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from majic_tools.maya.apps.games.snake import snake, tracing
+
+# ------------------------------------------------------------------------------------------------ #
+
+class VirtualClock(object):
+    """Fires the active QTimers of a level from simulated time instead of the event loop."""
+
+    def __init__(self, level):
+        self.level = level
+        self.time = 0
+
+        self._next = {}
+
+
+    def timers(self):
+        """Timers owned by the level, as attributes or children."""
+        timers = dict((id(timer), timer) for timer in self.level.findChildren(qc.QTimer))
+        for widget in [self.level] + self.level.findChildren(qw.QWidget):
+            for value in getattr(widget, '__dict__', {}).values():
+                if isinstance(value, qc.QTimer):
+                    timers[id(value)] = value
+        return list(timers.values())
+
+
+    def advance(self, milliseconds):
+        """Move time forward, firing every timer that would have timed out on the way."""
+        end = self.time + milliseconds
+
+        while True:
+            # find the next timer to fire. Timers are checked again after each fire, as
+            # callbacks start and stop timers
+            #
+            next_timer = None
+            next_time = end
+            for timer in self.timers():
+                key = id(timer)
+                if not timer.isActive():
+                    self._next.pop(key, None)
+                    continue
+
+                fire_time = self._next.setdefault(key, self.time + timer.interval())
+                if fire_time <= next_time:
+                    next_timer, next_time = timer, fire_time
+
+            if next_timer is None:
+                break
+
+            self.time = next_time
+            self._next[id(next_timer)] = next_time + max(next_timer.interval(), 1)
+            if next_timer.isSingleShot():
+                next_timer.stop()
+
+            next_timer.timeout.emit()
+
+        self.time = end
+
+
+class OffscreenRenderer(object):
+    """Renders game levels into images without showing the game window."""
+
+    def __init__(self, game=None, seed=None):
+        """
+        :param game: game to render. A new Snake game is created if None
+        :param int seed: seed for the random module, so apples land in the same place each run
+        """
+        self.app = qw.QApplication.instance() or qw.QApplication(sys.argv[:1])
+
+        if seed is not None:
+            random.seed(seed)
+
+        self.game = game or snake.Snake()
+        self.data = self.game.data
+
+        # the window is never shown, so levels never get laid out. Size them by hand
+        #
+        self.size = qc.QSize(self.data.width, self.data.height)
+        self.game.widget_stack.resize(self.size)
+        for level in self.game._levels.values():
+            level.resize(self.size)
+
+        self._clocks = {}
+
+
+    def level(self, level_class):
+        """Get the first level of the given class."""
+        for level_id in sorted(self.game._levels):
+            level = self.game._levels[level_id]
+            if type(level) is level_class:
+                return level
+        raise ValueError('No level of type {}'.format(level_class.__name__))
+
+
+    def clock(self, level):
+        clock = self._clocks.get(id(level))
+        if clock is None:
+            clock = self._clocks[id(level)] = VirtualClock(level)
+        return clock
+
+
+    def start(self, level):
+        """Make the level current and start it, as switching to it in game would."""
+        self.game.widget_stack.setCurrentWidget(level)
+        level.start()
+
+
+    def press(self, level, key):
+        """Send a key press to a level."""
+        event = qg.QKeyEvent(qc.QEvent.KeyPress, key, qc.Qt.NoModifier)
+        level.keyPressEvent(event)
+
+
+    @tracing.traced(tracing.PAINT, 'OffscreenRenderer.render')
+    def render(self, level, image=None):
+        """
+        Render a level into a QImage.
+
+        :param level: level to render
+        :param QImage image: image to render into, reused to save allocating one per frame
+        :return: QImage
+        """
+        if image is None:
+            image = qg.QImage(self.size, qg.QImage.Format_ARGB32_Premultiplied)
+
+        image.fill(qg.QColor(*self.data.background_color))
+        level.render(image, qc.QPoint(), qg.QRegion(), qw.QWidget.DrawChildren)
+
+        return image
+
+
+    def renderFrames(self, level, count, fps=60, keys=None):
+        """
+        Render a sequence of frames, advancing level timers by 1/fps seconds between frames.
+
+        :param level: level to render
+        :param int count: number of frames
+        :param float fps: simulated frames per second
+        :param dict keys: {frame index: Qt key} presses sent before rendering that frame
+        :return: list of QImage
+        """
+        clock = self.clock(level)
+        frame_time = 1000.0 / fps
+
+        frames = []
+        for index in range(count):
+            if keys and index in keys:
+                self.press(level, keys[index])
+
+            if index:
+                clock.advance(frame_time)
+
+            frames.append(self.render(level))
+
+        return frames
+
+
+    def throughput(self, level, count=100, fps=60):
+        """Frames rendered per second of real time."""
+        start = tracing.monotonic()
+        self.renderFrames(level, count, fps)
+        return count / max(tracing.monotonic() - start, 1e-9)
+
+
+    @staticmethod
+    def export(frames, directory, prefix='frame', extension='png'):
+        """Save frames as a numbered image sequence. Returns the file paths."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        filepaths = []
+        for index, frame in enumerate(frames):
+            filepath = os.path.join(directory, '{}.{:05d}.{}'.format(prefix, index, extension))
+            frame.save(filepath)
+            filepaths.append(filepath)
+
+        return filepaths
+
+# ------------------------------------------------------------------------------------------------ #
+
+def toArray(image):
+    """
+    Copy a QImage into a height x width x 4 RGBA uint8 NumPy array.
+
+    :raises ImportError: if NumPy isn't available
+    """
+    if numpy is None:
+        raise ImportError('NumPy is required to convert frames to arrays.')
+
+    image = image.convertToFormat(qg.QImage.Format_RGBA8888)
+    width, height = image.width(), image.height()
+
+    pixels = numpy.frombuffer(image.constBits(), numpy.uint8, count=image.byteCount())
+    rows = pixels.reshape(height, image.bytesPerLine())
+
+    return rows[:, :width * 4].reshape(height, width, 4).copy()
+
+
+def difference(image_a, image_b):
+    """
+    Number of pixels that differ between two frames, for golden image tests.
+
+    :param image_a: QImage or array
+    :param image_b: QImage or array
+    """
+    if isinstance(image_a, qg.QImage):
+        image_a = toArray(image_a)
+    if isinstance(image_b, qg.QImage):
+        image_b = toArray(image_b)
+
+    if image_a.shape != image_b.shape:
+        raise ValueError('Frames differ in size, {} and {}'.format(image_a.shape, image_b.shape))
+
+    return int(numpy.count_nonzero((image_a != image_b).any(axis=-1)))
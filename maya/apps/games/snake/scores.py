@@ -0,0 +1,783 @@
+import os
+import json
+import time
+import shutil
+import uuid
+import atexit
+import sqlite3
+import threading
+
+from majic_tools.maya.apps.games.snake import tracing
+
+# ------------------------------------------------------------------------------------------------ #
+
+SCORE_FILE_ENV = 'SNAKE_SCORE_FILE'
+SCORE_FILE_NAME = 'snake_high_scores.json'
+
+BACKUP_EXT = '.bak'
+TEMP_EXT = '.tmp'
+
+
+def defaultScorePath():
+    """Score file location. Uses $SNAKE_SCORE_FILE if set, otherwise the user home folder."""
+    filepath = os.environ.get(SCORE_FILE_ENV)
+    if filepath:
+        return filepath
+
+    return os.path.join(os.path.expanduser('~'), SCORE_FILE_NAME)
+
+
+def dumpScores(scores):
+    """Serialize scores in the high score file format."""
+    return json.dumps(scores, sort_keys=True, indent=2, separators=(',', ': '))
+
+
+def _replace(src, dst):
+    """Rename src over dst. os.rename can't overwrite on Windows, so remove dst first there."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def atomicWrite(filepath, text):
+    """
+    Write text to a temp file, sync it to disk and rename it over the target. The previous
+    file is kept as a backup so a crash between renames still leaves a good copy.
+
+    :param str filepath: file to write
+    :param str text: file contents
+    """
+    directory = os.path.dirname(filepath)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    temp_filepath = filepath + TEMP_EXT
+    with open(temp_filepath, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if os.path.exists(filepath):
+        _backup(filepath)
+
+    _replace(temp_filepath, filepath)
+
+
+def _backup(filepath):
+    """
+    Keep the current file as a backup. On posix the file is hard linked so it never
+    disappears, as rename replaces it atomically. Windows has to move it out of the way.
+    """
+    backup_filepath = filepath + BACKUP_EXT
+    if os.name == 'nt' or not hasattr(os, 'link'):
+        _replace(filepath, backup_filepath)
+        return
+
+    if os.path.exists(backup_filepath):
+        os.remove(backup_filepath)
+
+    try:
+        os.link(filepath, backup_filepath)
+    except OSError:
+        shutil.copy2(filepath, backup_filepath)
+
+# ------------------------------------------------------------------------------------------------ #
+
+class ScoreFile(object):
+    """
+    Write-behind high score file. Saves are queued to a background thread and bursts are
+    coalesced, so only the latest scores get written. Loads also happen off the calling thread.
+    """
+
+    def __init__(self, filepath=None, delay=0.25):
+        """
+        :param str filepath: path of the json file. Defaults to defaultScorePath()
+        :param float delay: seconds to wait for more saves before writing
+        """
+        self.filepath = filepath or defaultScorePath()
+        self.delay = delay
+
+        self._lock = threading.Condition()
+        self._pending = None
+        self._last_save = 0.0
+        self._writing = False
+        self._closed = False
+        self._hurry = False
+        self._thread = None
+
+        # incremented on every save. A load started before a save must not overwrite it
+        #
+        self.revision = 0
+
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = []
+
+        atexit.register(self.close)
+
+
+    def save(self, scores):
+        """Queue scores to be written. Returns immediately."""
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+
+            # copy so later changes to the list don't leak into the write
+            #
+            self._pending = [tuple(score) for score in scores]
+            self._last_save = time.time()
+            self.revision += 1
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writeLoop, name='SnakeScoreWriter')
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._lock.notify()
+
+
+    def _writeLoop(self):
+        while True:
+            with self._lock:
+                while self._pending is None and not self._closed:
+                    self._lock.wait()
+
+                if self._pending is None:
+                    return
+
+            # give a burst of saves time to settle
+            #
+            with self._lock:
+                while not (self._closed or self._hurry):
+                    remaining = self._last_save + self.delay - time.time()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+
+                self._hurry = False
+                scores = self._pending
+                self._pending = None
+                self._writing = True
+
+            try:
+                with tracing.tracer.span('ScoreFile.write', tracing.IO):
+                    atomicWrite(self.filepath, dumpScores(scores))
+                self.writes += 1
+            except (IOError, OSError) as e:
+                self.errors.append(e)
+                print "Snake II: Failed to save High Scores. {}".format(e)
+
+            with self._lock:
+                self._writing = False
+                self._lock.notify_all()
+
+
+    def flush(self, timeout=None):
+        """Block until queued scores are written. Returns False if the timeout was reached."""
+        with self._lock:
+            if self._pending is not None:
+                self._hurry = True
+                self._lock.notify_all()
+
+            deadline = None if timeout is None else time.time() + timeout
+            while self._pending is not None or self._writing:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+
+                # wakeups come for every write, not just the last, so wait out what is left
+                #
+                if deadline is None:
+                    self._lock.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+
+        return True
+
+
+    def close(self):
+        """Write anything still queued and stop the writer thread."""
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+
+
+    @tracing.traced(tracing.IO, 'ScoreFile.read')
+    def read(self):
+        """
+        Read scores from disk, falling back to the backup if the main file is missing or
+        corrupt. Blocks the calling thread.
+
+        :return: list of (name, score) or None if no good copy was found
+        """
+        for filepath in (self.filepath, self.filepath + BACKUP_EXT):
+            if not os.path.exists(filepath):
+                continue
+
+            try:
+                with open(filepath, 'r') as f:
+                    scores = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                print "Snake II: Failed to read {}. {}".format(filepath, e)
+                continue
+
+            return [tuple(score) for score in scores]
+
+        return None
+
+
+    def load(self, callback):
+        """
+        Read scores on a background thread. callback(scores) is called from that thread with
+        the loaded list, unless scores were saved while loading or nothing could be read.
+
+        :param callback: function taking the loaded list of scores
+        :return: the loading thread
+        """
+        revision = self.revision
+
+        def _load():
+            scores = self.read()
+            if scores is None:
+                print "Snake II: Failed to load High Scores."
+                return
+
+            if revision != self.revision:
+                return
+
+            callback(scores)
+
+        thread = threading.Thread(target=_load, name='SnakeScoreReader')
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+# ------------------------------------------------------------------------------------------------ #
+
+LEADERBOARD_ENV = 'SNAKE_LEADERBOARD_FILE'
+LEADERBOARD_NAME = 'snake_leaderboard.db'
+
+LEADERBOARD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                   speed TEXT NOT NULL,
+                                   name TEXT NOT NULL,
+                                   score INTEGER NOT NULL,
+                                   created REAL NOT NULL,
+                                   uid TEXT);
+CREATE INDEX IF NOT EXISTS scores_speed_score ON scores (speed, score DESC, id);
+CREATE INDEX IF NOT EXISTS scores_speed_name ON scores (speed, name, score DESC);
+"""
+
+# boards created before scores had a uid need the column adding before it is indexed
+#
+LEADERBOARD_UID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS scores_uid ON scores (uid);"
+
+
+def defaultLeaderboardPath():
+    """Leaderboard location. Uses $SNAKE_LEADERBOARD_FILE if set, otherwise the user home."""
+    filepath = os.environ.get(LEADERBOARD_ENV)
+    if filepath:
+        return filepath
+
+    return os.path.join(os.path.expanduser('~'), LEADERBOARD_NAME)
+
+
+class RankIndex(object):
+    """
+    Fenwick tree over score values. Counts how many scores are above a value in O(log n)
+    regardless of how many rows the board holds.
+    """
+
+    def __init__(self, size=1024):
+        self.counts = {}
+        self.total = 0
+        self._tree = [0] * (size + 1)
+
+
+    def _grow(self, score):
+        size = len(self._tree) - 1
+        while score >= size:
+            size *= 2
+
+        self._tree = [0] * (size + 1)
+        for value, count in self.counts.items():
+            self._update(value, count)
+
+
+    def _update(self, score, count):
+        i = score + 1
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += count
+            i += i & -i
+
+
+    def add(self, score, count=1):
+        score = max(0, int(score))
+        if score >= len(self._tree) - 1:
+            self._grow(score)
+
+        self.counts[score] = self.counts.get(score, 0) + count
+        self.total += count
+        self._update(score, count)
+
+
+    def countBelow(self, score):
+        """Number of scores strictly lower than score."""
+        i = min(max(0, int(score)), len(self._tree) - 1)
+        tree = self._tree
+        result = 0
+        while i > 0:
+            result += tree[i]
+            i -= i & -i
+        return result
+
+
+    def countAbove(self, score):
+        """Number of scores strictly higher than score."""
+        return self.total - self.countBelow(int(score) + 1)
+
+
+class Leaderboard(object):
+    """
+    SQLite backed leaderboard with one board per speed. Rows are indexed by (speed, score) so
+    pages and per player bests never scan the whole table.
+
+    Ranks are answered from in memory RankIndex, rebuilt when another connection, such as
+    another Maya session, changes the file.
+    """
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath or defaultLeaderboardPath()
+        self._connection = None
+        self._ranks = {}
+        self._data_version = None
+
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.filepath)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            self._connection = sqlite3.connect(self.filepath)
+            self._connection.executescript(LEADERBOARD_SCHEMA)
+
+            columns = [row[1] for row in self._connection.execute('PRAGMA table_info(scores)')]
+            if 'uid' not in columns:
+                self._connection.execute('ALTER TABLE scores ADD COLUMN uid TEXT')
+            self._connection.execute(LEADERBOARD_UID_INDEX)
+
+        return self._connection
+
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._ranks = {}
+        self._data_version = None
+
+
+    def _checkDataVersion(self):
+        """Drop the rank indexes if another connection changed the file since they were built."""
+        # data_version changes on commits of other connections only, this one's writes keep
+        # the indexes up to date themselves
+        #
+        row = self.connection.execute('PRAGMA data_version').fetchone()
+        version = row[0] if row else None
+        if version is None or version != self._data_version:
+            self._ranks = {}
+            self._data_version = version
+
+
+    def _rankIndex(self, speed):
+        """Rank index for a board, built from the score index then kept up to date."""
+        self._checkDataVersion()
+
+        rank_index = self._ranks.get(speed)
+        if rank_index is None:
+            rank_index = self._ranks[speed] = RankIndex()
+            cursor = self.connection.execute('SELECT score, COUNT(*) FROM scores '
+                                             'WHERE speed = ? GROUP BY score', (speed,))
+            for score, count in cursor:
+                rank_index.add(score, count)
+
+        return rank_index
+
+
+    def add(self, speed, name, score, uid=None):
+        """
+        Add a score to a board.
+
+        :param str uid: optional unique id, used to merge scores shared with other sessions
+        :return: row id of the new score
+        """
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO scores '
+                                             '(speed, name, score, created, uid) '
+                                             'VALUES (?, ?, ?, ?, ?)',
+                                             (speed, name, int(score), time.time(), uid))
+
+        if speed in self._ranks:
+            self._ranks[speed].add(score)
+
+        return cursor.lastrowid
+
+
+    def addMany(self, rows):
+        """
+        Add many scores in a single transaction.
+
+        :param rows: iterable of (speed, name, score)
+        """
+        now = time.time()
+        rows = [(speed, name, int(score), now) for speed, name, score in rows]
+
+        with self.connection:
+            self.connection.executemany('INSERT INTO scores (speed, name, score, created) '
+                                        'VALUES (?, ?, ?, ?)', rows)
+
+        for speed, _, score, _ in rows:
+            if speed in self._ranks:
+                self._ranks[speed].add(score)
+
+
+    @tracing.traced(tracing.IO, 'Leaderboard.merge')
+    def merge(self, records):
+        """
+        Add shared score records, skipping any whose uid is already on the board.
+
+        :param records: list of dicts with uid, speed, name, score and created keys
+        :return: number of records added
+        """
+        added = 0
+        with self.connection:
+            for record in records:
+                cursor = self.connection.execute('INSERT OR IGNORE INTO scores '
+                                                 '(speed, name, score, created, uid) '
+                                                 'VALUES (?, ?, ?, ?, ?)',
+                                                 (record['speed'], record['name'],
+                                                  int(record['score']), record['created'],
+                                                  record['uid']))
+                if not cursor.rowcount:
+                    continue
+
+                added += 1
+                if record['speed'] in self._ranks:
+                    self._ranks[record['speed']].add(record['score'])
+
+        return added
+
+
+    def count(self, speed=None):
+        """Number of scores on a board, or on all boards if speed is None."""
+        if speed is None:
+            return self.connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        return self._rankIndex(speed).total
+
+
+    def position(self, speed, score):
+        """0 based index a new score would be inserted at. Equal scores stay ahead of it."""
+        rank_index = self._rankIndex(speed)
+        return rank_index.total - rank_index.countBelow(score)
+
+
+    def rank(self, speed, score):
+        """1 based rank of a score. Equal scores share a rank."""
+        return self._rankIndex(speed).countAbove(score) + 1
+
+
+    def top(self, speed, limit=10, after=None):
+        """
+        Get a page of the board, best first. Pages are keyed on the last row of the previous
+        page, so each page costs the same no matter how deep into the board it is.
+
+        :param str speed: board to read
+        :param int limit: page size
+        :param after: (score, id) of the last row of the previous page
+        :return: list of (id, name, score)
+        """
+        if after is None:
+            cursor = self.connection.execute('SELECT id, name, score FROM scores '
+                                             'WHERE speed = ? '
+                                             'ORDER BY score DESC, id LIMIT ?',
+                                             (speed, limit))
+        else:
+            score, row_id = after
+            cursor = self.connection.execute('SELECT id, name, score FROM scores '
+                                             'WHERE speed = ? AND '
+                                             '(score < ? OR (score = ? AND id > ?)) '
+                                             'ORDER BY score DESC, id LIMIT ?',
+                                             (speed, score, score, row_id, limit))
+        return cursor.fetchall()
+
+
+    def page(self, speed, offset, limit=10):
+        """Get rows by absolute offset. Prefer top() with a key for sequential paging."""
+        cursor = self.connection.execute('SELECT id, name, score FROM scores '
+                                         'WHERE speed = ? '
+                                         'ORDER BY score DESC, id LIMIT ? OFFSET ?',
+                                         (speed, limit, offset))
+        return cursor.fetchall()
+
+
+    def best(self, speed, name):
+        """Best score of a player on a board, or None if they have no scores."""
+        return self.connection.execute('SELECT MAX(score) FROM scores '
+                                       'WHERE speed = ? AND name = ?',
+                                       (speed, name)).fetchone()[0]
+
+
+    def bests(self, speed, limit=10):
+        """Best score per player on a board, best first. List of (name, score)."""
+        cursor = self.connection.execute('SELECT name, MAX(score) AS best FROM scores '
+                                         'WHERE speed = ? GROUP BY name '
+                                         'ORDER BY best DESC LIMIT ?',
+                                         (speed, limit))
+        return cursor.fetchall()
+
+# ------------------------------------------------------------------------------------------------ #
+
+SHARED_SCORES_ENV = 'SNAKE_SHARED_SCORES'
+LOCK_EXT = '.lock'
+
+
+class FileLock(object):
+    """
+    Exclusive OS level lock on a side file, held across processes and machines. Uses lockf
+    on posix, which also works on NFS, and msvcrt.locking on Windows.
+    """
+
+    def __init__(self, filepath, timeout=10.0, poll=0.05):
+        self.filepath = filepath + LOCK_EXT
+        self.timeout = timeout
+        self.poll = poll
+        self._file = None
+
+
+    def _tryLock(self):
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+    def _unlock(self):
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN)
+
+
+    def acquire(self):
+        self._file = open(self.filepath, 'a+')
+
+        start = time.time()
+        while True:
+            try:
+                self._tryLock()
+                return
+            except (IOError, OSError):
+                if time.time() - start > self.timeout:
+                    self._file.close()
+                    self._file = None
+                    raise IOError('Timed out waiting for lock on {}'.format(self.filepath))
+                time.sleep(self.poll)
+
+
+    def release(self):
+        if self._file is None:
+            return
+
+        try:
+            self._unlock()
+        finally:
+            self._file.close()
+            self._file = None
+
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class SharedScoreLog(object):
+    """
+    Append-only score log for many sessions sharing one path. Writers append records under a
+    file lock, so concurrent sessions merge rather than overwrite each other. Readers tail the
+    log from the offset they last read. The log is compacted, keeping the best scores per
+    speed, once it grows past compact_bytes.
+
+    The first line of the log is a header holding a generation id, which changes on every
+    compaction so readers know to read from the start again.
+    """
+
+    def __init__(self, filepath, keep=1000, compact_bytes=1 << 20):
+        """
+        :param str filepath: shared log path
+        :param int keep: scores kept per speed when compacting
+        :param int compact_bytes: log size that triggers a compaction
+        """
+        self.filepath = filepath
+        self.keep = keep
+        self.compact_bytes = compact_bytes
+
+        self.lock = FileLock(filepath)
+
+        # if compaction can't shrink the log below compact_bytes, wait for it to double
+        #
+        self._compact_at = compact_bytes
+
+        self.generation = None
+        self.offset = 0
+
+        self.appended = 0
+        self.compactions = 0
+
+
+    @staticmethod
+    def record(speed, name, score):
+        """Create a new score record with a unique id."""
+        return {'uid': uuid.uuid4().hex,
+                'speed': speed,
+                'name': name,
+                'score': int(score),
+                'created': time.time()}
+
+
+    @staticmethod
+    def _header():
+        return json.dumps({'generation': uuid.uuid4().hex}) + '\n'
+
+
+    @tracing.traced(tracing.IO, 'SharedScoreLog.append')
+    def append(self, records):
+        """Append records to the log, compacting it if it has grown too large."""
+        directory = os.path.dirname(self.filepath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        lines = ''.join(json.dumps(record, sort_keys=True) + '\n' for record in records)
+
+        with self.lock:
+            new_log = not os.path.exists(self.filepath) or not os.path.getsize(self.filepath)
+            with open(self.filepath, 'ab') as f:
+                if new_log:
+                    f.write(self._header())
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+
+            self.appended += len(records)
+
+            if size > max(self.compact_bytes, self._compact_at):
+                self._compact()
+
+
+    def compact(self):
+        """Rewrite the log keeping only the best scores per speed."""
+        with self.lock:
+            self._compact()
+
+
+    def _compact(self):
+        records = {}
+        with open(self.filepath, 'rb') as f:
+            f.readline()
+            for record in self._parse(f.read()):
+                records[record['uid']] = record
+
+        boards = {}
+        for record in records.values():
+            boards.setdefault(record['speed'], []).append(record)
+
+        lines = [self._header()]
+        for speed in sorted(boards):
+            board = sorted(boards[speed], key=lambda r: (-r['score'], r['created']))
+            for record in board[:self.keep]:
+                lines.append(json.dumps(record, sort_keys=True) + '\n')
+
+        text = ''.join(lines)
+        atomicWrite(self.filepath, text)
+        self.compactions += 1
+
+        self._compact_at = len(text) * 2
+
+
+    @staticmethod
+    def _parse(data):
+        records = []
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if 'uid' in record:
+                records.append(record)
+
+        return records
+
+
+    @tracing.traced(tracing.IO, 'SharedScoreLog.tail')
+    def tail(self):
+        """
+        Read records appended since the last call. If the log was compacted in between, the
+        whole log is read again.
+
+        :return: (records, reset) where reset is True if the log was read from the start
+        """
+        try:
+            f = open(self.filepath, 'rb')
+        except IOError:
+            return [], False
+
+        with f:
+            header = f.readline()
+            if not header.endswith('\n'):
+                return [], False
+
+            try:
+                generation = json.loads(header).get('generation')
+            except ValueError:
+                generation = None
+
+            reset = generation != self.generation
+            if reset:
+                self.generation = generation
+                self.offset = f.tell()
+            else:
+                f.seek(self.offset)
+
+            data = f.read()
+
+        # leave a partially written last line for the next read
+        #
+        end = data.rfind('\n') + 1
+        self.offset += end
+
+        return self._parse(data[:end]), reset
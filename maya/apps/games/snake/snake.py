@@ -1,6 +1,8 @@
-import random
 import os
-import json
+import bisect
+import random
+import threading
+from collections import deque
 
 import PySide2.QtCore as qc
 import PySide2.QtGui as qg
@@ -8,17 +10,13 @@ import PySide2.QtWidgets as qw
 
 from majic_tools.sys.utils.text import intToAlpha
 
-from majic_tools.maya.apps.games.snake import game, images, font
+from majic_tools.maya.apps.games.snake import game, images, font, tracing, stats, lcd
+from majic_tools.maya.apps.games.snake import scores as score_store
+from majic_tools.maya.apps.games.snake import autopilot, mazes
 from .utils import ALIGN_LEFT, ALIGN_V_CENTER, ALIGN_H_CENTER
 
 # ------------------------------------------------------------------------------------------------ #
 
-MAIN_COLOUR = qg.QColor(18, 30, 0)
-SHADOW_COLOUR = qg.QColor(18, 30, 0, 100)
-
-MAIN_BRUSHES = [qg.QPen(MAIN_COLOUR), qg.QBrush(MAIN_COLOUR)]        
-SHADOW_BRUSHES = [qg.QPen(SHADOW_COLOUR), qg.QBrush(SHADOW_COLOUR)]
-
 # snake directions
 #
 UP = (0, -1)
@@ -40,6 +38,10 @@ SPEED = {SLOWEST: 120,
          FAST: 50,
          FASTEST: 40}
 
+# game modes, the classic open arena is followed by the mazes of the maze file
+#
+CLASSIC = 'Classic'
+
 POINTS = {SLOWEST: 1,
           SLOW: 3,
           NORMAL: 5,
@@ -52,19 +54,44 @@ class SnakeData(game.GameData):
     title = 'SNAKE II'
 
     background_color = (128, 175, 1)
+    pixel_color = (18, 30, 0)
+    shadow_color = (18, 30, 0, 100)
 
+    # the screen is screen_width x screen_height logical pixels, each drawn in a cell of
+    # pixel_width + pixel_spacing window pixels, times scale
+    #
     pixel_width = 5
+    pixel_spacing = 2
     screen_width = 104
     screen_height = 84
+    scale = 1
 
-    width = screen_width * (pixel_width + 2)
-    height = screen_height * (pixel_width + 2)
+    width = screen_width * (pixel_width + pixel_spacing) * scale
+    height = screen_height * (pixel_width + pixel_spacing) * scale
 
+    # index into modes(), 0 is the classic open arena
+    #
     game_mode = 0
+    maze_filepath = mazes.DEFAULT_FILEPATH
+    maze_library = None
 
     snake_length = 10
     snake_speed = NORMAL
 
+    show_hud = False
+
+    # turns buffered between ticks, one is applied per tick. With immediate_input a turn moves
+    # the snake straight away instead of waiting for the next tick
+    #
+    input_queue_size = 3
+    immediate_input = False
+
+    # attract mode, the splash screen plays a demo game after this many milliseconds without
+    # input. 0 turns it off
+    #
+    attract_delay = 8000
+    attract_speed = NORMAL
+
     bonus_trigger = 10
     bonus_countdown_speed = 100
     bonus_countdown = 20
@@ -74,36 +101,186 @@ class SnakeData(game.GameData):
     scores = [('---', 0) for i in range(10)]
     new_high_score = None
 
-    score_filepath = 'D:\snake_high_scores.json'
+    score_filepath = score_store.defaultScorePath()
+    score_file = None
+
+    # leaderboard, one board per speed. scores holds the top board_size of the current board
+    #
+    leaderboard_filepath = score_store.defaultLeaderboardPath()
+    leaderboard = None
+    board_size = 10
+
+    # optional append-only log shared by many sessions, merged into the leaderboard
+    #
+    shared_score_filepath = os.environ.get(score_store.SHARED_SCORES_ENV)
+    shared_scores = None
+    shared_lock = threading.Lock()
+
+
+    @staticmethod
+    def setScale(scale):
+        """Set the window scale. Must be called before the game is created."""
+        cell = (SnakeData.pixel_width + SnakeData.pixel_spacing) * scale
+
+        SnakeData.scale = scale
+        SnakeData.width = SnakeData.screen_width * cell
+        SnakeData.height = SnakeData.screen_height * cell
+
+
+    @staticmethod
+    def mazeLibrary():
+        """Get the maze library for the current maze_filepath."""
+        library = SnakeData.maze_library
+        if library is None or library.filepath != SnakeData.maze_filepath:
+            library = SnakeData.maze_library = mazes.MazeLibrary(SnakeData.maze_filepath)
+        return library
+
+
+    @staticmethod
+    def modes():
+        """Names of the game modes, classic first."""
+        return [CLASSIC] + SnakeData.mazeLibrary().names()
+
+
+    @staticmethod
+    def maze():
+        """Maze of the current game mode, or None in classic mode."""
+        names = SnakeData.mazeLibrary().names()
+        if not 0 < SnakeData.game_mode <= len(names):
+            return None
+        return SnakeData.mazeLibrary().get(names[SnakeData.game_mode - 1])
+
+
+    @staticmethod
+    def board():
+        """Get the leaderboard for the current leaderboard_filepath."""
+        leaderboard = SnakeData.leaderboard
+        if leaderboard is None or leaderboard.filepath != SnakeData.leaderboard_filepath:
+            if leaderboard is not None:
+                leaderboard.close()
+            leaderboard = score_store.Leaderboard(SnakeData.leaderboard_filepath)
+            SnakeData.leaderboard = leaderboard
+
+        return leaderboard
+
+
+    @staticmethod
+    def sharedScores():
+        """Get the shared score log, or None if no shared_score_filepath is set."""
+        filepath = SnakeData.shared_score_filepath
+        if not filepath:
+            return None
+
+        shared_scores = SnakeData.shared_scores
+        if shared_scores is None or shared_scores.filepath != filepath:
+            shared_scores = SnakeData.shared_scores = score_store.SharedScoreLog(filepath)
+
+        return shared_scores
+
+
+    @staticmethod
+    def shareScore(speed, name, score):
+        """
+        Append a score to the shared log on a background thread.
+
+        :return: uid of the shared record, or None if scores are not shared
+        """
+        shared_scores = SnakeData.sharedScores()
+        if shared_scores is None:
+            return None
+
+        record = shared_scores.record(speed, name, score)
+        SnakeData._runShared(shared_scores.append, [record])
+
+        return record['uid']
+
+
+    @staticmethod
+    def syncScores(callback):
+        """
+        Read scores other sessions added to the shared log since the last sync, on a
+        background thread. callback(records) is called from that thread.
+        """
+        shared_scores = SnakeData.sharedScores()
+        if shared_scores is None:
+            return
+
+        def _sync():
+            records, _ = shared_scores.tail()
+            if records:
+                callback(records)
+
+        SnakeData._runShared(_sync)
+
+
+    @staticmethod
+    def _runShared(function, *args):
+        """Run shared log access one call at a time, off the ui thread."""
+        def _run():
+            with SnakeData.shared_lock:
+                try:
+                    function(*args)
+                except (IOError, OSError) as e:
+                    print "Snake II: Failed to access shared scores. {}".format(e)
+
+        thread = threading.Thread(target=_run, name='SnakeSharedScores')
+        thread.daemon = True
+        thread.start()
 
 
     @staticmethod
     def isHighScore(score):
-        """Checks if given score is higher than the lowest recorded score."""
-        return score > min([score for _, score in SnakeData.scores])
+        """Checks if given score would make the top board_size of the current speed board."""
+        if score <= 0:
+            return False
+
+        position = SnakeData.board().position(SnakeData.snake_speed, score)
+        return position < SnakeData.board_size
+
+
+    @staticmethod
+    def scoreFile():
+        """Get the write-behind score file for the current score_filepath."""
+        score_file = SnakeData.score_file
+        if score_file is None or score_file.filepath != SnakeData.score_filepath:
+            if score_file is not None:
+                score_file.close()
+            score_file = SnakeData.score_file = score_store.ScoreFile(SnakeData.score_filepath)
+
+        return score_file
+
+
+    @staticmethod
+    def setScoreFilepath(filepath):
+        """Change where high scores are stored."""
+        SnakeData.score_filepath = filepath
+        SnakeData.scoreFile()
 
 
     @staticmethod
+    @tracing.traced(tracing.IO, 'SnakeData.saveScores')
     def saveScores():
-        with open(SnakeData.score_filepath, 'w') as f:
-            json.dump(SnakeData.scores, f, sort_keys=True, indent=2, separators=(',', ': '))
+        """Queue the current scores to be written to disk on a background thread."""
+        SnakeData.scoreFile().save(SnakeData.scores)
 
 
     @staticmethod
-    def loadScores():
-        if not os.path.exists(SnakeData.score_filepath):
-            print "Snake II: Failed to load High Scores."
-            return
+    @tracing.traced(tracing.IO, 'SnakeData.loadScores')
+    def loadScores(callback=None):
+        """
+        Load scores on a background thread. Falls back to the last good copy if the score file
+        is corrupt.
 
-        try:
-            with open(SnakeData.score_filepath, 'r') as f:
-                json_data = json.load(f)
-        except Exception as e:
-            print e
-            print "Snake II: Failed to load High Scores."
-            return
+        :param callback: optional function called from the loading thread with the loaded
+                         scores. If given, it is responsible for storing them.
+        """
+        def _loaded(json_data):
+            if callback is None:
+                SnakeData.scores = json_data
+            else:
+                callback(json_data)
 
-        SnakeData.scores = json_data
+        return SnakeData.scoreFile().load(_loaded)
 
 # ------------------------------------------------------------------------------------------------ #
 
@@ -118,6 +295,7 @@ class Snake(game.Game):
         start_screen = self.addLevel(Splash)
         main_menu = self.addLevel(Menu, 'Menu')
         level_menu = self.addLevel(LevelMenu, 'Level')
+        mode_menu = self.addLevel(ModeMenu, 'Mode')
         high_scores = self.addLevel(HighScores)
         arena = self.addLevel(Arena)
 
@@ -134,11 +312,12 @@ class Snake(game.Game):
         menu_to_arena = self.addConnection(main_menu, arena)
         menu_to_level = self.addConnection(main_menu, level_menu)
         menu_to_scores = self.addConnection(main_menu, high_scores)
+        menu_to_mode = self.addConnection(main_menu, mode_menu)
 
         menu_items = [('New Game', menu_to_arena),
                       ('Level', menu_to_level),
                       ('High Scores', menu_to_scores),
-                      ('Mode', menu_to_level)]
+                      ('Mode', menu_to_mode)]
         main_menu.initialize(menu_items)
 
         # setup level menu
@@ -152,6 +331,13 @@ class Snake(game.Game):
                       (FASTEST, to_main_menu)]
         level_menu.initialize(menu_items, self.data.snake_speed)
 
+        # setup mode menu
+        #
+        to_main_menu = self.addConnection(mode_menu, main_menu)
+
+        menu_items = [(mode, to_main_menu) for mode in self.data.modes()]
+        mode_menu.initialize(menu_items, self.data.game_mode)
+
         # setup arena
         #
         self.addConnection(arena, main_menu)
@@ -165,24 +351,51 @@ class Snake(game.Game):
 
 def paintPixel(painter, x, y):
     """
-    Paints a pixel of defined width, with a shadow.
+    Lights a pixel. The pixel look, its width and shadow, is added when the raster is drawn,
+    see lcd.paint.
+
+    :param lcd.LcdRaster painter: raster to paint on
+    :param int x: logical x position of the pixel
+    :param int y: logical y position of the pixel
+    """
+    if 0 <= x < painter.width and 0 <= y < painter.height:
+        painter.pixels[y * painter.width + x] = 1
 
-    :param painter: QPainter object to draw with
-    :param int x: real x position to draw the pixel
-    :param int y: real y position to draw the pixel
+
+def paintBorders(painter, data):
+    """
+    Paints the arena border, with the line under the score.
+
+    :param lcd.LcdRaster painter: raster to paint on
+    :param data: game data holding the screen size
     """
+    upper_edge = 10
+    lower_edge = data.screen_height - 3
+    for i in range(2, data.screen_width - 2):
+        paintPixel(painter, i, upper_edge-2)
+        paintPixel(painter, i, upper_edge)
+        paintPixel(painter, i, lower_edge)
 
-    x = x * (SnakeData.pixel_width + 2)
-    y = y * (SnakeData.pixel_width + 2)
+    left_edge = 2
+    right_edge = data.screen_width - 3
+    for i in range(11, data.screen_height - 3):
+        paintPixel(painter, left_edge, i)
+        paintPixel(painter, right_edge, i)
 
-    for color in (MAIN_BRUSHES, SHADOW_BRUSHES):
-        painter.setPen(color[0])
-        painter.setBrush(color[1])
 
-        painter.drawRect(x, y, SnakeData.pixel_width, SnakeData.pixel_width)
+def paintWalls(painter, maze):
+    """
+    Paints the walls of a maze as solid grid blocks.
 
-        x += 1
-        y += 1
+    :param lcd.LcdRaster painter: raster to paint on
+    :param mazes.Maze maze: maze to paint
+    """
+    for x, y in maze.cells():
+        block_x = (x * 4) + 4
+        block_y = (y * 4) + 12
+        for i in range(4):
+            for j in range(4):
+                paintPixel(painter, block_x + i, block_y + j)
 
 # ------------------------------------------------------------------------------------------------ #
 
@@ -193,21 +406,80 @@ class Splash(game.Level):
         self.offset = [0, 0]
         self.alignment = ALIGN_H_CENTER | ALIGN_V_CENTER
 
+        # attract mode, a demo game played by the autopilot
+        #
+        self.demo = GameGrid(self)
+        self.demo.hide()
+        self.autopilot = autopilot.Autopilot(self.demo)
+
+        self._idle_timer = qc.QTimer()
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.timeout.connect(self.startDemo)
+
+        self._demo_timer = qc.QTimer()
+        self._demo_timer.timeout.connect(self._demoTick)
+
 
     def initialize(self, image, alignment=0):
         self.image = image
         self.alignment = alignment
 
+
+    def startDemo(self):
+        """Start, or restart, the demo game."""
+        self.demo.start()
+        self.autopilot.reset()
+        self.demo.show()
+
+        self._demo_timer.start(SPEED[self.data.attract_speed])
+        game.markDirty(self)
+
+
+    def stopDemo(self):
+        self._idle_timer.stop()
+        self._demo_timer.stop()
+
+        if self.demo.isVisible():
+            self.demo.hide()
+            game.markDirty(self)
+
+
+    @qc.Slot()
+    def _demoTick(self):
+        self.demo.queueDirection(self.autopilot.nextDirection())
+
+        # start over once the snake dies or fills half the arena
+        #
+        alive = self.demo.update() is not False
+        if not alive or self.demo.length * 2 >= self.demo.width * self.demo.height:
+            self.startDemo()
+
+
+    def showEvent(self, event):
+        super(Splash, self).showEvent(event)
+        if self.data.attract_delay:
+            self._idle_timer.start(self.data.attract_delay)
+
+
+    def hideEvent(self, event):
+        super(Splash, self).hideEvent(event)
+        self.stopDemo()
+
     
+    @tracing.traced(tracing.PAINT)
     def paintEvent(self, _):
-        if self.image is None:
+        if self.demo.isVisible():
+            with lcd.paint(self) as painter:
+                paintBorders(painter, self.data)
             return
 
-        painter = qw.QStylePainter(self)
+        if self.image is None:
+            return
 
-        paint_area = [0, 0, self.data.screen_width, self.data.screen_height]
+        with lcd.paint(self) as painter:
+            paint_area = [0, 0, self.data.screen_width, self.data.screen_height]
 
-        self.image.paint(painter, paint_area, False, paintPixel, self.alignment)
+            self.image.paint(painter, paint_area, False, paintPixel, self.alignment)
 
 
     def keyPressEvent(self, _):
@@ -223,8 +495,11 @@ class ScrollArea(game.Level):
         self.title_image = None
         self.scrollbar = False
 
+        # item_offsets holds the running total of item heights, the bottom edge of each item
+        #
         self.items = []
-        self.item_positions = {}
+        self.item_offsets = []
+        self._visible_range = (0, 0)
 
         self.setTitle(title)
 
@@ -243,22 +518,31 @@ class ScrollArea(game.Level):
     def setTitle(self, title):
         self.title = title
         self.title_image = font.small_font.getImage('- {} -'.format(title))
-        self.repaint()
+        game.markDirty(self)
 
 
     def initialize(self, items):
-        self.items = items
-        self.item_positions = {}
+        self._releaseItems(0, len(self.items))
+
+        self.items = []
+        self.item_offsets = []
+        self._visible_range = (0, 0)
 
         self.scroll_range = [0, self.scroll_area[3], []]
         self.selected_item_index = 0
 
-        scroll_value = 0
-        for i, item in enumerate(self.items):
+        self.addItems(items)
+
+
+    def addItems(self, items):
+        """Append items to the end of the scroll area, keeping the current selection."""
+        scroll_value = self.item_offsets[-1] if self.item_offsets else 0
+        for item in items:
             scroll_value += item.height
-            self.item_positions[i] = scroll_value
+            self.item_offsets.append(scroll_value)
+            self.items.append(item)
 
-        if max(self.item_positions.values()) > self.scroll_area[3]:
+        if not self.scrollbar and scroll_value > self.scroll_area[3]:
             self.scrollbar = True
             self.scroll_area[2] -= 4
 
@@ -267,6 +551,11 @@ class ScrollArea(game.Level):
         self._scroll()
 
 
+    def totalItems(self):
+        """Number of items the scroll bar represents. Can be more than are currently loaded."""
+        return len(self.items)
+
+
     def keyPressEvent(self, event):
         """ Handles scrolling and selection of menu items.
 
@@ -287,7 +576,7 @@ class ScrollArea(game.Level):
                 self.selected_item_index = 0
 
             self._scroll()
-            self.repaint()
+            game.markDirty(self)
 
         elif key in (qc.Qt.Key_Return, qc.Qt.Key_Enter):
             self.select(self.selected_item_index)
@@ -301,8 +590,15 @@ class ScrollArea(game.Level):
 
     def _scroll(self):
         """ Handles menu scrolling area, which items are visible and partial items."""
-        selected_lower = self.item_positions.get(self.selected_item_index - 1, 0)
-        selected_upper = self.item_positions[self.selected_item_index] - 1
+        if not self.items:
+            self.scroll_range[2] = []
+            return
+
+        offsets = self.item_offsets
+        index = self.selected_item_index
+
+        selected_lower = offsets[index - 1] if index > 0 else 0
+        selected_upper = offsets[index] - 1
 
         if selected_lower <= self.scroll_range[0]:
             self.scroll_range[0] = selected_lower
@@ -311,13 +607,18 @@ class ScrollArea(game.Level):
             self.scroll_range[1] = selected_upper
             self.scroll_range[0] = selected_upper - self.scroll_area[3] + 1
 
-        # figure out which items are currently visible
+        # figure out which items are currently visible. Only the items between the first one
+        # ending inside the range and the last one starting inside it need checking
         #
         visible_items = self.scroll_range[2] = []
 
-        previous_scroll_value = 0
-        for i, item in enumerate(self.items):
-            scroll_value = self.item_positions[i] - 1
+        first = bisect.bisect_right(offsets, self.scroll_range[0])
+        last = min(len(offsets), bisect.bisect_right(offsets, self.scroll_range[1]) + 1)
+
+        for i in range(first, last):
+            item = self.items[i]
+            previous_scroll_value = offsets[i - 1] if i > 0 else 0
+            scroll_value = offsets[i] - 1
 
             # check if lower or upper edge is in menu range
             #
@@ -340,68 +641,95 @@ class ScrollArea(game.Level):
                 value = scroll_value - self.scroll_range[0]
                 visible_items.append((i, item.height - value, item.height))
 
-            previous_scroll_value = scroll_value + 1
+        # let items scrolled out of view drop their images
+        #
+        previous_first, previous_last = self._visible_range
+        self._visible_range = (first, last)
 
+        self._releaseItems(previous_first, min(previous_last, first))
+        self._releaseItems(max(previous_first, last), previous_last)
 
-    def paintEvent(self, _):
-        painter = qw.QStylePainter(self)
 
-        title_area = (0, 0, self.data.screen_width, 10)
-        self.title_image.paint(painter, title_area, False, paintPixel)
+    def _releaseItems(self, start, end):
+        """Release cached images of items in the given index range."""
+        for item in self.items[start:end]:
+            release = getattr(item, 'release', None)
+            if release is not None:
+                release()
 
-        x, y = self.scroll_area[0], self.scroll_area[1]
 
-        # draw scroll bar
-        #
-        if self.scrollbar:
-            scroll_height = self.scroll_area[3]
+    @tracing.traced(tracing.PAINT)
+    def paintEvent(self, _):
+        with lcd.paint(self) as painter:
+            title_area = (0, 0, self.data.screen_width, 10)
+            self.title_image.paint(painter, title_area, False, paintPixel)
 
-            scroll_incr = float(scroll_height) / len(self.items)
-            start_scroll = round(scroll_incr * self.selected_item_index)
-            end_scroll = round(scroll_incr * (self.selected_item_index + 1))
-            end_scroll = min([end_scroll, scroll_height - 1])
+            x, y = self.scroll_area[0], self.scroll_area[1]
 
-            scroll_bar_offset = self.data.screen_width - self.margins[2]
-            for i in range(scroll_height):
-                if i in (start_scroll, end_scroll):
-                    paintPixel(painter, scroll_bar_offset - 2, i + y)
+            # draw scroll bar
+            #
+            if self.scrollbar:
+                scroll_height = self.scroll_area[3]
 
-                if start_scroll < i < end_scroll:
-                    paintPixel(painter, scroll_bar_offset - 1, i + y)
-                else:
-                    paintPixel(painter, scroll_bar_offset - 3, i + y)
+                scroll_incr = float(scroll_height) / max(self.totalItems(), 1)
+                start_scroll = round(scroll_incr * self.selected_item_index)
+                end_scroll = round(scroll_incr * (self.selected_item_index + 1))
+                end_scroll = min([end_scroll, scroll_height - 1])
 
-        # draw menu items
-        #
-        for item_index, lower, upper in self.scroll_range[2]:
-            invert = False
-            if item_index == self.selected_item_index:
-                invert = True
+                scroll_bar_offset = self.data.screen_width - self.margins[2]
+                for i in range(scroll_height):
+                    if i in (start_scroll, end_scroll):
+                        paintPixel(painter, scroll_bar_offset - 2, i + y)
 
-            item = self.items[item_index]
+                    if start_scroll < i < end_scroll:
+                        paintPixel(painter, scroll_bar_offset - 1, i + y)
+                    else:
+                        paintPixel(painter, scroll_bar_offset - 3, i + y)
 
-            # get item height. some items might be partially visible
+            # draw menu items
             #
-            item_height = (upper - lower) if lower is not None else item.height
+            for item_index, lower, upper in self.scroll_range[2]:
+                invert = False
+                if item_index == self.selected_item_index:
+                    invert = True
 
-            # create paint area, start x, y and width, height
-            #
-            paint_area = (x, y, self.scroll_area[2], item_height)
+                item = self.items[item_index]
 
-            # paint menu item in allowed paint area
-            #
-            item.paint(painter, paint_area, invert)
+                # get item height. some items might be partially visible
+                #
+                item_height = (upper - lower) if lower is not None else item.height
+
+                # create paint area, start x, y and width, height
+                #
+                paint_area = (x, y, self.scroll_area[2], item_height)
 
-            y += item_height
+                # paint menu item in allowed paint area
+                #
+                item.paint(painter, paint_area, invert)
+
+                y += item_height
 
 
 class MenuItem(object):
     def __init__(self, text):
         self.text = text
         self.height = 18
-        self.image = font.main_font.getImage(text)
         self.margins = [3, 3, 3, 3]
 
+        self._image = None
+
+
+    @property
+    def image(self):
+        """Text image, only built once the item is painted."""
+        if self._image is None:
+            self._image = font.main_font.getImage(self.text)
+        return self._image
+
+
+    def release(self):
+        self._image = None
+
 
     def paint(self, painter, paint_area, invert=False):
         sub_paint_area = [paint_area[0] + self.margins[0],
@@ -472,11 +800,28 @@ class LevelMenu(Menu):
         """Set snake speed to selected, then run menu select function."""
         self.data.snake_speed = self.items[self.selected_item_index].text
         super(LevelMenu, self).select(selected_item_index)
+
+
+class ModeMenu(Menu):
+    def initialize(self, items, default):
+        super(ModeMenu, self).initialize(items)
+        self.selected_item_index = min(default, len(self.items) - 1)
+
+
+    def select(self, selected_item_index):
+        """Set game mode to selected, then run menu select function."""
+        self.data.game_mode = self.selected_item_index
+        super(ModeMenu, self).select(selected_item_index)
                     
 # ------------------------------------------------------------------------------------------------ #
 
 class Arena(game.Level):
     GAME_OVER = 'GAME OVER'
+
+    KEY_DIRECTIONS = {qc.Qt.Key_Left: LEFT,
+                      qc.Qt.Key_Right: RIGHT,
+                      qc.Qt.Key_Up: UP,
+                      qc.Qt.Key_Down: DOWN}
     
     def __init__(self, data):
         super(Arena, self).__init__(data)
@@ -492,10 +837,22 @@ class Arena(game.Level):
         self.running = False
         self._high_score = False
 
+        # static layers, only composed again on resize or a change of mode or score
+        #
+        self.background_layer = lcd.Layer()
+        self.game_over_layer = lcd.Layer()
+
         # create and connect timers
         #
         self._anim_timer = qc.QTimer()
-        self._anim_timer.timeout.connect(self.grid.update)
+        self._anim_timer.timeout.connect(self._tick)
+        self._last_tick = None
+
+        # tick stats, in milliseconds
+        #
+        self.tick_times = stats.RollingWindow()
+        self.tick_intervals = stats.RollingWindow()
+        self.tick_drift = stats.RollingWindow()
 
         self._bonus_timer = qc.QTimer()
         self._bonus_timer.timeout.connect(self.bonus_countdown.update)
@@ -514,6 +871,11 @@ class Arena(game.Level):
 
         self.bonus_countdown.hide()
 
+        # debug overlay, toggled with F3
+        #
+        self.hud = PerfHud(self)
+        self.hud.setVisible(self.data.show_hud)
+
         # create game over text
         #
         self.game_over_image = font.main_font.getImage('Game over!')
@@ -540,14 +902,12 @@ class Arena(game.Level):
         
     def keyPressEvent(self, event):
         key = event.key()
-        if key == qc.Qt.Key_Left:
-            self.grid.moveLeft()
-        elif key == qc.Qt.Key_Right:
-            self.grid.moveRight()
-        elif key == qc.Qt.Key_Up:
-            self.grid.moveUp()
-        elif key == qc.Qt.Key_Down:
-            self.grid.moveDown()
+        if key == qc.Qt.Key_F3:
+            self.toggleHud()
+        elif key in Arena.KEY_DIRECTIONS:
+            queued = self.grid.queueDirection(Arena.KEY_DIRECTIONS[key])
+            if queued and self.data.immediate_input:
+                self.stepNow()
 
         # pause or exit
         elif key in (qc.Qt.Key_Return, qc.Qt.Key_Enter) and not self.game_mode:
@@ -557,10 +917,51 @@ class Arena(game.Level):
                 self.switch(0)
         
     
+    def toggleHud(self):
+        """Show or hide the performance hud."""
+        self.data.show_hud = not self.data.show_hud
+        self.hud.setVisible(self.data.show_hud)
+
+
     def start(self):
         self.reset()
-        self.grid.start()
+        self.grid.start(self.data.maze())
+        self._last_tick = None
         self._anim_timer.start(SPEED[self.data.snake_speed])
+
+
+    @qc.Slot()
+    def _tick(self):
+        """Advance the game one step, recording tick time and the real timer interval."""
+        now = tracing.monotonic()
+        if self._last_tick is not None:
+            interval = (now - self._last_tick) * 1000.0
+            scheduled = self._anim_timer.interval()
+
+            self.tick_intervals.add(interval)
+            self.tick_drift.add(interval - scheduled)
+
+            self.data.tracer.counter('tick interval', tracing.TIMER,
+                                     actual=interval, scheduled=scheduled)
+        self._last_tick = now
+
+        with stats.Timer(self.tick_times):
+            self.grid.update()
+
+
+    def stepNow(self):
+        """
+        Step the game straight away rather than on the next tick. The tick timer restarts, so
+        the step after this one is a full tick later.
+        """
+        if not self._anim_timer.isActive():
+            return
+
+        self._anim_timer.start()
+        self._last_tick = None
+
+        with stats.Timer(self.tick_times):
+            self.grid.update()
         
         
     def end(self):
@@ -584,7 +985,7 @@ class Arena(game.Level):
     def gameOver(self):
         self._game_over_counter += 1
         self.grid.draw_snake = not self._game_over_counter % 2
-        self.grid.repaint()
+        game.markDirty(self.grid)
 
         if self._game_over_counter != 10:
             return
@@ -609,7 +1010,7 @@ class Arena(game.Level):
         #
         self.score_image = font.main_font.getImage(self.score_board.asString())
 
-        self.repaint()
+        game.markDirty(self)
 
 
     def showEvent(self, event):
@@ -622,37 +1023,40 @@ class Arena(game.Level):
         super(Arena, self).hideEvent(event)
         if self.running:
             self._anim_timer.stop()
+        self._last_tick = None
         
     
-    def paintEvent(self, _):
-        painter = qw.QStylePainter(self)
-        option  = qw.QStyleOption()
-        option.initFrom(self)
+    def paintBackground(self, painter):
+        """Paints the arena borders and the walls of the current maze."""
+        paintBorders(painter, self.data)
+
+        maze = self.data.maze()
+        if maze is not None and maze.fits(self.grid.width, self.grid.height):
+            paintWalls(painter, maze)
+
+
+    def paintGameOver(self, painter):
+        """Paints the game over text and the final score."""
+        paint_area = [0, 15, self.data.screen_width, 20]
+        self.game_over_image.paint(painter, paint_area, False, paintPixel)
+        paint_area[1] += 20
+        if self.data.new_high_score:
+            self.high_score_image.paint(painter, paint_area, False, paintPixel)
+        else:
+            self.your_score_image.paint(painter, paint_area, False, paintPixel)
+        paint_area[1] += 12
+        self.score_image.paint(painter, paint_area, False, paintPixel)
 
-        if self.game_mode:
-            upper_edge = 10
-            lower_edge = self.data.screen_height - 3
-            for i in range(2, self.data.screen_width - 2):
-                paintPixel(painter, i, upper_edge-2)
-                paintPixel(painter, i, upper_edge)
-                paintPixel(painter, i, lower_edge)
-
-            left_edge = 2
-            right_edge = self.data.screen_width - 3
-            for i in range(11, self.data.screen_height - 3):
-                paintPixel(painter, left_edge, i)
-                paintPixel(painter, right_edge, i)
 
+    @tracing.traced(tracing.PAINT)
+    def paintEvent(self, _):
+        # the grid, score and bonus countdown are child widgets painted on top
+        #
+        if self.game_mode:
+            self.background_layer.paint(self, self.data.game_mode, self.paintBackground)
         else:
-            paint_area = [0, 15, self.data.screen_width, 20]
-            self.game_over_image.paint(painter, paint_area, False, paintPixel)
-            paint_area[1] += 20
-            if self.data.new_high_score:
-                self.high_score_image.paint(painter, paint_area, False, paintPixel)
-            else:
-                self.your_score_image.paint(painter, paint_area, False, paintPixel)
-            paint_area[1] += 12
-            self.score_image.paint(painter, paint_area, False, paintPixel)
+            key = (bool(self.data.new_high_score), self.score_board.asString())
+            self.game_over_layer.paint(self, key, self.paintGameOver)
 
 
     @qc.Slot()
@@ -714,39 +1118,74 @@ class GameGrid(qw.QWidget):
         self.direction = RIGHT
         self.next_direction = RIGHT
 
+        # queued turns as (direction, time queued), and the time from a key press to the head
+        # moving, in milliseconds
+        #
+        self.input_queue = deque()
+        self.input_latency = stats.RollingWindow()
+
         self.position = (self.width / 2, self.height / 2)
         self.length = snake_length
 
         self.draw_snake = True
 
+        # maze wall bitboard, bit x * height + y is set for a wall at x, y
+        #
+        self.walls = 0
+
+        self.apple = None
         self.bonus_blocks = []
 
 
+    def queueDirection(self, direction):
+        """
+        Queue a turn for a coming tick. A turn is checked against the last queued direction,
+        so quick turns such as a U-turn over two ticks are kept rather than overwritten.
+
+        :param tuple direction: UP, DOWN, LEFT or RIGHT
+        :return: True if the turn was queued, False if it is a reversal, doesn't change the
+                 direction or the queue is full
+        """
+        queue = self.input_queue
+        last = queue[-1][0] if queue else self.next_direction
+
+        if direction == last or direction == (-last[0], -last[1]):
+            return False
+
+        if len(queue) >= self.data.input_queue_size:
+            return False
+
+        queue.append((direction, tracing.monotonic()))
+        return True
+
+
     def moveUp(self):
-        if self.direction == DOWN:
-            return
-        self.next_direction = UP
+        return self.queueDirection(UP)
 
 
     def moveDown(self):
-        if self.direction == UP:
-            return
-        self.next_direction = DOWN
+        return self.queueDirection(DOWN)
 
 
     def moveLeft(self):
-        if self.direction == RIGHT:
-            return
-        self.next_direction = LEFT
+        return self.queueDirection(LEFT)
 
 
     def moveRight(self):
-        if self.direction == LEFT:
-            return
-        self.next_direction = RIGHT
+        return self.queueDirection(RIGHT)
 
 
-    def start(self):
+    def isWall(self, x, y):
+        return self.walls >> (x * self.height + y) & 1
+
+
+    def start(self, maze=None):
+        """
+        Start a new game.
+
+        :param mazes.Maze maze: maze to play in. Mazes made for another arena size are ignored
+        """
+        self.walls = maze.walls if maze is not None and maze.fits(self.width, self.height) else 0
         self.reset()
 
         x, y = self.position
@@ -767,12 +1206,14 @@ class GameGrid(qw.QWidget):
     def reset(self):
         self.direction = RIGHT
         self.next_direction = RIGHT
+        self.input_queue.clear()
 
         self.position = (self.width / 2, self.height / 2)
         self.length = self.data.snake_length
 
         self.draw_snake = True
 
+        self.apple = None
         self.bonus_blocks = []
 
         for column in self.grid:
@@ -781,6 +1222,9 @@ class GameGrid(qw.QWidget):
 
 
     def freeBlocks(self, dimensions=(1,1)):
+        walls = self.walls
+        height = self.height
+
         free_blocks = []
         if dimensions != (1,1):
             max_columns = len(self.grid) - dimensions[0] + 1
@@ -788,8 +1232,18 @@ class GameGrid(qw.QWidget):
 
             free_block_set = set([Block.FREE])
 
+            # wall bits covered by the dimensions at 0, 0. Shifted to test any other position
+            #
+            area = 0
+            for i in range(dimensions[0]):
+                for j in range(dimensions[1]):
+                    area |= 1 << (i * height + j)
+
             for column_index in range(max_columns):
                 for row_index in range(max_rows):
+                    if walls & (area << (column_index * height + row_index)):
+                        continue
+
                     blocks = set([])
                     for i in range(dimensions[0]):
                         for j in range(dimensions[1]):
@@ -800,21 +1254,45 @@ class GameGrid(qw.QWidget):
 
         else:
             for column_index, column in enumerate(self.grid):
+                column_walls = walls >> (column_index * height)
                 for row_index, block in enumerate(column.rows):
-                    if block.type == Block.FREE:
+                    if block.type == Block.FREE and not column_walls >> row_index & 1:
                         free_blocks.append((column_index, row_index))
 
         return free_blocks
 
 
-    def addApple(self):
+    def randomFreeBlock(self, attempts=16):
+        """
+        Pick a free block at random. Random cells are tried first, which rarely miss while the
+        arena is mostly empty, before falling back to listing every free block.
+
+        :return: (x, y)
+        """
+        walls = self.walls
+        cells = self.width * self.height
+
+        for _ in range(attempts):
+            cell = random.randrange(cells)
+            if walls >> cell & 1:
+                continue
+
+            x, y = divmod(cell, self.height)
+            if self.grid[x][y].type == Block.FREE:
+                return x, y
+
         free_blocks = self.freeBlocks()
-        random_index = random.randint(0, len(free_blocks)-1)
-        x, y = free_blocks[random_index]
+        return free_blocks[random.randint(0, len(free_blocks)-1)]
+
+
+    def addApple(self):
+        x, y = self.randomFreeBlock()
         block = self.grid[x][y]
         block.type = Block.APPLE
         block.food = True
 
+        self.apple = (x, y)
+
 
     def addBonus(self):
         free_blocks = self.freeBlocks((2, 1))
@@ -842,13 +1320,24 @@ class GameGrid(qw.QWidget):
         self.bonus_blocks = []
 
 
+    @tracing.traced(tracing.TICK)
     def update(self):
+        # apply one queued turn per tick
+        #
+        queued_time = None
+        if self.input_queue:
+            self.next_direction, queued_time = self.input_queue.popleft()
+
         x, y = self.position
         current_block = self.grid[x][y]
 
         x, y = self.nextPositions(x, y)
         next_block = self.grid[x][y]
 
+        if self.walls >> (x * self.height + y) & 1:
+            self.emit(GameGrid.COLLISION_SIGNAL)
+            return False
+
         x2, y2 = self.nextPositions(x, y)
         future_block = self.grid[x2][y2]
 
@@ -910,7 +1399,12 @@ class GameGrid(qw.QWidget):
         tail.type = Block.TAIL
         tail.direction = body_parts[keys[1]].direction
 
-        self.repaint()
+        if queued_time is not None:
+            latency = (tracing.monotonic() - queued_time) * 1000.0
+            self.input_latency.add(latency)
+            self.data.tracer.counter('input latency', tracing.TICK, latency=latency)
+
+        game.markDirty(self)
 
 
     def nextPositions(self, x, y):
@@ -947,33 +1441,31 @@ class GameGrid(qw.QWidget):
             print line
 
 
+    @tracing.traced(tracing.PAINT)
     def paintEvent(self, _):
-        painter = qw.QStylePainter(self)
-        option = qw.QStyleOption()
-        option.initFrom(self)
-
-        for i in range(self.width):
-            for j in range(self.height):
-                block = self.grid[i][j]
-                if block.type is Block.FREE:
-                    continue
-
-                if self.draw_snake is False and block.type in Block.BODY_PARTS:
-                    continue
-
-                block_value = block.draw()
-
-                block_x = (i * 4) + 4
-                block_y = (j * 4) + 12
-
-                check = 1
-                for gx in range(4):
-                    for gy in range(4):
-                        if block_value & check:
-                            paintPixel(painter,
-                                       block_x + gy,
-                                       block_y + gx)
-                        check <<= 1
+        with lcd.paint(self) as painter:
+            for i in range(self.width):
+                for j in range(self.height):
+                    block = self.grid[i][j]
+                    if block.type is Block.FREE:
+                        continue
+
+                    if self.draw_snake is False and block.type in Block.BODY_PARTS:
+                        continue
+
+                    block_value = block.draw()
+
+                    block_x = (i * 4) + 4
+                    block_y = (j * 4) + 12
+
+                    check = 1
+                    for gx in range(4):
+                        for gy in range(4):
+                            if block_value & check:
+                                paintPixel(painter,
+                                           block_x + gy,
+                                           block_y + gx)
+                            check <<= 1
 
     
     def __del__(self):
@@ -996,6 +1488,7 @@ class ScoreBoard(qw.QWidget):
         self.numbers = dict([(str(i), ScoreBoard.NUMBERS[i]) for i in range(10)])
         
         self.score_counter = 0
+        self.layer = lcd.Layer()
         
         
     def reset(self):
@@ -1004,18 +1497,14 @@ class ScoreBoard(qw.QWidget):
 
     def add(self, value):
         self.score_counter += value
-        self.repaint()
+        game.markDirty(self)
 
 
     def asString(self):
         return '{:04d}'.format(self.score_counter)
         
     
-    def paintEvent(self, _):
-        painter = qw.QStylePainter(self)
-        option = qw.QStyleOption()
-        option.initFrom(self)
-
+    def paintScore(self, painter):
         score_str = self.asString()
 
         for index in range(4):
@@ -1029,6 +1518,11 @@ class ScoreBoard(qw.QWidget):
                         paintPixel(painter, j + grid_offset + 2, i + 2)
                     check >>= 1
 
+
+    @tracing.traced(tracing.PAINT)
+    def paintEvent(self, _):
+        self.layer.paint(self, self.score_counter, self.paintScore)
+
                         
     def __del__(self):
         print 'deleting scoreboard'
@@ -1051,6 +1545,7 @@ class BonusCountdown(qw.QWidget):
         self.numbers = dict([(str(i), BonusCountdown.NUMBERS[i]) for i in range(10)])
 
         self.countdown = 0
+        self.layer = lcd.Layer()
 
 
     def reset(self):
@@ -1059,17 +1554,13 @@ class BonusCountdown(qw.QWidget):
 
     def update(self):
         self.countdown -= 1
-        self.repaint()
+        game.markDirty(self)
 
         if self.countdown == 0:
             self.emit(BonusCountdown.COUNTDOWN_END_SIGNAL)
 
 
-    def paintEvent(self, _):
-        painter = qw.QStylePainter(self)
-        option = qw.QStyleOption()
-        option.initFrom(self)
-
+    def paintCountdown(self, painter):
         countdown_str = '{:02d}'.format(self.countdown)
 
         for index in range(2):
@@ -1083,6 +1574,105 @@ class BonusCountdown(qw.QWidget):
                         paintPixel(painter, j + grid_offset + 2, i + 2)
                     check >>= 1
 
+
+    @tracing.traced(tracing.PAINT)
+    def paintEvent(self, _):
+        self.layer.paint(self, self.countdown, self.paintCountdown)
+
+
+class PerfHud(qw.QWidget):
+    """
+    Debug overlay showing tick rate, tick and paint times, painter calls per frame, timer
+    drift, input latency and cache hit rates. Text is refreshed twice a second from rolling
+    stats.
+    """
+
+    REFRESH_INTERVAL = 500
+
+    def __init__(self, parent):
+        qw.QWidget.__init__(self, parent)
+
+        self.data = parent.data
+        self.arena = parent
+
+        self.setFixedWidth(self.data.width)
+        self.setFixedHeight(self.data.height)
+        self.setAttribute(qc.Qt.WA_TransparentForMouseEvents)
+
+        self.text = ()
+        self.images = []
+        self.layer = lcd.Layer()
+
+        self._painter_calls = 0
+        self._frames = 0
+
+        self._refresh_timer = qc.QTimer(self)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+
+    def lines(self):
+        """Current stats as lines of text."""
+        arena = self.arena
+
+        interval = arena.tick_intervals.mean
+        lines = ['TPS {:.1f}'.format(1000.0 / interval if interval else 0.0),
+                 'TICK {:.2f}MS'.format(arena.tick_times.mean),
+                 'DRIFT {:+.1f}MS'.format(arena.tick_drift.mean),
+                 'INPUT {:.1f}MS'.format(arena.grid.input_latency.mean)]
+
+        # painter calls averaged over the frames since the last refresh
+        #
+        scheduler = self.data.scheduler
+        if scheduler is not None:
+            frames = scheduler.frames - self._frames
+            calls = lcd.PaintStats.painter_calls - self._painter_calls
+            self._frames = scheduler.frames
+            self._painter_calls = lcd.PaintStats.painter_calls
+
+            lines.append('PAINT {:.2f}MS'.format(scheduler.frame_times.mean))
+            lines.append('CALLS {}'.format(calls // frames if frames else 0))
+
+        for cache_stats in stats.caches.values():
+            lines.append('{} {:.0f}%'.format(cache_stats.name.upper(), cache_stats.rate * 100))
+
+        return lines
+
+
+    @qc.Slot()
+    def refresh(self):
+        # stats text changes every refresh, keep it out of the font cache
+        #
+        self.text = tuple(self.lines())
+        self.images = [font.small_font.getImage(line, cache=False) for line in self.text]
+        game.markDirty(self)
+
+
+    def showEvent(self, event):
+        super(PerfHud, self).showEvent(event)
+        self.refresh()
+        self._refresh_timer.start(PerfHud.REFRESH_INTERVAL)
+
+
+    def hideEvent(self, event):
+        super(PerfHud, self).hideEvent(event)
+        self._refresh_timer.stop()
+
+
+    def paintText(self, painter):
+        line_height = font.small_font.height + 1
+        paint_area = [5, 12, self.data.screen_width - 10, line_height]
+        for image in self.images:
+            if paint_area[1] + line_height > self.data.screen_height - 3:
+                break
+
+            image.paint(painter, paint_area, False, paintPixel, ALIGN_LEFT)
+            paint_area[1] += line_height
+
+
+    @tracing.traced(tracing.PAINT)
+    def paintEvent(self, _):
+        self.layer.paint(self, self.text, self.paintText)
+
 # ------------------------------------------------------------------------------------------------ #
         
 class Row(object):
@@ -1171,11 +1761,19 @@ class Block(object):
 #--------------------------------------------------------------------------------------------------#
 
 class HighScores(ScrollArea):
+    SCORES_LOADED_SIGNAL = qc.SIGNAL('scoresLoaded(PyObject)')
+    SCORES_SHARED_SIGNAL = qc.SIGNAL('scoresShared(PyObject)')
+
+    PAGE_SIZE = 10
+
     def __init__(self, data):
         super(HighScores, self).__init__(data, 'High Scores')
 
-        self.data.loadScores()
-        self.initialize()
+        # leaderboard paging
+        #
+        self._speed = None
+        self._last_key = None
+        self._exhausted = False
 
         self._edit_mode = False
 
@@ -1186,16 +1784,108 @@ class HighScores(ScrollArea):
         self._edit_index = 0
         self._edit_indices = [0, None, None]
 
+        self.initialize()
+
+        # the legacy score file is only read to seed an empty leaderboard
+        #
+        self.connect(self, HighScores.SCORES_LOADED_SIGNAL, self._scoresLoaded)
+        self.data.loadScores(lambda loaded: self.emit(HighScores.SCORES_LOADED_SIGNAL, loaded))
+
+        self.connect(self, HighScores.SCORES_SHARED_SIGNAL, self._scoresShared)
+        self._syncScores()
+
 
     def initialize(self):
-        """ Setup the menu with given items and signal connections. Should be pairs of
-         text:signal_id.
         """
-        items = []
-        for position, (name, score) in enumerate(self.data.scores):
-            items.append(HighScoreItem(position, name, score))
+        Setup the score list for the current speed board. Only the first page is read, later
+        pages are read as the list is scrolled.
+        """
+        self._speed = self.data.snake_speed
+        self._last_key = None
+        self._exhausted = False
+
+        super(HighScores, self).initialize([])
+        self._loadPage()
+
+        # pad short boards with blank scores
+        #
+        blank_items = []
+        for position in range(len(self.items), self.data.board_size):
+            blank_items.append(HighScoreItem(position, '---', 0, blank=True))
+        self.addItems(blank_items)
+
+        self.data.scores = [(item.name, item.score) for item in self.items[:self.data.board_size]]
+
+
+    def _loadPage(self):
+        """Read the next page of the board and append it to the list."""
+        if self._exhausted:
+            return
+
+        rows = self.data.board().top(self._speed, HighScores.PAGE_SIZE, self._last_key)
+        if len(rows) < HighScores.PAGE_SIZE:
+            self._exhausted = True
+        if not rows:
+            return
+
+        row_id, _, score = rows[-1]
+        self._last_key = (score, row_id)
+
+        position = len(self.items)
+        self.addItems([HighScoreItem(position + i, name, score)
+                       for i, (_, name, score) in enumerate(rows)])
+
+
+    def _removeItems(self, start):
+        """Remove items from the given index to the end of the list."""
+        del self.items[start:]
+        del self.item_offsets[start:]
+
+
+    def totalItems(self):
+        return max(len(self.items), self.data.board().count(self._speed))
+
+
+    def _scoresLoaded(self, loaded):
+        """
+        Import scores read from the legacy score file into the default board, if the
+        leaderboard has no scores yet.
+
+        :param list loaded: list of (name, score)
+        """
+        board = self.data.board()
+        if board.count():
+            return
+
+        rows = [(NORMAL, name, score) for name, score in loaded if score > 0]
+        if not rows:
+            return
+
+        board.addMany(rows)
+
+        if not self._edit_mode and not self.data.new_high_score:
+            self.initialize()
+            game.markDirty(self)
+
+
+    def _syncScores(self):
+        """Pick up scores other sessions added to the shared log."""
+        self.data.syncScores(lambda records: self.emit(HighScores.SCORES_SHARED_SIGNAL, records))
+
+
+    def _scoresShared(self, records):
+        """
+        Merge scores read from the shared log into the leaderboard. Scores already on the
+        board, including ones this session shared, are skipped.
+
+        :param list records: shared score records
+        """
+        if not self.data.board().merge(records):
+            return
 
-        return super(HighScores, self).initialize(items)
+        if not self._edit_mode and not self.data.new_high_score:
+            self.initialize()
+            game.markDirty(self)
 
 
     def select(self, selected_item_index):
@@ -1222,6 +1912,13 @@ class HighScores(ScrollArea):
         """
         super(ScrollArea, self).start()
 
+        self._syncScores()
+
+        # speed changed since the list was built, show the matching board
+        #
+        if self._speed != self.data.snake_speed:
+            self.initialize()
+
         # if no new high score, return
         #
         if not self.data.new_high_score:
@@ -1229,36 +1926,39 @@ class HighScores(ScrollArea):
 
         # test if new high score should be in high score list
         #
-        position = -1
-        for i, (_, score) in enumerate(self.data.scores):
-            if self.data.new_high_score > score:
-                position = i
-                break
+        score = self.data.new_high_score
+        position = self.data.board().position(self._speed, score)
+
+        # reset high scores
+        #
+        self.data.new_high_score = None
 
         # if new high score is lower than lowest high score, return
         #
-        if position == -1:
+        if position >= self.data.board_size:
             return
 
-        # select score item
+        # read the list past the new score, so the next page starts after it
         #
-        self.selected_item_index = position
-        self._scroll()
+        while len(self.items) <= position and not self._exhausted:
+            self._loadPage()
 
-        # insert new score
+        # insert new score, dropping a blank item to keep the board length
         #
-        self.data.scores.insert(position, ('---', self.data.new_high_score))
-        self.data.scores = self.data.scores[:-1]
+        items = self.items[position:]
+        if items and items[-1].blank:
+            items = items[:-1]
 
-        # shift scores and names to match high score list
-        #
-        for i, (name, score) in enumerate(self.data.scores):
-            self.items[i].score = score
-            self.items[i].name = name
+        self._removeItems(position)
+        self.addItems([HighScoreItem(position, '---', score)] + items)
 
-        # reset high scores
+        for i in range(position + 1, len(self.items)):
+            self.items[i].position = i
+
+        # select score item
         #
-        self.data.new_high_score = None
+        self.selected_item_index = position
+        self._scroll()
 
         # start edit mode
         #
@@ -1284,11 +1984,16 @@ class HighScores(ScrollArea):
             elif key in (qc.Qt.Key_Return, qc.Qt.Key_Enter):
                 self.next_edit()
 
-            self.repaint()
+            game.markDirty(self)
             return
 
         super(HighScores, self).keyPressEvent(event)
 
+        # read the next page before the selection reaches the end of the list
+        #
+        if self.selected_item_index >= len(self.items) - 2 and not self._exhausted:
+            self._loadPage()
+
 
     @qc.Slot()
     def _toggleEdit(self):
@@ -1302,7 +2007,7 @@ class HighScores(ScrollArea):
             return
 
         self._edit_item._edit_paint = not self._edit_item._edit_paint
-        self.repaint()
+        game.markDirty(self)
 
 
     def start_edit(self):
@@ -1364,7 +2069,10 @@ class HighScores(ScrollArea):
         """
         # store new name and score
         #
-        self.data.scores[self.selected_item_index] = (self._edit_item.name, self._edit_item.score)
+        name, score = self._edit_item.name, self._edit_item.score
+        uid = self.data.shareScore(self._speed, name, score)
+        self.data.board().add(self._speed, name, score, uid)
+        self.data.scores = [(item.name, item.score) for item in self.items[:self.data.board_size]]
 
         # reset edit variables
         #
@@ -1392,7 +2100,7 @@ class HighScores(ScrollArea):
                 name += intToAlpha(i, upper=True)
 
         self._edit_item.name = name
-        self.repaint()
+        game.markDirty(self)
 
 
 class HighScoreItem(object):
@@ -1401,9 +2109,10 @@ class HighScoreItem(object):
     blank_image = font.small_font.getImage('   ')
 
 
-    def __init__(self, position, name, score):
-        self.images = [None, None, None]
+    def __init__(self, position, name, score, blank=False):
+        self._images = [None, None, None]
         self.height = 12
+        self.blank = blank
 
         self._name = None
         self._position = None
@@ -1430,8 +2139,7 @@ class HighScoreItem(object):
                 name += 'A'
 
         self._name = name.upper()
-
-        self.images[2] = font.small_font.getImage(self.name)
+        self._images[2] = None
 
 
     @property
@@ -1442,7 +2150,7 @@ class HighScoreItem(object):
     @score.setter
     def score(self, score):
         self._score = int(score)
-        self.images[1] = font.small_font.getImage('{:04d}'.format(self.score))
+        self._images[1] = None
 
 
     @property
@@ -1453,21 +2161,54 @@ class HighScoreItem(object):
     @positions.setter
     def position(self, position):
         """
-        Set the position (1st, 2nd, 3rd etc) of the high score item. Creates the required image.
+        Set the position (1st, 2nd, 3rd etc) of the high score item. The image is recreated
+        the next time the item is painted.
 
-        :param int position: position value (1 - 10)
+        :param int position: 0 based position on the board
 
         :return:
         """
-        self._position = min(max(0, int(position)), 10)
-        self.images[0] = font.small_font.getImage(HighScoreItem.score_positions[self.position])
+        self._position = max(0, int(position))
+        self._images[0] = None
+
+
+    @property
+    def images(self):
+        """Position, score and name images. Built on first use, so unseen rows cost nothing."""
+        images = self._images
+        if images[0] is None:
+            images[0] = font.small_font.getImage(HighScoreItem.ordinal(self.position))
+        if images[1] is None:
+            images[1] = font.small_font.getImage('{:04d}'.format(self.score))
+        if images[2] is None:
+            images[2] = font.small_font.getImage(self.name)
+        return images
+
+
+    def release(self):
+        self._images = [None, None, None]
+
+
+    @staticmethod
+    def ordinal(position):
+        """Board position as text, 1st, 2nd, 3rd etc."""
+        if position < len(HighScoreItem.score_positions):
+            return HighScoreItem.score_positions[position]
+
+        number = position + 1
+        if 10 <= number % 100 <= 20:
+            suffix = 'th'
+        else:
+            suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+
+        return '{}{}'.format(number, suffix)
 
 
     def paint(self, painter, paint_area, invert=False):
         """
         Paints on row of the high score item. Position -> Score -> Name.
 
-        :param QPainter painter: QPainter object to paint with
+        :param lcd.LcdRaster painter: raster to paint on
         :param list paint_area: the area to paint in (x, y, width, height)
         :param bool invert: if true pixels are inverted
 
@@ -0,0 +1,105 @@
+"""
+Cheap rolling statistics for the performance hud. Every update is O(1), so stats can be
+collected all the time and only read when the hud is shown.
+"""
+from collections import deque, OrderedDict
+
+from majic_tools.maya.apps.games.snake.tracing import monotonic
+
+# ------------------------------------------------------------------------------------------------ #
+
+class RollingWindow(object):
+    """The last size samples of a value, with a running total for the mean."""
+
+    def __init__(self, size=60):
+        self._samples = deque(maxlen=size)
+        self._total = 0.0
+
+
+    def add(self, value):
+        samples = self._samples
+        if len(samples) == samples.maxlen:
+            self._total -= samples[0]
+        samples.append(value)
+        self._total += value
+
+
+    def clear(self):
+        self._samples.clear()
+        self._total = 0.0
+
+
+    @property
+    def last(self):
+        return self._samples[-1] if self._samples else 0.0
+
+
+    @property
+    def mean(self):
+        if not self._samples:
+            return 0.0
+        return self._total / len(self._samples)
+
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class Timer(object):
+    """Times a with block in milliseconds into a rolling window."""
+
+    __slots__ = ('window', 'start')
+
+    def __init__(self, window):
+        self.window = window
+        self.start = 0.0
+
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+
+    def __exit__(self, *_):
+        self.window.add((monotonic() - self.start) * 1000.0)
+
+# ------------------------------------------------------------------------------------------------ #
+
+class CacheStats(object):
+    """Hit and miss counts of a named cache."""
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+
+    def hit(self):
+        self.hits += 1
+
+
+    def miss(self):
+        self.misses += 1
+
+
+    @property
+    def rate(self):
+        """Hit rate from 0 to 1."""
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+
+caches = OrderedDict()
+
+
+def cacheStats(name):
+    """Get the stats of a cache by name, creating them on first use."""
+    cache_stats = caches.get(name)
+    if cache_stats is None:
+        cache_stats = caches[name] = CacheStats(name)
+    return cache_stats
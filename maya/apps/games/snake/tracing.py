@@ -0,0 +1,232 @@
+"""
+Opt-in frame tracing. Timed spans are kept in a ring buffer and can be exported as Chrome
+trace-event json, to be opened in chrome://tracing or Perfetto.
+
+    from majic_tools.maya.apps.games.snake import tracing
+    tracing.tracer.enable()
+    ...
+    tracing.tracer.export('C:/temp/snake_trace.json')
+
+Tracing can also be enabled at start up by setting $SNAKE_TRACE. While disabled, traced
+functions cost a single attribute check.
+"""
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+# ------------------------------------------------------------------------------------------------ #
+
+TRACE_ENV = 'SNAKE_TRACE'
+
+TICK = 'tick'
+PAINT = 'paint'
+LEVEL = 'level'
+IO = 'io'
+TIMER = 'timer'
+
+_SPAN = 'X'
+_INSTANT = 'i'
+_COUNTER = 'C'
+_METADATA = 'M'
+
+# ------------------------------------------------------------------------------------------------ #
+
+def _clock():
+    """Monotonic clock in seconds. Python 2 has none, so fall back to Qt's."""
+    perf_counter = getattr(time, 'perf_counter', None)
+    if perf_counter is not None:
+        return perf_counter
+
+    import PySide2.QtCore as qc
+
+    elapsed_timer = qc.QElapsedTimer()
+    elapsed_timer.start()
+    return lambda: elapsed_timer.nsecsElapsed() * 1e-9
+
+
+class Span(object):
+    """Context manager timing a block of code into the tracer."""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args=None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+
+    def __exit__(self, *_):
+        end = self.tracer.clock()
+        self.tracer.record(self.name, self.category, self.start, end - self.start, self.args)
+
+
+class _NullSpan(object):
+    """Span used while tracing is disabled. Does nothing."""
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+monotonic = _clock()
+
+
+class Tracer(object):
+    """Collects spans, instants and counters in a fixed size ring buffer."""
+
+    def __init__(self, size=100000):
+        self.enabled = False
+        self.clock = monotonic
+
+        self._events = deque(maxlen=size)
+        self._origin = self.clock()
+
+
+    @property
+    def size(self):
+        return self._events.maxlen
+
+
+    def enable(self, size=None):
+        """Start recording. Optionally resize the ring buffer, dropping recorded events."""
+        if size is not None and size != self.size:
+            self._events = deque(maxlen=size)
+        self.enabled = True
+
+
+    def disable(self):
+        self.enabled = False
+
+
+    def clear(self):
+        self._events.clear()
+
+
+    def span(self, name, category, args=None):
+        """Time a with block. Returns a shared no-op span while disabled."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+
+    def record(self, name, category, start, duration, args=None):
+        """Record a finished span. start and duration are in clock seconds."""
+        self._events.append((_SPAN, name, category, start, duration,
+                             threading.current_thread().ident, args))
+
+
+    def instant(self, name, category, args=None):
+        if not self.enabled:
+            return
+        self._events.append((_INSTANT, name, category, self.clock(), 0.0,
+                             threading.current_thread().ident, args))
+
+
+    def counter(self, name, category, **values):
+        """Record counter values, drawn as a graph by the trace viewer."""
+        if not self.enabled:
+            return
+        self._events.append((_COUNTER, name, category, self.clock(), 0.0,
+                             threading.current_thread().ident, values))
+
+
+    def events(self):
+        """Recorded events, oldest first."""
+        return list(self._events)
+
+
+    def toChromeTrace(self):
+        """Convert recorded events to a Chrome trace-event dict."""
+        pid = os.getpid()
+
+        trace_events = []
+        thread_ids = set()
+        for phase, name, category, start, duration, tid, args in list(self._events):
+            thread_ids.add(tid)
+
+            event = {'name': name,
+                     'cat': category,
+                     'ph': phase,
+                     'ts': (start - self._origin) * 1e6,
+                     'pid': pid,
+                     'tid': tid}
+
+            if phase == _SPAN:
+                event['dur'] = duration * 1e6
+            elif phase == _INSTANT:
+                event['s'] = 't'
+
+            if args:
+                event['args'] = args
+
+            trace_events.append(event)
+
+        # name threads so the ui thread is easy to find
+        #
+        threads = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for tid in thread_ids:
+            trace_events.append({'name': 'thread_name',
+                                 'ph': _METADATA,
+                                 'pid': pid,
+                                 'tid': tid,
+                                 'args': {'name': threads.get(tid, str(tid))}})
+
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+    def export(self, filepath):
+        """Write recorded events as Chrome trace-event json."""
+        with open(filepath, 'w') as f:
+            json.dump(self.toChromeTrace(), f)
+
+
+tracer = Tracer()
+if os.environ.get(TRACE_ENV):
+    tracer.enable()
+
+# ------------------------------------------------------------------------------------------------ #
+
+def traced(category, name=None):
+    """
+    Decorator timing every call of a function into the global tracer. Methods are named after
+    the class of the instance, so overridden methods show up separately.
+
+    :param str category: trace category, TICK, PAINT etc
+    :param str name: span name. Defaults to Class.method or the function name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            span_name = name
+            if span_name is None:
+                span_name = function.__name__
+                if args and hasattr(args[0], function.__name__):
+                    span_name = '{}.{}'.format(type(args[0]).__name__, function.__name__)
+
+            start = tracer.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(span_name, category, start, tracer.clock() - start)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,386 @@
+"""
+Bulk archive of component data. Many components are stored in one file rather than a file
+each, so saving or loading a whole rig costs one open and one fsync rather than thousands:
+
+    archive.saveData(filepath, [component.data for component in Component.findAll()])
+    archive.loadData(filepath, [component.data for component in Component.findAll()])
+
+File layout, integers little endian:
+
+    header      MAGIC, 8 bytes
+    records     one per component, at 8 byte aligned offsets
+    index       JSON {name: [offset, size]}
+    footer      index offset and size, 8 bytes each, then END, 8 bytes
+
+A record is a 4 byte header size, a JSON header holding the plain values and a description of
+the columns, then the columns: numeric lists, such as points or weights, packed as arrays of
+doubles or 32 bit ints. Lists holding ints too big for 32 bits stay in the JSON header, so they
+load exactly. Lists of equal length rows, such as [[x, y, z], ...], are packed flat
+with their shape. Columns load straight from the bytes rather than through JSON.
+
+Records are written as they come, only the index is kept in memory. Readers map the file and
+decode just the records asked for.
+
+Archives are append only. Writing to an existing archive appends the new records and a new
+index, which replaces the previous one. A record written again under the same name supersedes
+the old one, which stays as dead space until the archive is compacted.
+
+If a writer dies before writing its index, readers fall back to the last complete index in the
+file, so the archive reads as it was before that write.
+"""
+import array
+import json
+import mmap
+import numbers
+import os
+import struct
+import sys
+
+# ------------------------------------------------------------------------------------------------ #
+
+MAGIC = b'MJCARCH1'
+END = b'MJCAEND1'
+
+FLOAT = 'd'
+INT = 'i'
+
+# numeric lists shorter than this are kept in the JSON header
+#
+MIN_COLUMN_SIZE = 8
+
+_ALIGN = 8
+_INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+_RECORD_HEADER = struct.Struct('<I')
+_FOOTER = struct.Struct('<QQ8s')
+
+# ------------------------------------------------------------------------------------------------ #
+
+class ArchiveError(Exception):
+    pass
+
+# ------------------------------------------------------------------------------------------------ #
+
+def _toBytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _fromBytes(typecode, data):
+    values = array.array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _typecode(values):
+    """Array typecode able to hold all values, or None if they aren't all numbers."""
+    typecode = INT
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, numbers.Real):
+            return None
+        if not isinstance(value, numbers.Integral):
+            typecode = FLOAT
+        elif not _INT_RANGE[0] <= value <= _INT_RANGE[1]:
+            # neither an int32 nor, past 2 ** 53, a double holds it exactly
+            #
+            return None
+    return typecode
+
+
+def _column(value):
+    """
+    (typecode, shape, flat values) of a numeric list worth packing, else None. Ints mixed
+    with floats are packed, and load, as floats.
+    """
+    if not isinstance(value, (list, tuple)) or len(value) < 1:
+        return None
+
+    if isinstance(value[0], (list, tuple)):
+        width = len(value[0])
+        for row in value:
+            if not isinstance(row, (list, tuple)) or len(row) != width:
+                return None
+        flat = [item for row in value for item in row]
+        shape = [len(value), width]
+    else:
+        flat = value
+        shape = [len(value)]
+
+    if len(flat) < MIN_COLUMN_SIZE:
+        return None
+
+    typecode = _typecode(flat)
+    if typecode is None:
+        return None
+    return typecode, shape, flat
+
+
+def encodeRecord(values):
+    """Bytes of a record holding {key: value}. Values must be JSON serializable."""
+    plain = {}
+    columns = []
+    blocks = []
+    for key in sorted(values):
+        column = _column(values[key])
+        if column is None:
+            plain[key] = values[key]
+            continue
+
+        typecode, shape, flat = column
+        data = _toBytes(array.array(typecode, flat))
+        columns.append([key, typecode, shape, len(data)])
+        blocks.append(data)
+
+    header = json.dumps({'values': plain, 'columns': columns}, sort_keys=True,
+                        separators=(',', ':')).encode('utf-8')
+
+    parts = [_RECORD_HEADER.pack(len(header)), header]
+    size = _RECORD_HEADER.size + len(header)
+    for data in blocks:
+        padding = -size % _ALIGN
+        parts.append(b'\0' * padding)
+        parts.append(data)
+        size += padding + len(data)
+
+    return b''.join(parts)
+
+
+def decodeRecord(buffer, offset=0):
+    """{key: value} of the record starting at offset of a buffer, such as an mmap."""
+    header_size, = _RECORD_HEADER.unpack_from(buffer, offset)
+    position = offset + _RECORD_HEADER.size
+    header = json.loads(buffer[position:position + header_size].decode('utf-8'))
+    position += header_size
+
+    values = header['values']
+    for key, typecode, shape, size in header['columns']:
+        position += -(position - offset) % _ALIGN
+        column = _fromBytes(str(typecode), buffer[position:position + size]).tolist()
+        position += size
+
+        if len(shape) == 2:
+            width = shape[1]
+            column = [column[index:index + width] for index in range(0, len(column), width)]
+        values[key] = column
+
+    return values
+
+# ------------------------------------------------------------------------------------------------ #
+
+class ArchiveReader(object):
+    """Random access to the records of an archive, through a memory map of the file."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        self._file = open(filepath, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) + _FOOTER.size:
+            self._file.close()
+            raise ArchiveError("'{}' is not an archive".format(filepath))
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ArchiveError("'{}' is not an archive".format(filepath))
+
+        # True if the last write didn't finish, and the index before it was read instead
+        #
+        self.recovered = False
+
+        footer = size - _FOOTER.size
+        self.index = self._readIndex(footer)
+        while self.index is None:
+            footer = self._map.rfind(END, len(MAGIC), footer + _FOOTER.size - 1)
+            if footer == -1:
+                self.close()
+                raise ArchiveError("'{}' is incomplete, it has no index".format(filepath))
+
+            footer -= _FOOTER.size - len(END)
+            self.index = self._readIndex(footer)
+            self.recovered = True
+
+
+    def _readIndex(self, footer):
+        """Index of the footer at an offset, or None if there is no valid footer there."""
+        if footer < len(MAGIC):
+            return None
+
+        index_offset, index_size, end = _FOOTER.unpack_from(self._map, footer)
+        if end != END or index_offset < len(MAGIC) or index_offset + index_size != footer:
+            return None
+
+        try:
+            index = json.loads(self._map[index_offset:footer].decode('utf-8'))
+        except ValueError:
+            return None
+        if not isinstance(index, dict):
+            return None
+
+        self.index_offset = index_offset
+        return index
+
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def names(self):
+        return sorted(self.index)
+
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def read(self, name):
+        """
+        {key: value} of a record.
+
+        :raises KeyError: if the archive has no record of that name
+        """
+        offset, _ = self.index[name]
+        return decodeRecord(self._map, offset)
+
+
+    def readBytes(self, name):
+        """Raw bytes of a record."""
+        offset, size = self.index[name]
+        return self._map[offset:offset + size]
+
+
+class ArchiveWriter(object):
+    """
+    Streams records to an archive. The index is written when the writer is closed, records
+    written before an error are kept.
+    """
+
+    def __init__(self, filepath, append=True):
+        """
+        :param str filepath: archive file
+        :param bool append: add to the archive if it exists, rather than replacing it
+        """
+        self.filepath = filepath
+        self.index = {}
+
+        if append and os.path.isfile(filepath) and os.path.getsize(filepath):
+            with ArchiveReader(filepath) as reader:
+                self.index = reader.index
+            self._file = open(filepath, 'ab')
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(filepath, 'wb')
+            self._file.write(MAGIC)
+
+        self._position = self._file.tell()
+
+
+    def _pad(self):
+        padding = -self._position % _ALIGN
+        if padding:
+            self._file.write(b'\0' * padding)
+            self._position += padding
+
+
+    def write(self, name, values):
+        """Write a record of {key: value}, replacing any earlier record of that name."""
+        self.writeBytes(name, encodeRecord(values))
+
+
+    def writeBytes(self, name, record):
+        """Write a record already encoded, as given by encodeRecord or readBytes."""
+        self._pad()
+        self.index[name] = [self._position, len(record)]
+        self._file.write(record)
+        self._position += len(record)
+
+
+    def close(self):
+        if self._file is None:
+            return
+
+        self._pad()
+        index = json.dumps(self.index, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self._file.write(index)
+        self._file.write(_FOOTER.pack(self._position, len(index), END))
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def compact(filepath):
+    """Rewrite an archive without superseded records and old indexes."""
+    temp_filepath = filepath + '.tmp'
+
+    with ArchiveReader(filepath) as reader:
+        with ArchiveWriter(temp_filepath, append=False) as writer:
+            for name in reader.names():
+                writer.writeBytes(name, reader.readBytes(name))
+
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    os.rename(temp_filepath, filepath)
+
+# ------------------------------------------------------------------------------------------------ #
+
+def saveData(filepath, datas, append=True):
+    """
+    Save component data to an archive. The data is marked clean.
+
+    :param str filepath: archive file
+    :param datas: ComponentData instances
+    :param bool append: add to the archive if it exists, rather than replacing it
+    """
+    with ArchiveWriter(filepath, append) as writer:
+        for data in datas:
+            writer.write(data.name, data.toDict())
+            data.markClean()
+
+
+def loadData(filepath, datas):
+    """
+    Load component data from an archive, reading only the records of the given data.
+
+    :param str filepath: archive file
+    :param datas: ComponentData instances
+    :return: list of the data the archive had no record of
+    """
+    missing = []
+    with ArchiveReader(filepath) as reader:
+        for data in datas:
+            if data.name in reader:
+                data.loadDict(reader.read(data.name))
+            else:
+                missing.append(data)
+    return missing
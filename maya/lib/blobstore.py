@@ -0,0 +1,341 @@
+"""
+Content addressable store for component data shared between rigs. Each distinct payload is
+stored once, named by its hash, and data files become small refs into the store:
+
+    ComponentData.store = blobstore.BlobStore('/jobs/shared/blobs')
+
+Blobs are sharded by the first two characters of their hash:
+
+    <root>/<hash name>/ab/cdef0123...           blob
+    <root>/<hash name>/ab/cdef0123....refs      ref files pointing at it, one path per line
+
+Releasing a blob's last ref doesn't delete it, collect() deletes blobs no ref file points at,
+including those left behind by ref files deleted or overwritten outside of the store.
+
+Reads go through an in memory LRU cache, so data shared by many components is read once.
+Blobs and refs are changed under a lock, shared by the threads of a process and, through a lock
+file in root, by every process using the store.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from majic_tools.maya.lib import manifest
+
+# ------------------------------------------------------------------------------------------------ #
+
+REF_PREFIX = b'blobref:'
+REFS_EXTENSION = '.refs'
+LOCK_FILENAME = '.lock'
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+# seconds a blob is kept by collect after its refs last changed, as a ref file is written just
+# after its blob is put
+#
+DEFAULT_MIN_AGE = 60.0
+
+# ------------------------------------------------------------------------------------------------ #
+
+class BlobStoreError(Exception):
+    pass
+
+
+def isRef(payload):
+    return payload.startswith(REF_PREFIX)
+
+
+def refKey(payload):
+    """Key of a ref file's contents, or None if they are not a ref."""
+    if not isRef(payload):
+        return None
+    return payload[len(REF_PREFIX):].strip().decode('utf-8')
+
+
+def refPayload(key):
+    return REF_PREFIX + key.encode('utf-8') + b'\n'
+
+
+def _makeDirectory(directory):
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # made by another thread or process meanwhile
+            #
+            if not os.path.isdir(directory):
+                raise
+
+
+def _lockFile(f):
+    """Wait for an exclusive OS level lock on an open file, lockf on posix, msvcrt on Windows."""
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.lockf(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlockFile(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.lockf(f.fileno(), fcntl.LOCK_UN)
+
+
+class BlobStore(object):
+    def __init__(self, root, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param str root: store directory
+        :param int cache_size: bytes of blobs kept in memory
+        """
+        self.root = root
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+        # stats
+        #
+        self.hits = 0
+        self.misses = 0
+
+
+    def key(self, payload):
+        return '{}:{}'.format(manifest.HASH_NAME, manifest.digest(payload))
+
+
+    def blobPath(self, key):
+        hash_name, digest = key.split(':', 1)
+        return os.path.join(self.root, hash_name, digest[:2], digest[2:])
+
+
+    def has(self, key):
+        return os.path.isfile(self.blobPath(key))
+
+
+    @contextmanager
+    def _locked(self):
+        """Hold the lock of the store, between threads and between processes."""
+        with self._lock:
+            _makeDirectory(self.root)
+            with open(os.path.join(self.root, LOCK_FILENAME), 'a+') as f:
+                _lockFile(f)
+                try:
+                    yield
+                finally:
+                    _unlockFile(f)
+
+
+    def put(self, payload, ref=None):
+        """
+        Store a payload, unless the store already has it.
+
+        :param bytes payload: contents to store
+        :param str ref: path of the ref file that will point at the blob
+        :return: key of the blob
+        """
+        key = self.key(payload)
+        filepath = self.blobPath(key)
+
+        # checked, written and referenced under the lock, so collect can't delete the blob
+        # in between
+        #
+        with self._locked():
+            if not os.path.isfile(filepath):
+                _makeDirectory(os.path.dirname(filepath))
+
+                # written aside then moved, so a blob is never seen half written
+                #
+                temp_filepath = filepath + '.tmp'
+                with open(temp_filepath, 'wb') as f:
+                    f.write(payload)
+                os.rename(temp_filepath, filepath)
+
+            if ref is not None:
+                self._addRef(key, ref)
+
+        return key
+
+
+    def get(self, key):
+        """
+        Contents of a blob.
+
+        :raises BlobStoreError: if the store has no such blob
+        """
+        with self._lock:
+            payload = self._cache.get(key)
+            if payload is not None:
+                self.hits += 1
+                self._cache.pop(key)
+                self._cache[key] = payload
+                return payload
+            self.misses += 1
+
+        filepath = self.blobPath(key)
+        if not os.path.isfile(filepath):
+            raise BlobStoreError("No blob '{}' in '{}'".format(key, self.root))
+
+        with open(filepath, 'rb') as f:
+            payload = f.read()
+
+        self._cachePayload(key, payload)
+        return payload
+
+
+    def _cachePayload(self, key, payload):
+        if len(payload) > self.cache_size:
+            return
+
+        with self._lock:
+            if key in self._cache:
+                return
+
+            self._cache[key] = payload
+            self._cached_bytes += len(payload)
+            while self._cached_bytes > self.cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+
+    def clearCache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    # -------------------------------------------------------------------------------------------- #
+
+    def _refsPath(self, key):
+        return self.blobPath(key) + REFS_EXTENSION
+
+
+    def _readRefs(self, key):
+        refs_path = self._refsPath(key)
+        if not os.path.isfile(refs_path):
+            return []
+        with open(refs_path, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+
+
+    def _writeRefs(self, key, refs):
+        with open(self._refsPath(key), 'w') as f:
+            f.write(''.join(ref + '\n' for ref in refs))
+
+
+    def refs(self, key):
+        """Paths of the ref files pointing at a blob."""
+        with self._locked():
+            return self._readRefs(key)
+
+
+    def refCount(self, key):
+        return len(self.refs(key))
+
+
+    def addRef(self, key, ref):
+        with self._locked():
+            self._addRef(key, ref)
+
+
+    def _addRef(self, key, ref):
+        ref = os.path.abspath(ref)
+        refs = self._readRefs(key)
+        if ref not in refs:
+            refs.append(ref)
+            self._writeRefs(key, refs)
+
+
+    def release(self, key, ref):
+        """Remove a ref to a blob. Blobs left without refs are deleted by collect."""
+        ref = os.path.abspath(ref)
+        with self._locked():
+            refs = self._readRefs(key)
+            if ref in refs:
+                refs.remove(ref)
+                self._writeRefs(key, refs)
+
+
+    def _delete(self, key):
+        """Delete a blob and its refs. Returns the bytes freed."""
+        freed = 0
+        for filepath in (self.blobPath(key), self._refsPath(key)):
+            if os.path.isfile(filepath):
+                freed += os.path.getsize(filepath)
+                os.remove(filepath)
+
+        payload = self._cache.pop(key, None)
+        if payload is not None:
+            self._cached_bytes -= len(payload)
+
+        return freed
+
+
+    def _age(self, key):
+        """Seconds since the blob or its refs last changed."""
+        mtimes = [os.path.getmtime(filepath) for filepath in (self.blobPath(key),
+                                                               self._refsPath(key))
+                  if os.path.isfile(filepath)]
+        return time.time() - max(mtimes) if mtimes else float('inf')
+
+
+    def keys(self):
+        """Keys of every blob in the store."""
+        keys = []
+        if not os.path.isdir(self.root):
+            return keys
+
+        for hash_name in os.listdir(self.root):
+            hash_directory = os.path.join(self.root, hash_name)
+            if not os.path.isdir(hash_directory):
+                continue
+
+            for shard in os.listdir(hash_directory):
+                shard_directory = os.path.join(hash_directory, shard)
+                for filename in os.listdir(shard_directory):
+                    if not filename.endswith((REFS_EXTENSION, '.tmp')):
+                        keys.append('{}:{}{}'.format(hash_name, shard, filename))
+
+        return keys
+
+
+    def collect(self, min_age=DEFAULT_MIN_AGE):
+        """
+        Garbage collect: drop refs whose file is gone or no longer points at the blob, and
+        delete blobs left without refs.
+
+        :param float min_age: seconds since a blob or its refs last changed before it is
+                              collected, so blobs whose ref file is still being written are kept
+        :return: bytes freed
+        """
+        freed = 0
+        for key in self.keys():
+            with self._locked():
+                if self._age(key) < min_age:
+                    continue
+
+                refs = self._readRefs(key)
+                live = [ref for ref in refs if self._pointsAt(ref, key)]
+
+                if not live:
+                    freed += self._delete(key)
+                elif live != refs:
+                    self._writeRefs(key, live)
+
+        return freed
+
+
+    @staticmethod
+    def _pointsAt(ref, key):
+        if not os.path.isfile(ref):
+            return False
+        with open(ref, 'rb') as f:
+            return refKey(f.read(len(REF_PREFIX) + len(key) + 1)) == key
@@ -0,0 +1,208 @@
+"""
+Rig build scheduling. Components are built after the components named in their
+CTRL_DEPENDENCY tag:
+
+    graph = build.BuildGraph.fromScene()
+    errors = graph.run()
+
+A build has two stages. Component.prepare does work that doesn't touch the scene and runs on a
+thread pool, so independent components prepare in parallel. Component.build changes the scene
+and runs on the calling thread one component at a time, in dependency order.
+
+Builds are incremental. Each component gets a key, the hash of its inputHash and the keys of
+its dependencies, and run only rebuilds components whose key changed since they were last
+built, which includes everything downstream of a change.
+"""
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from multiprocessing.pool import ThreadPool
+
+from majic_tools.maya.lib import manifest
+from majic_tools.maya.lib.component import Component, ComponentError
+
+# ------------------------------------------------------------------------------------------------ #
+
+DEFAULT_THREADS = 4
+
+# ------------------------------------------------------------------------------------------------ #
+
+class BuildError(Exception):
+    pass
+
+
+class BuildGraph(object):
+    """Dependency graph of components, remembering what it built."""
+
+    def __init__(self, components):
+        """
+        :param components: components to build
+        :raises BuildError: if a dependency is missing, or the dependencies form a cycle
+        """
+        self._keys = {}
+        self.built = []
+        self.setComponents(components)
+
+
+    @classmethod
+    def fromScene(cls, component_class=Component):
+        """Graph of all components of a class and its subclasses in the scene."""
+        return cls(component_class.findAll())
+
+
+    def setComponents(self, components):
+        """Replace the components, keeping what was built of them."""
+        self.components = dict((component.name, component) for component in components)
+
+        self.dependencies = {}
+        self.dependents = dict((name, []) for name in self.components)
+        for name, component in self.components.items():
+            dependencies = []
+            for dependency in component.dependencies():
+                if dependency in dependencies:
+                    continue
+                if dependency not in self.components:
+                    raise BuildError("'{}' depends on '{}', which is not in the build".format(
+                                     name, dependency))
+                dependencies.append(dependency)
+                self.dependents[dependency].append(name)
+            self.dependencies[name] = dependencies
+
+        self.order = self._sort()
+
+
+    def _sort(self):
+        """Names in dependency order, sorted by name where the order is free."""
+        remaining = dict((name, len(deps)) for name, deps in self.dependencies.items())
+        ready = sorted(name for name, count in remaining.items() if not count)
+
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in sorted(self.dependents[name]):
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    ready.append(dependent)
+
+        if len(order) != len(self.components):
+            cycle = sorted(name for name, count in remaining.items() if count)
+            raise BuildError('Dependency cycle, in or after it: {}'.format(', '.join(cycle)))
+
+        return order
+
+
+    def keys(self):
+        """{name: key} of every component, see the module docstring."""
+        keys = {}
+        for name in self.order:
+            dependency_keys = [keys[dependency] for dependency in self.dependencies[name]]
+            keys[name] = manifest.contentHash([self.components[name].inputHash(),
+                                               dependency_keys])
+        return keys
+
+
+    def stale(self, keys=None):
+        """Names of the components that need building, in dependency order."""
+        keys = keys or self.keys()
+        return [name for name in self.order if self._keys.get(name) != keys[name]]
+
+
+    def invalidate(self, names=None):
+        """Forget that components were built, all of them if names is None."""
+        if names is None:
+            self._keys.clear()
+        for name in names or ():
+            self._keys.pop(name, None)
+
+
+    def run(self, threads=DEFAULT_THREADS, force=False, progress=None):
+        """
+        Build the stale components.
+
+        :param int threads: threads running prepare
+        :param bool force: build every component, not only the stale ones
+        :param progress: function called as progress(done, total, component) after each
+                         component
+        :return: list of ComponentError, one per component that failed. Components
+                 depending on a failed one are not built, and get an error too
+        """
+        keys = self.keys()
+        stale = set(self.order if force else self.stale(keys))
+
+        # dependencies still to be built, of each stale component
+        #
+        waiting = dict((name, len(set(self.dependencies[name]) & stale)) for name in stale)
+
+        results = queue.Queue()
+        pool = ThreadPool(threads)
+        errors = []
+        self.built = []
+        done = [0]
+
+        def prepare(name):
+            try:
+                results.put((name, self.components[name].prepare(), None))
+            except Exception as e:
+                results.put((name, None, e))
+
+        def submit(name):
+            pool.apply_async(prepare, (name,))
+
+        def finish(name, error=None):
+            component = self.components[name]
+            if error is not None:
+                errors.append(ComponentError(component, '{}: {}'.format(type(error).__name__,
+                                                                        error)))
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(stale), component)
+
+        def skip(name, failed):
+            for dependent in self.dependents[name]:
+                if dependent in waiting:
+                    del waiting[dependent]
+                    finish(dependent, BuildError("Dependency '{}' failed".format(failed)))
+                    skip(dependent, failed)
+
+        try:
+            pending = 0
+            for name in self.order:
+                if name in waiting and not waiting[name]:
+                    submit(name)
+                    pending += 1
+
+            while pending:
+                name, prepared, error = results.get()
+                pending -= 1
+                waiting.pop(name, None)
+
+                if error is None:
+                    try:
+                        self.components[name].build(prepared)
+                    except Exception as e:
+                        error = e
+
+                if error is not None:
+                    self._keys.pop(name, None)
+                    finish(name, error)
+                    skip(name, name)
+                    continue
+
+                self._keys[name] = keys[name]
+                self.built.append(name)
+                finish(name)
+
+                for dependent in self.dependents[name]:
+                    if dependent in waiting:
+                        waiting[dependent] -= 1
+                        if not waiting[dependent]:
+                            submit(dependent)
+                            pending += 1
+        finally:
+            pool.close()
+            pool.join()
+
+        return errors
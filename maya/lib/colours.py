@@ -0,0 +1,185 @@
+"""
+Nearest Maya index colour of any RGB colour.
+
+RGB space is quantized to 32 levels a channel, and a lookup table holds the nearest index
+colour of the centre of every 32 x 32 x 32 cell, so a query is one index into the table:
+
+    colours.nearestIndex((250, 10, 20))                 # constants.RED
+    colours.nearestIndices(numpy_array_of_rgb)          # array of indices
+    colours.sideIndices(control_names)                  # index of each control's side
+
+The table is built on first use and saved in the user's home directory, named by a hash
+of COLOURS_RGB, so it is built again only if the colours change. DEFAULT is not a colour, it
+turns the override off, so is never picked.
+
+Channels are 0 to 255, and values outside that are clamped to it. Floats are truncated, so
+colours from 0 to 1 have to be scaled by 255 first.
+
+The batch functions use NumPy if it is available, and return lists otherwise.
+"""
+import hashlib
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from majic_tools.maya.lib import naming, scene
+from majic_tools.maya.utils import constants
+
+# ------------------------------------------------------------------------------------------------ #
+
+BITS = 5
+LEVELS = 1 << BITS
+
+_SHIFT = 8 - BITS
+
+CACHE_NAME = '.majic_tools_colour_lut_{}.bin'
+
+# ------------------------------------------------------------------------------------------------ #
+
+def _candidates():
+    """(index, rgb) of the colours that can be picked."""
+    return sorted((index, rgb) for index, rgb in constants.COLOURS_RGB.items()
+                  if index != constants.DEFAULT)
+
+
+def cacheFilepath():
+    key = hashlib.sha1(repr((BITS, _candidates())).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(os.path.expanduser('~'), CACHE_NAME.format(key))
+
+
+def buildTable():
+    """Nearest index colour of the centre of every cell, as a bytearray indexed by cell."""
+    candidates = _candidates()
+    centres = [(level << _SHIFT) + (1 << _SHIFT) // 2 for level in range(LEVELS)]
+
+    if numpy is not None:
+        rgb = numpy.array([rgb for _, rgb in candidates], numpy.int32)
+        indices = numpy.array([index for index, _ in candidates], numpy.uint8)
+
+        levels = numpy.array(centres, numpy.int32)
+        cells = numpy.stack(numpy.meshgrid(levels, levels, levels, indexing='ij'), -1)
+        cells = cells.reshape(-1, 1, 3)
+
+        distances = ((cells - rgb[None, :, :]) ** 2).sum(-1)
+        return bytearray(indices[distances.argmin(-1)].tobytes())
+
+    table = bytearray(LEVELS ** 3)
+    cell = 0
+    for r in centres:
+        for g in centres:
+            for b in centres:
+                table[cell] = min(candidates, key=lambda candidate: (
+                    (candidate[1][0] - r) ** 2 + (candidate[1][1] - g) ** 2 +
+                    (candidate[1][2] - b) ** 2))[0]
+                cell += 1
+    return table
+
+
+_table = None
+
+
+def table():
+    """The lookup table, read from the cache file or built and saved to it."""
+    global _table
+    if _table is not None:
+        return _table
+
+    filepath = cacheFilepath()
+    if os.path.isfile(filepath) and os.path.getsize(filepath) == LEVELS ** 3:
+        with open(filepath, 'rb') as f:
+            _table = bytearray(f.read())
+        return _table
+
+    _table = buildTable()
+    try:
+        temp_filepath = filepath + '.tmp'
+        with open(temp_filepath, 'wb') as f:
+            f.write(bytes(_table))
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rename(temp_filepath, filepath)
+    except (IOError, OSError):
+        # no writable home, build again next session
+        #
+        pass
+
+    return _table
+
+
+def _channel(value):
+    return min(max(int(value), 0), 255)
+
+
+def _cell(r, g, b):
+    return (r >> _SHIFT) << (2 * BITS) | (g >> _SHIFT) << BITS | b >> _SHIFT
+
+# ------------------------------------------------------------------------------------------------ #
+
+def nearestIndex(rgb):
+    """
+    Maya index colour nearest an RGB colour.
+
+    :param rgb: (r, g, b) from 0 to 255, clamped to that range
+    """
+    r, g, b = rgb
+    return table()[_cell(_channel(r), _channel(g), _channel(b))]
+
+
+def nearestIndices(colours):
+    """
+    Maya index colours nearest many RGB colours.
+
+    :param colours: N x 3 array or sequence of (r, g, b) from 0 to 255, clamped to that range
+    :return: uint8 array of N indices, or a list without NumPy
+    """
+    if numpy is None:
+        return [nearestIndex(rgb) for rgb in colours]
+
+    rgb = numpy.clip(numpy.asarray(colours).reshape(-1, 3), 0, 255).astype(numpy.int32) >> _SHIFT
+    cells = rgb[:, 0] << (2 * BITS) | rgb[:, 1] << BITS | rgb[:, 2]
+    return numpy.frombuffer(table(), numpy.uint8)[cells]
+
+
+def scheme(colours):
+    """
+    Side colour scheme, like constants.SCHEMES, from RGB colours.
+
+    :param dict colours: {side: (r, g, b)}
+    :return: {side: index colour}
+    """
+    return dict((side, nearestIndex(rgb)) for side, rgb in colours.items())
+
+
+def sideIndices(names, side_scheme=constants.SCHEME_1, default=constants.DEFAULT):
+    """
+    Index colour of many nodes by the side in their name.
+
+    :param names: node names, parsed with naming.parseMany
+    :param dict side_scheme: {side: index colour}, such as one of constants.SCHEMES
+    :param int default: index colour of names without a side, or that can't be parsed
+    :return: uint8 array of indices, or a list without NumPy
+    """
+    sides = [parsed.side if parsed is not None else None for parsed in naming.parseMany(names)]
+    indices = [side_scheme.get(side, default) for side in sides]
+    if numpy is None:
+        return indices
+    return numpy.array(indices, numpy.uint8)
+
+
+def colourNodes(names, indices, target_scene=None):
+    """
+    Set the override colour of nodes.
+
+    :param names: node names
+    :param indices: index colour of each node, as given by nearestIndices or sideIndices
+    :param Scene target_scene: scene of the nodes, the current one by default
+    """
+    if target_scene is None:
+        target_scene = scene.current()
+
+    for name, index in zip(names, indices):
+        target_scene.setAttr(name, 'overrideEnabled', True)
+        target_scene.setAttr(name, 'overrideColor', int(index))
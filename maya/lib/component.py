@@ -1,4 +1,23 @@
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
 from majic_tools.maya.lib.data import Data
+from majic_tools.maya.lib import blobstore, manifest, scene
+from majic_tools.maya.utils.constants import CTRL_DEPENDENCY, TAG
+
+# ------------------------------------------------------------------------------------------------ #
+
+# threads writing or reading data files in saveMany and loadMany
+#
+DEFAULT_THREADS = 8
+
+# components allowed in each stage of saveMany and loadMany at once
+#
+DEFAULT_IN_FLIGHT = 64
 
 
 class ComponentError(Exception):
@@ -8,18 +27,314 @@ class ComponentError(Exception):
 
 
 class ComponentData(Data):
+    """
+    Data of a component. It is loaded on first access of an attribute it doesn't have, and
+    becomes dirty when a public attribute is set. Changes inside mutable attributes, such as
+    appending to a list, aren't seen, call markDirty after them.
+
+    Setting an attribute loads the data first, so saved attributes that aren't set are kept.
+    Data that was never saved starts empty.
+
+    By default data is saved as JSON, to a file named after the component in the sub_folders
+    of root. Saves are skipped when the file already holds the same content, going by the
+    directory's manifest of content hashes.
+
+    If store is set to a blobstore.BlobStore, payloads are kept in the store and the data file
+    only refers to them, so data shared between rigs is stored once.
+    """
+    root = None
     sub_folders = []
+    extension = '.json'
+    store = None
 
     def __init__(self, name):
-        self.name = name
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, '_loaded', False)
+        object.__setattr__(self, '_dirty', False)
+
+
+    @classmethod
+    def directory(cls):
+        if cls.root is None:
+            raise ComponentError(cls.__name__, 'No data root is set')
+        return os.path.join(cls.root, *cls.sub_folders)
+
+
+    def filename(self):
+        return self.name + self.extension
+
+
+    def filepath(self):
+        return os.path.join(self.directory(), self.filename())
+
+
+    def manifest(self):
+        return manifest.get(self.directory())
+
+
+    def exists(self):
+        """True if the data was saved, so there is something to load."""
+        return self.root is not None and os.path.isfile(self.filepath())
+
+
+    @staticmethod
+    def contentHash(values):
+        """Hash of {attribute: value}, the same for equal values whatever the file format."""
+        return manifest.contentHash(values)
+
+
+    def savedHash(self):
+        """Content hash of the saved file, or None if it isn't known to be unchanged."""
+        return self.manifest().unchanged(self.name, self.filename())
+
+
+    @staticmethod
+    def encode(values):
+        """Bytes of {attribute: value}."""
+        return json.dumps(values, sort_keys=True, indent=2).encode('utf-8')
+
+
+    @staticmethod
+    def decode(payload):
+        """{attribute: value} of bytes given by encode."""
+        return json.loads(payload.decode('utf-8'))
+
+
+    def write(self, payload):
+        directory = self.directory()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # made by another thread meanwhile
+                #
+                if not os.path.isdir(directory):
+                    raise
+
+        filepath = self.filepath()
+
+        if self.store is None:
+            with open(filepath, 'wb') as f:
+                f.write(payload)
+            return
+
+        old_key = None
+        if os.path.isfile(filepath):
+            with open(filepath, 'rb') as f:
+                old_key = blobstore.refKey(f.read())
+
+        key = self.store.put(payload, filepath)
+        with open(filepath, 'wb') as f:
+            f.write(blobstore.refPayload(key))
+
+        if old_key is not None and old_key != key:
+            self.store.release(old_key, filepath)
+
+
+    def read(self):
+        with open(self.filepath(), 'rb') as f:
+            payload = f.read()
+
+        key = blobstore.refKey(payload)
+        if key is None:
+            return payload
+
+        if self.store is None:
+            raise ComponentError(self, 'Data is in a blob store, but no store is set')
+        return self.store.get(key)
+
+
+    def recordSave(self, content_hash, payload):
+        """
+        Record a save in the manifest and the save stats.
+
+        :param str content_hash: content hash of the data
+        :param bytes payload: bytes written, or None if the save was skipped as unchanged
+        """
+        if payload is None:
+            manifest.stats.skipped += 1
+            manifest.stats.bytes_avoided += self.manifest().size(self.name)
+            return
+
+        size = os.path.getsize(self.filepath())
+        self.manifest().record(self.name, content_hash, size)
+        manifest.stats.written += 1
+        manifest.stats.bytes_written += len(payload)
 
 
     def save(self):
-        raise NotImplementedError
+        """Save the data, unless the saved file holds the same content."""
+        content_hash, payload = _encode(type(self), self.toDict(), self.savedHash())
+        if payload is not None:
+            self.write(payload)
+        self.recordSave(content_hash, payload)
 
 
     def load(self):
-        raise NotImplementedError
+        self.loadDict(self.decode(self.read()))
+
+
+    def rename(self, name):
+        """Rename the data, moving its saved file to the new name."""
+        old_name = self.name
+        old_filepath = self.filepath() if self.exists() else None
+        object.__setattr__(self, 'name', name)
+        if old_filepath is None:
+            return
+
+        filepath = self.filepath()
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rename(old_filepath, filepath)
+
+        if self.store is not None:
+            with open(filepath, 'rb') as f:
+                key = blobstore.refKey(f.read())
+            if key is not None:
+                self.store.addRef(key, filepath)
+                self.store.release(key, old_filepath)
+
+        self.manifest().rename(old_name, name)
+
+
+    def __getattr__(self, attr):
+        # only called for missing attributes
+        #
+        if attr.startswith('_') or self._loaded:
+            raise AttributeError("'{}' has no attribute '{}'".format(self, attr))
+
+        self.ensureLoaded()
+        return getattr(self, attr)
+
+
+    def __setattr__(self, attr, value):
+        if not attr.startswith('_'):
+            # load first, the attributes that aren't set must still be saved
+            #
+            self.ensureLoaded()
+            object.__setattr__(self, '_dirty', True)
+        object.__setattr__(self, attr, value)
+
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+
+    def markDirty(self):
+        object.__setattr__(self, '_dirty', True)
+
+
+    def markClean(self):
+        object.__setattr__(self, '_dirty', False)
+
+
+    def ensureLoaded(self):
+        """Load the data if it hasn't been yet."""
+        if self._loaded:
+            return
+
+        # flag first, attributes read or set while loading mustn't load again
+        #
+        object.__setattr__(self, '_loaded', True)
+        if not self.exists():
+            return
+
+        try:
+            self.load()
+        except Exception:
+            object.__setattr__(self, '_loaded', False)
+            raise
+
+        self.markClean()
+
+
+    def toDict(self):
+        """{attribute: value} of the public attributes, loading the data first."""
+        self.ensureLoaded()
+        return dict((attr, value) for attr, value in vars(self).items()
+                    if not attr.startswith('_') and attr != 'name')
+
+
+    def loadDict(self, values):
+        """Load the data from {attribute: value}, as given by toDict."""
+        for attr, value in values.items():
+            object.__setattr__(self, str(attr), value)
+
+        object.__setattr__(self, '_loaded', True)
+        self.markClean()
+
+
+    def reload(self):
+        """Load the data again, discarding unsaved changes."""
+        for attr in list(vars(self)):
+            if not attr.startswith('_') and attr != 'name':
+                delattr(self, attr)
+
+        object.__setattr__(self, '_loaded', False)
+        object.__setattr__(self, '_dirty', False)
+        self.ensureLoaded()
+
+
+    @classmethod
+    def saveMany(cls, datas, processes=0, threads=DEFAULT_THREADS,
+                 max_in_flight=DEFAULT_IN_FLIGHT, progress=None):
+        """
+        Save many component data at once. Data is encoded on the calling thread, or on a
+        process pool if processes is given, and written on a thread pool, so encoding and file
+        I/O overlap. Unchanged data isn't encoded or written, and manifests are written once at
+        the end. The data is marked clean.
+
+        :param datas: ComponentData instances, of any subclasses
+        :param int processes: processes encoding data, 0 to encode in this process, None for
+                              one per CPU. Starting the pool costs more than it saves on small
+                              batches. In Maya on Windows, set the multiprocessing executable
+                              to mayapy first
+        :param int threads: threads writing files
+        :param int max_in_flight: components allowed in each stage at once, bounding memory
+        :param progress: function called as progress(done, total, data) after each data
+        :return: list of ComponentError, one per data that failed to save
+        """
+        def encode(data, _):
+            return _encode, (type(data), data.toDict(), data.savedHash())
+
+        def write(data, encoded):
+            return _write, (data,) + encoded
+
+        def finish(data, encoded):
+            data.recordSave(*encoded)
+            data.markClean()
+
+        with manifest.deferred():
+            return _runBatch(list(datas), (encode, write), (True, False), finish, processes,
+                             threads, max_in_flight, progress)
+
+
+    @classmethod
+    def loadMany(cls, datas, processes=0, threads=DEFAULT_THREADS,
+                 max_in_flight=DEFAULT_IN_FLIGHT, progress=None):
+        """
+        Load many component data at once. Files are read on a thread pool and decoded on the
+        calling thread, or on a process pool if processes is given. See saveMany.
+
+        :return: list of ComponentError, one per data that failed to load
+        """
+        def read(data, _):
+            return data.read, ()
+
+        def decode(data, payload):
+            return _decode, (type(data), payload)
+
+        def finish(data, values):
+            data.loadDict(values)
+
+        return _runBatch(list(datas), (read, decode), (False, True), finish, processes,
+                         threads, max_in_flight, progress)
 
 
     def __repr__(self):
@@ -28,10 +343,303 @@ class ComponentData(Data):
 
     __str__ = __repr__
 
+# ------------------------------------------------------------------------------------------------ #
+
+def _encode(data_class, values, saved_hash=None):
+    """(content hash, payload) of values. The payload is None if the hash is saved_hash."""
+    content_hash = data_class.contentHash(values)
+    if content_hash == saved_hash:
+        return content_hash, None
+    return content_hash, data_class.encode(values)
+
+
+def _write(data, content_hash, payload):
+    if payload is not None:
+        data.write(payload)
+    return content_hash, payload
+
+
+def _decode(data_class, payload):
+    return data_class.decode(payload)
+
+
+class _Result(object):
+    """Result of work run in the calling thread, with the interface of an AsyncResult."""
+
+    def __init__(self, function, args):
+        self.value = None
+        self.error = None
+        try:
+            self.value = function(*args)
+        except Exception as e:
+            self.error = e
+
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _runBatch(datas, stages, in_process_pool, finish, processes, threads, max_in_flight,
+              progress):
+    """
+    Pass every data through stages of work, each run on the process or the thread pool.
+
+    A stage is a function taking the data and the result of the previous stage, and giving
+    the (function, args) of the work to run. Each stage holds at most max_in_flight data, and
+    passes them on in order, so data finishes in the order given. Data that fails at any stage
+    is left out of the following ones.
+
+    :return: list of ComponentError of the failed data
+    """
+    errors = []
+    queues = [deque() for _ in stages]
+    done = [0]
+
+    def report(data):
+        done[0] += 1
+        if progress is not None:
+            progress(done[0], len(datas), data)
+
+    def fail(data, error):
+        errors.append(ComponentError(data, '{}: {}'.format(type(error).__name__, error)))
+        report(data)
+
+    def submit(stage, data, value):
+        pool = pools[stage]
+        try:
+            function, args = stages[stage](data, value)
+            if pool is None:
+                result = _Result(function, args)
+            else:
+                result = pool.apply_async(function, args)
+        except Exception as e:
+            fail(data, e)
+            return
+
+        queues[stage].append((data, result))
+        if len(queues[stage]) >= max_in_flight:
+            advance(stage)
+
+    def advance(stage):
+        data, result = queues[stage].popleft()
+        try:
+            value = result.get()
+            if stage + 1 == len(stages):
+                finish(data, value)
+        except Exception as e:
+            fail(data, e)
+            return
+
+        if stage + 1 < len(stages):
+            submit(stage + 1, data, value)
+        else:
+            report(data)
+
+    process_pool = multiprocessing.Pool(processes) if processes != 0 else None
+    thread_pool = ThreadPool(threads)
+    pools = [process_pool if in_process else thread_pool for in_process in in_process_pool]
+
+    try:
+        for data in datas:
+            submit(0, data, None)
+
+        for stage in range(len(stages)):
+            while queues[stage]:
+                advance(stage)
+    finally:
+        for pool in (process_pool, thread_pool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    return errors
+
+
+class ComponentRegistry(object):
+    """
+    Cache of component node names per component type, for one scene.
+
+    A type's names are read from the scene the first time they are asked for, then kept up to
+    date from the scene's callbacks, so nodes being added, removed, renamed or tagged update
+    the cache in place rather than clearing it.
+
+    The class of each component type is recorded as components are created, found or given
+    data, so renamed nodes can take their data along.
+    """
+
+    def __init__(self, component_scene):
+        self.scene = component_scene
+
+        self._names = {}
+        self._types = {}
+        self._classes = {}
+        self._data = {}
+
+        # stats
+        #
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+
+        self._callbacks = ((scene.NODE_ADDED, self._nodeAdded),
+                           (scene.NODE_REMOVED, self._nodeRemoved),
+                           (scene.NODE_RENAMED, self._nodeRenamed),
+                           (scene.TAG_CHANGED, self._tagChanged))
+        for event, callback in self._callbacks:
+            self.scene.addCallback(event, callback)
+
+
+    def detach(self):
+        """Stop following the scene."""
+        for event, callback in self._callbacks:
+            self.scene.removeCallback(event, callback)
+        self.clear()
+
+
+    def clear(self):
+        self._names.clear()
+        self._types.clear()
+        self._classes.clear()
+        self._data.clear()
+
+
+    def names(self, component_type):
+        """Set of names of components of a type. Don't modify it."""
+        names = self._names.get(component_type)
+        if names is not None:
+            self.hits += 1
+            return names
+
+        self.misses += 1
+        names = self._names[component_type] = set(self.scene.nodesWithTag(TAG, component_type))
+        for name in names:
+            self._types[name] = component_type
+        return names
+
+
+    def register(self, component_class):
+        """Record the class of a component type."""
+        self._classes[component_class.componentType()] = component_class
+
+
+    def data(self, component):
+        """Cached data of a component, created on first use."""
+        self.register(type(component))
+        datas = self._data.setdefault(component.name, {})
+        data = datas.get(component.Data)
+        if data is None:
+            data = datas[component.Data] = component.Data(component.name)
+        return data
+
+
+    def setData(self, component, data):
+        self.register(type(component))
+        self._data.setdefault(component.name, {})[component.Data] = data
+
+
+    def allData(self):
+        """(name, data) of every cached data."""
+        return [(name, data) for name, datas in self._data.items() for data in datas.values()]
+
+
+    def _add(self, name, component_type):
+        names = self._names.get(component_type)
+        if names is not None:
+            names.add(name)
+            self._types[name] = component_type
+            self.updates += 1
+
+
+    def _remove(self, name):
+        component_type = self._types.pop(name, None)
+        if component_type is not None:
+            self._names[component_type].discard(name)
+            self.updates += 1
+        return component_type
+
+
+    def _nodeAdded(self, name):
+        # nodes are usually tagged after they are created, but imported ones are not
+        #
+        component_type = self.scene.getTag(name, TAG)
+        if component_type is not None:
+            self._add(name, component_type)
+
+
+    def _nodeRemoved(self, name):
+        self._remove(name)
+        self._data.pop(name, None)
+
+
+    def _nodeRenamed(self, old_name, new_name):
+        component_type = self._remove(old_name)
+        if component_type is not None:
+            self._add(new_name, component_type)
+        else:
+            component_type = self.scene.getTag(new_name, TAG)
+
+        # data moves with its component, its saved file too even if it wasn't used yet
+        #
+        datas = self._data.pop(old_name, None)
+        if datas is None:
+            component_class = self._classes.get(component_type)
+            if component_class is None:
+                return
+            datas = {component_class.Data: component_class.Data(old_name)}
+
+        for data in datas.values():
+            data.rename(new_name)
+        self._data[new_name] = datas
+
+
+    def _tagChanged(self, name, tag, old_value, new_value):
+        if tag != TAG:
+            return
+
+        self._remove(name)
+        if new_value is not None:
+            self._add(name, new_value)
+
+
+    def __repr__(self):
+        return '<{} {} types, {} hits, {} misses, {} updates>'.format(
+            self.__class__.__name__, len(self._names), self.hits, self.misses, self.updates)
+
+
+_registry = None
+
+
+def registry():
+    """Component registry of the current scene."""
+    global _registry
+    current_scene = scene.current()
+    if _registry is None or _registry.scene is not current_scene:
+        if _registry is not None:
+            _registry.detach()
+        _registry = ComponentRegistry(current_scene)
+    return _registry
+
+
+def _classPath(component_class):
+    return '{}.{}'.format(component_class.__module__, component_class.__name__)
+
+
+def _isReplaced(component_class):
+    """True if the class's module was reloaded, and now holds another class of that name."""
+    module = sys.modules.get(component_class.__module__)
+    current_class = getattr(module, component_class.__name__, None)
+    return current_class is not None and current_class is not component_class
+
 
 class Component(object):
     """
     Base Class for all components.
+
+    A component is a node in the scene tagged with its component type, the class name, under
+    the TAG tag. Scene queries go through scene.current(), lists of components through the
+    scene's ComponentRegistry.
     """
     Data = ComponentData
     Error = ComponentError
@@ -40,37 +648,195 @@ class Component(object):
         self.name = str(name)
 
 
-    @staticmethod
-    def isComponent(name):
-        raise NotImplementedError
+    @classmethod
+    def componentType(cls):
+        return cls.__name__
+
+
+    @classmethod
+    def componentClasses(cls):
+        """
+        {component type: class} of this class and all its subclasses.
+
+        :raises ComponentError: if two classes have the same component type. A class left over
+            from reloading its module gives way to the reloaded one
+        """
+        classes = {cls.componentType(): cls}
+        for subclass in cls.__subclasses__():
+            for component_type, component_class in subclass.componentClasses().items():
+                other = classes.get(component_type)
+                if other is None or _isReplaced(other):
+                    classes[component_type] = component_class
+                elif other is not component_class and not _isReplaced(component_class):
+                    raise cls.Error(component_type, 'Component type is defined by both {} and {}'
+                                    .format(_classPath(other), _classPath(component_class)))
+        return classes
+
+
+    @classmethod
+    def isComponent(cls, name):
+        """True if the node is a component of this class or one of its subclasses."""
+        current_scene = scene.current()
+        if not current_scene.exists(name):
+            return False
+        return current_scene.getTag(name, TAG) in cls.componentClasses()
 
 
     @classmethod
     def findAll(cls):
-        raise NotImplementedError
+        """All components of this class and its subclasses in the scene, sorted by name."""
+        component_registry = registry()
+
+        components = []
+        for component_type, component_class in cls.componentClasses().items():
+            component_registry.register(component_class)
+            for name in component_registry.names(component_type):
+                components.append(component_class(name))
+
+        components.sort(key=str)
+        return components
 
 
     @classmethod
-    def create(cls):
-        raise NotImplementedError
+    def create(cls, name, parent=None):
+        """
+        Create the component node in the scene.
+
+        :param str name: node name
+        :param str parent: node to parent the component under
+        :raises ComponentError: if a node of that name already exists
+        """
+        current_scene = scene.current()
+        if current_scene.exists(name):
+            raise cls.Error(name, 'A node of this name already exists')
+
+        current_scene.createNode(name, scene.TRANSFORM, parent)
+        current_scene.addTag(name, TAG, cls.componentType())
+        registry().register(cls)
+
+        return cls(name)
 
 
     @classmethod
-    def createFromData(cls):
-        raise NotImplementedError
+    def createFromData(cls, data):
+        """Create a component named after its data, which becomes the component's data."""
+        component = cls.create(data.name)
+        registry().setData(component, data)
+        data.markDirty()
+        return component
 
 
     @property
     def data(self):
-        return self.Data(self.name)
+        """Data of the component, kept until the component is removed from the scene."""
+        return registry().data(self)
 
 
     def saveData(self):
-        self.data.save()
+        """
+        Save the data if it changed since it was loaded or saved.
+
+        :return: True if the data was written
+        """
+        data = self.data
+        if not data.dirty:
+            return False
+
+        data.save()
+        data.markClean()
+        return True
 
 
     def loadData(self):
-        self.data.load()
+        """Load the data, discarding unsaved changes."""
+        self.data.reload()
+
+
+    @classmethod
+    def saveAllDirty(cls):
+        """
+        Save the changed data of every component of this class and its subclasses.
+
+        :return: list of the components whose data was written
+        """
+        component_classes = cls.componentClasses()
+        current_scene = scene.current()
+
+        saved = []
+        with manifest.deferred():
+            for name, data in registry().allData():
+                if not data.dirty or not current_scene.exists(name):
+                    continue
+
+                component_class = component_classes.get(current_scene.getTag(name, TAG))
+                if component_class is None or not isinstance(data, component_class.Data):
+                    continue
+
+                data.save()
+                data.markClean()
+                saved.append(component_class(name))
+
+        saved.sort(key=str)
+        return saved
+
+
+    def dependencies(self):
+        """Names of the components this one is built after, from its CTRL_DEPENDENCY tag."""
+        value = scene.current().getTag(self.name, CTRL_DEPENDENCY)
+        return value.split() if value else []
+
+
+    def setDependencies(self, names):
+        current_scene = scene.current()
+        if names:
+            current_scene.addTag(self.name, CTRL_DEPENDENCY, ' '.join(str(name) for name in names))
+        else:
+            current_scene.removeTag(self.name, CTRL_DEPENDENCY)
+
+
+    def inputHash(self):
+        """
+        Hash of everything the build depends on, other than the dependencies. The component
+        is rebuilt when it changes. By default the component type and data, going by the
+        manifest's content hash so the data isn't loaded to hash it.
+        """
+        data = self.data
+        try:
+            if data.dirty:
+                # unsaved changes are only in memory, hashed as they would be saved
+                #
+                data_hash = data.contentHash(data.toDict())
+            else:
+                data_hash = data.savedHash()
+                if data_hash is None and data.exists():
+                    # saved without a manifest entry, hash the file
+                    #
+                    with open(data.filepath(), 'rb') as f:
+                        data_hash = manifest.digest(f.read())
+        except (ComponentError, IOError, OSError):
+            # no data root
+            #
+            data_hash = None
+        return manifest.contentHash([self.componentType(), data_hash])
+
+
+    def prepare(self):
+        """
+        Build work that doesn't touch the scene, such as reading data or computing positions.
+        Runs on a worker thread once the dependencies are built, maybe alongside other
+        components' prepare.
+
+        :return: value passed to build
+        """
+        return None
+
+
+    def build(self, prepared):
+        """
+        Build the component in the scene. Runs on the calling thread, one at a time. Does
+        nothing by default.
+        """
+        pass
 
     
     def __str__(self):
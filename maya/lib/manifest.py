@@ -0,0 +1,182 @@
+"""
+Content hashes of saved component data, so saves of data that hasn't changed can be skipped.
+
+Each data directory has a manifest.json of {name: [hash, size]} for the files in it. The hash
+is of a canonical serialization of the data, JSON with sorted keys and no whitespace, so it
+doesn't depend on the file format or dict order. A file is taken as unchanged if its hash
+matches and the file is still there at the recorded size.
+
+BLAKE2 is used where hashlib has it, otherwise SHA-256. Hashes are prefixed with the algorithm
+name, so a manifest written by one is not trusted by the other.
+
+Manifests are written after every change, unless inside deferred(), which writes each changed
+manifest once at the end:
+
+    with manifest.deferred():
+        for data in datas:
+            data.save()
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+# ------------------------------------------------------------------------------------------------ #
+
+FILENAME = 'manifest.json'
+
+if hasattr(hashlib, 'blake2b'):
+    HASH_NAME = 'blake2b'
+
+    def digest(data):
+        return hashlib.blake2b(data, digest_size=32).hexdigest()
+else:
+    HASH_NAME = 'sha256'
+
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+# ------------------------------------------------------------------------------------------------ #
+
+def canonical(values):
+    """Canonical bytes of JSON serializable values."""
+    return json.dumps(values, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def contentHash(values):
+    return '{}:{}'.format(HASH_NAME, digest(canonical(values)))
+
+
+class SaveStats(object):
+    """Running count of component data saves, and of those skipped as unchanged."""
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.written = 0
+        self.skipped = 0
+        self.bytes_written = 0
+        self.bytes_avoided = 0
+
+
+    def __repr__(self):
+        return '<{} {} written, {} bytes, {} skipped, {} bytes avoided>'.format(
+            self.__class__.__name__, self.written, self.bytes_written, self.skipped,
+            self.bytes_avoided)
+
+
+stats = SaveStats()
+
+# ------------------------------------------------------------------------------------------------ #
+
+class Manifest(object):
+    """Content hashes of the files of one directory, read on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.filepath = os.path.join(directory, FILENAME)
+
+        self._entries = None
+        self._changed = False
+
+
+    def _read(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.isfile(self.filepath):
+                with open(self.filepath, 'r') as f:
+                    self._entries = json.load(f)
+        return self._entries
+
+
+    def unchanged(self, name, filename):
+        """
+        Hash of a file, if the file is there as it was last recorded, else None.
+
+        :param str name: data name
+        :param str filename: file name of the data in the directory
+        """
+        entry = self._read().get(name)
+        if entry is None:
+            return None
+
+        content_hash, size = entry
+        filepath = os.path.join(self.directory, filename)
+        if not os.path.isfile(filepath) or os.path.getsize(filepath) != size:
+            return None
+        return content_hash
+
+
+    def size(self, name):
+        entry = self._read().get(name)
+        return entry[1] if entry is not None else 0
+
+
+    def record(self, name, content_hash, size):
+        self._read()[name] = [content_hash, size]
+        self._changed = True
+
+        if not _deferred:
+            self.save()
+
+
+    def rename(self, name, new_name):
+        """Move the entry of a file renamed to new_name."""
+        entries = self._read()
+        if name not in entries:
+            return
+
+        entries[new_name] = entries.pop(name)
+        self._changed = True
+
+        if not _deferred:
+            self.save()
+
+
+    def save(self):
+        """Write the manifest if it changed."""
+        if not self._changed:
+            return
+
+        temp_filepath = self.filepath + '.tmp'
+        with open(temp_filepath, 'w') as f:
+            json.dump(self._entries, f, sort_keys=True, indent=0)
+
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+        os.rename(temp_filepath, self.filepath)
+
+        self._changed = False
+
+
+_manifests = {}
+_deferred = []
+
+
+def get(directory):
+    """Cached manifest of a directory."""
+    directory = os.path.normpath(directory)
+    manifest = _manifests.get(directory)
+    if manifest is None:
+        manifest = _manifests[directory] = Manifest(directory)
+    return manifest
+
+
+def clear():
+    """Forget cached manifests, to read them again after they were changed elsewhere."""
+    _manifests.clear()
+
+
+@contextmanager
+def deferred():
+    """Write changed manifests once, when the block ends, rather than on every save."""
+    _deferred.append(True)
+    try:
+        yield
+    finally:
+        _deferred.pop()
+        if not _deferred:
+            for manifest in _manifests.values():
+                manifest.save()
@@ -0,0 +1,307 @@
+"""
+Node naming convention:
+
+    [namespace:][side_]base[_SUFFIX...]
+
+    L_upperArm_CTRL_ZERO
+    C_spine01_JNT
+    body_GEO
+
+Sides and suffixes are the tokens of utils.constants, compiled into one regular expression.
+Parsed and built names are kept in bounded caches. parseMany parses a whole list of names, and
+gives None for those it can't parse rather than failing them all.
+
+MirrorIndex keeps the LEFT and RIGHT names of a scene, to find a name's counterpart in O(1).
+"""
+import re
+from collections import namedtuple, OrderedDict
+
+from majic_tools.maya.lib import scene
+from majic_tools.maya.utils import constants
+
+# ------------------------------------------------------------------------------------------------ #
+
+SEPARATOR = '_'
+
+SIDES = tuple(constants.SIDES)
+MIRRORED_SIDES = {constants.LEFT: constants.RIGHT,
+                  constants.RIGHT: constants.LEFT}
+
+SUFFIXES = (
+    # transforms
+    #
+    constants.GROUP, constants.ZERO, constants.OFFSET, constants.NEGATE, constants.GUIDE,
+    constants.RIVET, constants.MIRROR, constants.NULL, constants.CONTROL, constants.JOINT,
+    constants.SPACE_SWITCH, constants.INPUT, constants.OUTPUT,
+
+    # shapes
+    #
+    constants.GEO, constants.CURVE,
+
+    # deformers
+    #
+    constants.BLENDSHAPE, constants.CLUSTER, constants.SKINCLUSTER, constants.LATTICE,
+    constants.WRAP,
+
+    # dag nodes
+    #
+    constants.SET, constants.MULT, constants.DIV, constants.INV, constants.PLUS, constants.SUB,
+)
+
+DEFAULT_CACHE_SIZE = 65536
+
+# ------------------------------------------------------------------------------------------------ #
+
+class NamingError(Exception):
+    pass
+
+
+class Name(namedtuple('Name', ('namespace', 'side', 'base', 'suffixes'))):
+    """
+    Parts of a name. namespace is '' or ends with ':', side is None if the name has none,
+    suffixes is a tuple.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return build(self.base, self.side, self.suffixes, self.namespace)
+
+
+def _alternation(tokens):
+    # longest first, so INV isn't read as IN
+    #
+    return '|'.join(re.escape(token) for token in sorted(tokens, key=len, reverse=True))
+
+
+_PATTERN = (r'^(?P<namespace>(?:[^:\n]*:)*)'
+            r'(?:(?P<side>{sides}){separator})?'
+            r'(?P<base>[^\n]+?)'
+            r'(?P<suffixes>(?:{separator}(?:{suffixes}))*)$').format(
+                sides=_alternation(SIDES), suffixes=_alternation(SUFFIXES),
+                separator=re.escape(SEPARATOR))
+
+_regex = re.compile(_PATTERN)
+_suffix_regex = re.compile('{}({})'.format(re.escape(SEPARATOR), _alternation(SUFFIXES)))
+
+# ------------------------------------------------------------------------------------------------ #
+
+class BoundedCache(object):
+    """Dict keeping the most recently used entries, up to size."""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+
+        # stats
+        #
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        """Value of a key, or None."""
+        value = self._entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries[key] = value
+        return value
+
+
+    def set(self, key, value):
+        self._entries[key] = value
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_parse_cache = BoundedCache()
+_build_cache = BoundedCache()
+
+
+def _name(match):
+    suffixes = match.group('suffixes')
+    return Name(match.group('namespace'), match.group('side'), match.group('base'),
+                tuple(_suffix_regex.findall(suffixes)) if suffixes else ())
+
+
+def parse(name):
+    """
+    Parts of a name.
+
+    :raises NamingError: for an empty name
+    """
+    parsed = _parse_cache.get(name)
+    if parsed is not None:
+        return parsed
+
+    match = _regex.match(name)
+    if match is None:
+        raise NamingError("Can't parse name '{}'".format(name))
+
+    parsed = _name(match)
+    _parse_cache.set(name, parsed)
+    return parsed
+
+
+def parseMany(names, errors=None):
+    """
+    Parts of many names, in the same order.
+
+    :param names: names to parse
+    :param list errors: if given, a NamingError is appended to it for each name that can't be
+                        parsed
+    :return: list of Name, with None for the names that can't be parsed
+    """
+    parsed = []
+    for name in names:
+        try:
+            parsed.append(parse(name))
+        except NamingError as e:
+            parsed.append(None)
+            if errors is not None:
+                errors.append(e)
+    return parsed
+
+
+def build(base, side=None, suffixes=(), namespace=''):
+    """
+    Name from its parts.
+
+    :param str base: base name, such as upperArm
+    :param str side: one of SIDES, or None
+    :param suffixes: SUFFIXES, in order
+    :param str namespace: namespace, ending with ':'
+    :raises NamingError: for an unknown side or suffix
+    """
+    suffixes = tuple(suffixes)
+    key = (base, side, suffixes, namespace)
+    name = _build_cache.get(key)
+    if name is not None:
+        return name
+
+    if not base:
+        raise NamingError('Names need a base')
+    if side is not None and side not in SIDES:
+        raise NamingError("Unknown side '{}'".format(side))
+    for suffix in suffixes:
+        if suffix not in SUFFIXES:
+            raise NamingError("Unknown suffix '{}'".format(suffix))
+
+    parts = ([side] if side is not None else []) + [base] + list(suffixes)
+    name = namespace + SEPARATOR.join(parts)
+
+    _build_cache.set(key, name)
+    return name
+
+
+def mirror(name):
+    """The name on the other side, or the name itself if it is not LEFT or RIGHT."""
+    parsed = parse(name)
+    side = MIRRORED_SIDES.get(parsed.side)
+    if side is None:
+        return name
+    return build(parsed.base, side, parsed.suffixes, parsed.namespace)
+
+
+def clearCaches():
+    _parse_cache.clear()
+    _build_cache.clear()
+
+# ------------------------------------------------------------------------------------------------ #
+
+class MirrorIndex(object):
+    """
+    LEFT and RIGHT names, for O(1) lookup of a name's counterpart. Follows a scene's changes
+    once attached to it.
+    """
+
+    def __init__(self, names=()):
+        self._names = set()
+        self.scene = None
+
+        for name in names:
+            self.add(name)
+
+
+    @classmethod
+    def fromScene(cls, source_scene=None):
+        """Index of every node of a scene, the current one by default, kept up to date."""
+        index = cls()
+        index.attach(source_scene if source_scene is not None else scene.current())
+        return index
+
+
+    def attach(self, follow_scene):
+        """Index the nodes of a scene and follow its changes."""
+        self.detach()
+
+        self.scene = follow_scene
+        for name in follow_scene.ls():
+            self.add(name)
+
+        follow_scene.addCallback(scene.NODE_ADDED, self.add)
+        follow_scene.addCallback(scene.NODE_REMOVED, self.remove)
+        follow_scene.addCallback(scene.NODE_RENAMED, self.rename)
+
+
+    def detach(self):
+        if self.scene is None:
+            return
+
+        self.scene.removeCallback(scene.NODE_ADDED, self.add)
+        self.scene.removeCallback(scene.NODE_REMOVED, self.remove)
+        self.scene.removeCallback(scene.NODE_RENAMED, self.rename)
+        self.scene = None
+        self._names.clear()
+
+
+    def add(self, name):
+        if name and parse(name).side in MIRRORED_SIDES:
+            self._names.add(name)
+
+
+    def remove(self, name):
+        self._names.discard(name)
+
+
+    def rename(self, old_name, new_name):
+        self.remove(old_name)
+        self.add(new_name)
+
+
+    def counterpart(self, name):
+        """Name of the node on the other side, or None if there is none."""
+        if name not in self._names:
+            return None
+
+        mirrored = mirror(name)
+        return mirrored if mirrored in self._names else None
+
+
+    def pairs(self):
+        """(left, right) names of every node that has a counterpart, sorted."""
+        pairs = []
+        for name in self._names:
+            if parse(name).side == constants.LEFT:
+                mirrored = mirror(name)
+                if mirrored in self._names:
+                    pairs.append((name, mirrored))
+        return sorted(pairs)
+
+
+    def __contains__(self, name):
+        return name in self._names
+
+
+    def __len__(self):
+        return len(self._names)
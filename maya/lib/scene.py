@@ -0,0 +1,528 @@
+"""
+Scene graph backends. Components query the scene through a Scene rather than Maya directly, so
+the same code runs against Maya or an in-memory scene, which needs no Maya to run or test.
+
+    from majic_tools.maya.lib import scene
+    scene.setCurrent(scene.MemoryScene())
+
+MemoryScene keeps hash indexes by name, node type, tag and tag value, so lookups are O(1) and
+listing nodes of a type or tag is O(result) however big the scene is.
+
+Scenes report changes to callbacks, so caches of scene queries can be kept up to date without
+querying the scene again, see component.ComponentRegistry.
+"""
+from collections import defaultdict
+
+try:
+    from maya import cmds
+    import maya.api.OpenMaya as om
+except ImportError:
+    cmds = None
+    om = None
+
+# ------------------------------------------------------------------------------------------------ #
+
+TRANSFORM = 'transform'
+
+# callback events
+#
+NODE_ADDED = 'nodeAdded'
+NODE_REMOVED = 'nodeRemoved'
+NODE_RENAMED = 'nodeRenamed'
+TAG_CHANGED = 'tagChanged'
+
+# ------------------------------------------------------------------------------------------------ #
+
+class SceneError(Exception):
+    pass
+
+
+class Scene(object):
+    """
+    Interface of a scene backend. Nodes are referred to by unique name.
+    """
+
+    def __init__(self):
+        self._callbacks = defaultdict(list)
+
+
+    def addCallback(self, event, callback):
+        """
+        Call a function when the scene changes:
+
+            NODE_ADDED      callback(name)
+            NODE_REMOVED    callback(name), before the node is removed
+            NODE_RENAMED    callback(old_name, new_name)
+            TAG_CHANGED     callback(name, tag, old_value, new_value), None for no tag
+        """
+        self._callbacks[event].append(callback)
+
+
+    def removeCallback(self, event, callback):
+        callbacks = self._callbacks.get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+    def _emit(self, event, *args):
+        for callback in list(self._callbacks.get(event, ())):
+            callback(*args)
+
+
+    def exists(self, name):
+        raise NotImplementedError
+
+
+    def ls(self, node_type=None):
+        """Names of all nodes, or all nodes of a type."""
+        raise NotImplementedError
+
+
+    def createNode(self, name, node_type=TRANSFORM, parent=None):
+        """Create a node. Returns its name."""
+        raise NotImplementedError
+
+
+    def delete(self, name):
+        """Delete a node and its children."""
+        raise NotImplementedError
+
+
+    def rename(self, name, new_name):
+        """Rename a node. Returns its new name."""
+        raise NotImplementedError
+
+
+    def nodeType(self, name):
+        raise NotImplementedError
+
+
+    def parent(self, name):
+        """Parent of a node, or None for nodes under the world."""
+        raise NotImplementedError
+
+
+    def setParent(self, name, parent=None):
+        raise NotImplementedError
+
+
+    def children(self, name):
+        raise NotImplementedError
+
+
+    def getAttr(self, name, attr):
+        raise NotImplementedError
+
+
+    def setAttr(self, name, attr, value):
+        raise NotImplementedError
+
+
+    def listAttrs(self, name):
+        raise NotImplementedError
+
+
+    def addTag(self, name, tag, value=''):
+        """Tag a node. A tag is a named string value, used to find nodes by role."""
+        raise NotImplementedError
+
+
+    def removeTag(self, name, tag):
+        raise NotImplementedError
+
+
+    def getTag(self, name, tag):
+        """Value of a tag on a node, or None if the node doesn't have the tag."""
+        raise NotImplementedError
+
+
+    def tags(self, name):
+        """{tag: value} of a node."""
+        raise NotImplementedError
+
+
+    def nodesWithTag(self, tag, value=None):
+        """Names of nodes with a tag, optionally only those where the tag has this value."""
+        raise NotImplementedError
+
+# ------------------------------------------------------------------------------------------------ #
+
+class _Node(object):
+    __slots__ = ('name', 'node_type', 'parent', 'children', 'attrs', 'tags')
+
+    def __init__(self, name, node_type, parent=None):
+        self.name = name
+        self.node_type = node_type
+        self.parent = parent
+        self.children = []
+        self.attrs = {}
+        self.tags = {}
+
+
+class MemoryScene(Scene):
+    """Pure Python scene, indexed by name, node type, tag and tag value."""
+
+    def __init__(self):
+        super(MemoryScene, self).__init__()
+
+        self._nodes = {}
+        self._types = defaultdict(set)
+        self._tags = defaultdict(set)
+        self._tag_values = defaultdict(set)
+
+
+    def _node(self, name):
+        node = self._nodes.get(name)
+        if node is None:
+            raise SceneError("No node named '{}'".format(name))
+        return node
+
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+
+    def exists(self, name):
+        return name in self._nodes
+
+
+    def ls(self, node_type=None):
+        if node_type is None:
+            return list(self._nodes)
+        return list(self._types.get(node_type, ()))
+
+
+    def createNode(self, name, node_type=TRANSFORM, parent=None):
+        if name in self._nodes:
+            raise SceneError("Node '{}' already exists".format(name))
+
+        parent_node = self._node(parent) if parent is not None else None
+
+        node = self._nodes[name] = _Node(name, node_type, parent)
+        self._types[node_type].add(name)
+
+        if parent_node is not None:
+            parent_node.children.append(name)
+
+        self._emit(NODE_ADDED, name)
+        return name
+
+
+    def delete(self, name):
+        node = self._node(name)
+
+        for child in list(node.children):
+            self.delete(child)
+
+        self._emit(NODE_REMOVED, name)
+
+        if node.parent is not None:
+            self._nodes[node.parent].children.remove(name)
+
+        for tag, value in node.tags.items():
+            self._unindexTag(name, tag, value)
+
+        self._types[node.node_type].discard(name)
+        del self._nodes[name]
+
+
+    def rename(self, name, new_name):
+        if new_name == name:
+            return name
+        if new_name in self._nodes:
+            raise SceneError("Node '{}' already exists".format(new_name))
+
+        node = self._node(name)
+
+        # move the node in every index
+        #
+        for tag, value in node.tags.items():
+            self._unindexTag(name, tag, value)
+            self._indexTag(new_name, tag, value)
+
+        self._types[node.node_type].discard(name)
+        self._types[node.node_type].add(new_name)
+
+        if node.parent is not None:
+            siblings = self._nodes[node.parent].children
+            siblings[siblings.index(name)] = new_name
+
+        for child in node.children:
+            self._nodes[child].parent = new_name
+
+        node.name = new_name
+        self._nodes[new_name] = self._nodes.pop(name)
+
+        self._emit(NODE_RENAMED, name, new_name)
+        return new_name
+
+
+    def nodeType(self, name):
+        return self._node(name).node_type
+
+
+    def parent(self, name):
+        return self._node(name).parent
+
+
+    def setParent(self, name, parent=None):
+        node = self._node(name)
+
+        # refuse to parent a node under itself or its children
+        #
+        ancestor = parent
+        while ancestor is not None:
+            if ancestor == name:
+                raise SceneError("Can't parent '{}' under itself".format(name))
+            ancestor = self._node(ancestor).parent
+
+        if node.parent is not None:
+            self._nodes[node.parent].children.remove(name)
+
+        node.parent = parent
+        if parent is not None:
+            self._nodes[parent].children.append(name)
+
+
+    def children(self, name):
+        return list(self._node(name).children)
+
+
+    def getAttr(self, name, attr):
+        attrs = self._node(name).attrs
+        if attr not in attrs:
+            raise SceneError("No attribute '{}.{}'".format(name, attr))
+        return attrs[attr]
+
+
+    def setAttr(self, name, attr, value):
+        self._node(name).attrs[attr] = value
+
+
+    def listAttrs(self, name):
+        return list(self._node(name).attrs)
+
+
+    def _indexTag(self, name, tag, value):
+        self._tags[tag].add(name)
+        self._tag_values[(tag, value)].add(name)
+
+
+    def _unindexTag(self, name, tag, value):
+        self._tags[tag].discard(name)
+        self._tag_values[(tag, value)].discard(name)
+
+
+    def addTag(self, name, tag, value=''):
+        node = self._node(name)
+        old_value = node.tags.get(tag)
+        if old_value is not None:
+            self._unindexTag(name, tag, old_value)
+
+        node.tags[tag] = value
+        self._indexTag(name, tag, value)
+
+        if value != old_value:
+            self._emit(TAG_CHANGED, name, tag, old_value, value)
+
+
+    def removeTag(self, name, tag):
+        node = self._node(name)
+        if tag in node.tags:
+            old_value = node.tags.pop(tag)
+            self._unindexTag(name, tag, old_value)
+            self._emit(TAG_CHANGED, name, tag, old_value, None)
+
+
+    def getTag(self, name, tag):
+        return self._node(name).tags.get(tag)
+
+
+    def tags(self, name):
+        return dict(self._node(name).tags)
+
+
+    def nodesWithTag(self, tag, value=None):
+        if value is None:
+            return list(self._tags.get(tag, ()))
+        return list(self._tag_values.get((tag, value), ()))
+
+# ------------------------------------------------------------------------------------------------ #
+
+class MayaScene(Scene):
+    """
+    Scene backed by maya.cmds. Tags are string attributes on the node.
+
+    Listing nodes by tag asks Maya for every node with the tag attribute, so is O(nodes with
+    the tag) rather than a scan of the whole scene.
+
+    Node callbacks come from Maya's messages, so cover changes made outside this class, such
+    as by the user. Tag changes are only reported when made through addTag and removeTag.
+    """
+
+    def __init__(self):
+        if cmds is None:
+            raise SceneError('Maya is not available')
+
+        super(MayaScene, self).__init__()
+        self._callback_ids = []
+
+
+    def addCallback(self, event, callback):
+        if not self._callback_ids and event != TAG_CHANGED:
+            self._addMayaCallbacks()
+        super(MayaScene, self).addCallback(event, callback)
+
+
+    def _addMayaCallbacks(self):
+        self._callback_ids = [
+            om.MDGMessage.addNodeAddedCallback(self._mayaNodeAdded, 'dependNode'),
+            om.MDGMessage.addNodeRemovedCallback(self._mayaNodeRemoved, 'dependNode'),
+            om.MNodeMessage.addNameChangedCallback(om.MObject(), self._mayaNameChanged),
+        ]
+
+
+    def close(self):
+        """Remove the Maya callbacks. Call before letting go of the scene."""
+        if self._callback_ids:
+            om.MMessage.removeCallbacks(self._callback_ids)
+            self._callback_ids = []
+
+
+    def _mayaNodeAdded(self, node, client_data):
+        self._emit(NODE_ADDED, om.MFnDependencyNode(node).name())
+
+
+    def _mayaNodeRemoved(self, node, client_data):
+        self._emit(NODE_REMOVED, om.MFnDependencyNode(node).name())
+
+
+    def _mayaNameChanged(self, node, previous_name, client_data):
+        # nodes are named twice on creation, from an empty name first
+        #
+        if previous_name:
+            self._emit(NODE_RENAMED, previous_name, om.MFnDependencyNode(node).name())
+
+
+    def exists(self, name):
+        return cmds.objExists(name)
+
+
+    def ls(self, node_type=None):
+        if node_type is None:
+            return cmds.ls() or []
+        return cmds.ls(type=node_type) or []
+
+
+    def createNode(self, name, node_type=TRANSFORM, parent=None):
+        if cmds.objExists(name):
+            raise SceneError("Node '{}' already exists".format(name))
+
+        if parent is None:
+            return cmds.createNode(node_type, name=name)
+        return cmds.createNode(node_type, name=name, parent=parent)
+
+
+    def delete(self, name):
+        cmds.delete(name)
+
+
+    def rename(self, name, new_name):
+        return cmds.rename(name, new_name)
+
+
+    def nodeType(self, name):
+        return cmds.nodeType(name)
+
+
+    def parent(self, name):
+        parents = cmds.listRelatives(name, parent=True)
+        return parents[0] if parents else None
+
+
+    def setParent(self, name, parent=None):
+        if parent is None:
+            cmds.parent(name, world=True)
+        else:
+            cmds.parent(name, parent)
+
+
+    def children(self, name):
+        return cmds.listRelatives(name, children=True) or []
+
+
+    def getAttr(self, name, attr):
+        return cmds.getAttr('{}.{}'.format(name, attr))
+
+
+    def setAttr(self, name, attr, value):
+        plug = '{}.{}'.format(name, attr)
+        if isinstance(value, basestring):
+            cmds.setAttr(plug, value, type='string')
+        else:
+            cmds.setAttr(plug, value)
+
+
+    def listAttrs(self, name):
+        return cmds.listAttr(name, userDefined=True) or []
+
+
+    def addTag(self, name, tag, value=''):
+        old_value = self.getTag(name, tag)
+        if old_value is None:
+            cmds.addAttr(name, longName=tag, dataType='string')
+        cmds.setAttr('{}.{}'.format(name, tag), value, type='string')
+
+        if value != old_value:
+            self._emit(TAG_CHANGED, name, tag, old_value, value)
+
+
+    def removeTag(self, name, tag):
+        old_value = self.getTag(name, tag)
+        if old_value is not None:
+            cmds.deleteAttr(name, attribute=tag)
+            self._emit(TAG_CHANGED, name, tag, old_value, None)
+
+
+    def getTag(self, name, tag):
+        if not cmds.attributeQuery(tag, node=name, exists=True):
+            return None
+        return cmds.getAttr('{}.{}'.format(name, tag)) or ''
+
+
+    def tags(self, name):
+        tags = {}
+        for attr in cmds.listAttr(name, userDefined=True) or []:
+            if cmds.getAttr('{}.{}'.format(name, attr), type=True) == 'string':
+                tags[attr] = cmds.getAttr('{}.{}'.format(name, attr)) or ''
+        return tags
+
+
+    def nodesWithTag(self, tag, value=None):
+        nodes = cmds.ls('*.{}'.format(tag), objectsOnly=True, recursive=True) or []
+        if value is None:
+            return nodes
+        return [node for node in nodes if self.getTag(node, tag) == value]
+
+# ------------------------------------------------------------------------------------------------ #
+
+_current = None
+
+
+def current():
+    """Scene components work in. Maya's if running in Maya, otherwise an empty MemoryScene."""
+    global _current
+    if _current is None:
+        _current = MayaScene() if cmds is not None else MemoryScene()
+    return _current
+
+
+def setCurrent(scene):
+    """Set the scene components work in. Returns the previous scene."""
+    global _current
+    previous, _current = _current, scene
+    return previous
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from majic_tools.maya.lib import archive
+
+
+class _Data(object):
+    """The part of ComponentData the archive uses."""
+
+    def __init__(self, name, values=None):
+        self.name = name
+        self.values = values or {}
+        self.dirty = True
+
+
+    def toDict(self):
+        return dict(self.values)
+
+
+    def loadDict(self, values):
+        self.values = values
+        self.dirty = False
+
+
+    def markClean(self):
+        self.dirty = False
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'rig.arc')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testRecord(self):
+        values = {'points': [[0.5, 1.0, 2.0]] * 10,
+                  'indices': list(range(10)),
+                  'weights': [0.25] * 10,
+                  'mixed': [1, 2.5] * 5,
+                  'short': [1, 2],
+                  'shape': 'circle',
+                  'flags': [True] * 10}
+
+        record = archive.encodeRecord(values)
+        decoded = archive.decodeRecord(record)
+
+        self.assertEqual(decoded['points'], values['points'])
+        self.assertEqual(decoded['indices'], values['indices'])
+        self.assertEqual(decoded['weights'], values['weights'])
+        self.assertEqual(decoded['mixed'], [float(value) for value in values['mixed']])
+        self.assertEqual(decoded['short'], [1, 2])
+        self.assertEqual(decoded['shape'], 'circle')
+        self.assertEqual(decoded['flags'], values['flags'])
+
+
+    def testBigIntsStayExact(self):
+        values = {'ids': [2 ** 53 + 1] + list(range(10)),
+                  'mixed': [2 ** 40, 0.5] * 5}
+
+        decoded = archive.decodeRecord(archive.encodeRecord(values))
+        self.assertEqual(decoded, values)
+
+
+    def testReadWrite(self):
+        with archive.ArchiveWriter(self.filepath) as writer:
+            writer.write('a', {'value': 1})
+            writer.write('b', {'value': 2})
+
+        with archive.ArchiveReader(self.filepath) as reader:
+            self.assertEqual(reader.names(), ['a', 'b'])
+            self.assertEqual(reader.read('b'), {'value': 2})
+            self.assertIn('a', reader)
+            self.assertRaises(KeyError, reader.read, 'c')
+            self.assertFalse(reader.recovered)
+
+
+    def testAppendAndCompact(self):
+        with archive.ArchiveWriter(self.filepath) as writer:
+            writer.write('a', {'value': 1})
+            writer.write('b', {'value': list(range(100))})
+
+        with archive.ArchiveWriter(self.filepath) as writer:
+            writer.write('b', {'value': 3})
+            writer.write('c', {'value': 4})
+
+        with archive.ArchiveReader(self.filepath) as reader:
+            self.assertEqual(reader.names(), ['a', 'b', 'c'])
+            self.assertEqual(reader.read('b'), {'value': 3})
+
+        size = os.path.getsize(self.filepath)
+        archive.compact(self.filepath)
+        self.assertLess(os.path.getsize(self.filepath), size)
+
+        with archive.ArchiveReader(self.filepath) as reader:
+            self.assertEqual([reader.read(name) for name in reader.names()],
+                             [{'value': 1}, {'value': 3}, {'value': 4}])
+
+
+    def testInterruptedWrite(self):
+        with archive.ArchiveWriter(self.filepath) as writer:
+            writer.write('a', {'value': 1})
+
+        # records written, but the writer died before its index
+        #
+        writer = archive.ArchiveWriter(self.filepath)
+        writer.write('b', {'value': 2})
+        writer._file.close()
+        writer._file = None
+
+        with archive.ArchiveReader(self.filepath) as reader:
+            self.assertTrue(reader.recovered)
+            self.assertEqual(reader.names(), ['a'])
+
+        with archive.ArchiveWriter(self.filepath) as writer:
+            writer.write('c', {'value': 3})
+
+        with archive.ArchiveReader(self.filepath) as reader:
+            self.assertFalse(reader.recovered)
+            self.assertEqual(reader.names(), ['a', 'c'])
+            self.assertEqual(reader.read('c'), {'value': 3})
+
+
+    def testNotAnArchive(self):
+        with open(self.filepath, 'wb') as f:
+            f.write(b'not an archive, long enough for a footer')
+        self.assertRaises(archive.ArchiveError, archive.ArchiveReader, self.filepath)
+
+        with open(self.filepath, 'wb') as f:
+            f.write(archive.MAGIC + b'\0' * 64)
+        self.assertRaises(archive.ArchiveError, archive.ArchiveReader, self.filepath)
+
+
+    def testSaveLoadData(self):
+        datas = [_Data('a', {'value': 1}), _Data('b', {'points': [[1.0, 2.0, 3.0]] * 8})]
+        archive.saveData(self.filepath, datas)
+        self.assertFalse(any(data.dirty for data in datas))
+
+        loaded = [_Data('b'), _Data('missing')]
+        missing = archive.loadData(self.filepath, loaded)
+        self.assertEqual(loaded[0].values, datas[1].values)
+        self.assertEqual(missing, [loaded[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from majic_tools.maya.lib import blobstore
+
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = blobstore.BlobStore(os.path.join(self.directory, 'store'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def _ref(self, name, key):
+        """Write a ref file pointing at a blob, as ComponentData does."""
+        filepath = os.path.join(self.directory, name)
+        with open(filepath, 'wb') as f:
+            f.write(blobstore.refPayload(key))
+        return filepath
+
+
+    def testPutStoresOnce(self):
+        first = self.store.put(b'payload', os.path.join(self.directory, 'a'))
+        second = self.store.put(b'payload', os.path.join(self.directory, 'b'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.store.keys(), [first])
+        self.assertEqual(self.store.refCount(first), 2)
+        self.assertEqual(self.store.get(first), b'payload')
+
+
+    def testAddRefOnce(self):
+        key = self.store.put(b'payload')
+        ref = os.path.join(self.directory, 'a')
+        self.store.addRef(key, ref)
+        self.store.addRef(key, ref)
+
+        self.assertEqual(self.store.refs(key), [os.path.abspath(ref)])
+
+
+    def testReleaseKeepsBlob(self):
+        ref = os.path.join(self.directory, 'a')
+        key = self.store.put(b'payload', ref)
+        self.store.release(key, ref)
+
+        # only collect deletes blobs, and not before min_age
+        #
+        self.assertEqual(self.store.refCount(key), 0)
+        self.assertTrue(self.store.has(key))
+        self.assertEqual(self.store.collect(), 0)
+        self.assertTrue(self.store.has(key))
+
+        self.assertTrue(self.store.collect(min_age=0))
+        self.assertFalse(self.store.has(key))
+
+
+    def testCollectDropsDeadRefs(self):
+        key = self.store.put(b'payload')
+        other = self.store.put(b'other')
+
+        live = self._ref('live', key)
+        moved = self._ref('moved', other)
+        self.store.addRef(key, live)
+        self.store.addRef(key, moved)
+        self.store.addRef(key, os.path.join(self.directory, 'deleted'))
+        self.store.addRef(other, moved)
+
+        self.store.collect(min_age=0)
+
+        self.assertEqual(self.store.refs(key), [os.path.abspath(live)])
+        self.assertEqual(self.store.refs(other), [os.path.abspath(moved)])
+        self.assertEqual(sorted(self.store.keys()), sorted([key, other]))
+
+
+    def testGetCache(self):
+        key = self.store.put(b'payload')
+        self.store.get(key)
+        self.store.get(key)
+        self.assertEqual((self.store.misses, self.store.hits), (1, 1))
+
+        self.store.clearCache()
+        self.assertRaises(blobstore.BlobStoreError, self.store.get, self.store.key(b'missing'))
+
+
+    def testRefPayload(self):
+        key = self.store.key(b'payload')
+        payload = blobstore.refPayload(key)
+
+        self.assertTrue(blobstore.isRef(payload))
+        self.assertEqual(blobstore.refKey(payload), key)
+        self.assertIsNone(blobstore.refKey(b'{"a": 1}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+
+from majic_tools.maya.lib import scene
+from majic_tools.maya.utils.constants import CTRL_DEPENDENCY
+
+try:
+    from majic_tools.maya.lib import build, component
+except ImportError:
+    # components derive their data from lib.data, which isn't always installed
+    #
+    build = component = None
+
+
+class _Component(object):
+    """The part of Component the build graph uses."""
+
+    def __init__(self, name, dependencies=(), fail=False):
+        self.name = name
+        self._dependencies = list(dependencies)
+        self.input = 'input'
+        self.fail = fail
+        self.builds = 0
+
+
+    def dependencies(self):
+        return self._dependencies
+
+
+    def inputHash(self):
+        return self.input
+
+
+    def prepare(self):
+        return self.name
+
+
+    def build(self, prepared):
+        if self.fail:
+            raise RuntimeError('failed')
+        self.builds += 1
+
+
+@unittest.skipIf(build is None, 'majic_tools.maya.lib.data is not available')
+class BuildGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.components = [_Component('spine'),
+                           _Component('arm', ['spine']),
+                           _Component('leg', ['spine']),
+                           _Component('hand', ['arm', 'leg']),
+                           _Component('eyes')]
+        self.named = dict((item.name, item) for item in self.components)
+        self.graph = build.BuildGraph(self.components)
+
+
+    def testOrder(self):
+        self.assertEqual(self.graph.order, ['eyes', 'spine', 'arm', 'leg', 'hand'])
+
+
+    def testRunBuildsInOrder(self):
+        progress = []
+        errors = self.graph.run(threads=2,
+                                progress=lambda done, total, item: progress.append(item.name))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(self.graph.built), sorted(self.named))
+        self.assertEqual(sorted(progress), sorted(self.named))
+        for name, item in self.named.items():
+            for dependency in item.dependencies():
+                self.assertLess(self.graph.built.index(dependency), self.graph.built.index(name))
+
+
+    def testIncrementalRebuild(self):
+        self.graph.run()
+        self.assertEqual(self.graph.stale(), [])
+
+        self.graph.run()
+        self.assertEqual(self.graph.built, [])
+
+        # a change rebuilds the component and everything downstream
+        #
+        self.named['leg'].input = 'changed'
+        self.assertEqual(self.graph.stale(), ['leg', 'hand'])
+        self.graph.run()
+        self.assertEqual(sorted(self.graph.built), ['hand', 'leg'])
+        self.assertEqual(self.named['spine'].builds, 1)
+
+        self.graph.invalidate(['eyes'])
+        self.assertEqual(self.graph.stale(), ['eyes'])
+
+        self.graph.run(force=True)
+        self.assertEqual(len(self.graph.built), len(self.components))
+
+
+    def testFailureSkipsDependents(self):
+        self.named['arm'].fail = True
+        errors = self.graph.run()
+
+        self.assertEqual(len(errors), 2)
+        self.assertNotIn('hand', self.graph.built)
+        self.assertIn('leg', self.graph.built)
+
+        # failed components stay stale
+        #
+        self.named['arm'].fail = False
+        self.assertEqual(self.graph.stale(), ['arm', 'hand'])
+
+
+    def testMissingDependency(self):
+        self.assertRaises(build.BuildError, build.BuildGraph, [_Component('arm', ['spine'])])
+
+
+    def testCycle(self):
+        self.assertRaises(build.BuildError, build.BuildGraph,
+                          [_Component('a', ['b']), _Component('b', ['a'])])
+
+
+@unittest.skipIf(build is None, 'majic_tools.maya.lib.data is not available')
+class SceneBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.scene = scene.MemoryScene()
+        self.previous_scene = scene.setCurrent(self.scene)
+
+
+    def tearDown(self):
+        component.registry().detach()
+        scene.setCurrent(self.previous_scene)
+
+
+    def testFromScene(self):
+        class Rig(component.Component):
+            pass
+
+        spine = Rig.create('spine')
+        Rig.create('arm').setDependencies([spine])
+        self.assertEqual(Rig('arm').dependencies(), ['spine'])
+
+        graph = build.BuildGraph.fromScene(Rig)
+        self.assertEqual(graph.order, ['spine', 'arm'])
+
+        # data without a root has no input, and the default build does nothing
+        #
+        self.assertEqual(graph.run(), [])
+        self.assertEqual(graph.built, ['spine', 'arm'])
+
+        Rig('arm').setDependencies([])
+        self.assertIsNone(self.scene.getTag('arm', CTRL_DEPENDENCY))
+
+
+if __name__ == '__main__':
+    unittest.main()
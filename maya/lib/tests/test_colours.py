@@ -0,0 +1,103 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from majic_tools.maya.lib import colours
+from majic_tools.maya.utils import constants
+
+
+def _nearest(rgb):
+    """Nearest index colour by searching every candidate."""
+    return min(colours._candidates(), key=lambda candidate: sum(
+        (a - b) ** 2 for a, b in zip(candidate[1], rgb)))[0]
+
+
+def _centre(rgb):
+    """Centre of the table cell of a colour."""
+    half = (1 << colours._SHIFT) // 2
+    return tuple((value >> colours._SHIFT << colours._SHIFT) + half for value in rgb)
+
+
+class ColoursTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'lut.bin')
+
+        # build the table in a temporary directory rather than the home directory
+        #
+        cache_filepath = colours.cacheFilepath
+        colours.cacheFilepath = lambda: self.filepath
+        colours._table = None
+
+        def restore():
+            colours.cacheFilepath = cache_filepath
+            colours._table = None
+        self.addCleanup(restore)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testNearestIndex(self):
+        sample = random.Random(0)
+        rgbs = [tuple(sample.randint(0, 255) for _ in range(3)) for _ in range(200)]
+        rgbs += [rgb for _, rgb in colours._candidates()]
+
+        for rgb in rgbs:
+            self.assertEqual(colours.nearestIndex(rgb), _nearest(_centre(rgb)))
+        self.assertEqual(list(colours.nearestIndices(rgbs)),
+                         [colours.nearestIndex(rgb) for rgb in rgbs])
+
+
+    def testDefaultNeverPicked(self):
+        self.assertNotIn(constants.DEFAULT, colours.table())
+
+
+    def testClamp(self):
+        self.assertEqual(colours.nearestIndex((0, 256, 0)), colours.nearestIndex((0, 255, 0)))
+        self.assertEqual(colours.nearestIndex((-1, 0, 0)), colours.nearestIndex((0, 0, 0)))
+        self.assertEqual(colours.nearestIndex((256, 0, 0)), colours.nearestIndex((255, 0, 0)))
+        self.assertEqual(colours.nearestIndex((255.9, -0.5, 0)),
+                         colours.nearestIndex((255, 0, 0)))
+
+        self.assertEqual(list(colours.nearestIndices([(0, 256, 0), (-1, 0, 0), (1000, 0, 0)])),
+                         [colours.nearestIndex((0, 255, 0)), colours.nearestIndex((0, 0, 0)),
+                          colours.nearestIndex((255, 0, 0))])
+
+
+    def testSideIndices(self):
+        names = ['L_arm_CTRL', 'R_arm_CTRL', 'C_spine_JNT', 'body_GEO', '']
+        scheme = constants.SCHEME_1
+        self.assertEqual(list(colours.sideIndices(names)),
+                         [scheme[constants.LEFT], scheme[constants.RIGHT],
+                          scheme[constants.CENTER], constants.DEFAULT, constants.DEFAULT])
+        self.assertEqual(list(colours.sideIndices([''], default=constants.RED)), [constants.RED])
+
+
+    def testCache(self):
+        table = colours.table()
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(bytearray(f.read()), table)
+
+        # read back from the file rather than built again
+        #
+        cached = bytearray(len(table))
+        with open(self.filepath, 'wb') as f:
+            f.write(bytes(cached))
+        colours._table = None
+        self.assertEqual(colours.table(), cached)
+
+        # a file of the wrong size is replaced
+        #
+        with open(self.filepath, 'wb') as f:
+            f.write(b'short')
+        colours._table = None
+        self.assertEqual(colours.table(), table)
+        self.assertEqual(os.path.getsize(self.filepath), len(table))
+
+
+if __name__ == '__main__':
+    unittest.main()
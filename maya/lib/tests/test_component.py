@@ -0,0 +1,259 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from majic_tools.maya.lib import manifest, scene
+from majic_tools.maya.utils.constants import TAG
+
+try:
+    from majic_tools.maya.lib import component
+except ImportError:
+    # component data derives from lib.data, which isn't always installed
+    #
+    component = None
+
+
+def _classes(directory):
+    """Component classes keeping their data in a directory."""
+    class ArmData(component.ComponentData):
+        root = directory
+
+    class Arm(component.Component):
+        Data = ArmData
+
+    class Leg(component.Component):
+        pass
+
+    class Hand(Arm):
+        pass
+
+    return Arm, Leg, Hand
+
+
+@unittest.skipIf(component is None, 'majic_tools.maya.lib.data is not available')
+class _SceneTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scene = scene.MemoryScene()
+        self.previous_scene = scene.setCurrent(self.scene)
+        self.registry = component.registry()
+        self.Arm, self.Leg, self.Hand = _classes(self.directory)
+        manifest.stats.reset()
+
+
+    def tearDown(self):
+        self.registry.detach()
+        scene.setCurrent(self.previous_scene)
+        manifest.clear()
+        shutil.rmtree(self.directory)
+
+
+    def writeJson(self, name, values):
+        with open(os.path.join(self.directory, name + '.json'), 'w') as f:
+            json.dump(values, f)
+
+
+    def readJson(self, name):
+        with open(os.path.join(self.directory, name + '.json')) as f:
+            return json.load(f)
+
+
+class ComponentTest(_SceneTest):
+    def testFindAll(self):
+        self.Arm.create('b_arm')
+        self.Hand.create('a_hand')
+        self.Leg.create('leg')
+
+        components = self.Arm.findAll()
+        self.assertEqual([str(found) for found in components], ['a_hand', 'b_arm'])
+        self.assertEqual([type(found) for found in components], [self.Hand, self.Arm])
+        self.assertTrue(self.Arm.isComponent('a_hand'))
+        self.assertFalse(self.Arm.isComponent('leg'))
+        self.assertFalse(self.Arm.isComponent('missing'))
+
+
+    def testCreateExisting(self):
+        self.Arm.create('arm_L')
+        self.assertRaises(component.ComponentError, self.Arm.create, 'arm_L')
+
+
+    def testDuplicateType(self):
+        def defineSpine():
+            class Spine(self.Arm):
+                pass
+            return Spine
+
+        old, new = defineSpine(), defineSpine()
+        self.assertRaises(component.ComponentError, self.Arm.componentClasses)
+
+        # a class replaced in its module by a reload gives way to the new one
+        #
+        module = sys.modules[__name__]
+        module.Spine = new
+        try:
+            self.assertIs(self.Arm.componentClasses()['Spine'], new)
+        finally:
+            del module.Spine
+
+
+class ComponentRegistryTest(_SceneTest):
+    def testNamesAreCached(self):
+        self.Arm.create('arm_L')
+        self.assertEqual(self.registry.names('Arm'), set(['arm_L']))
+        self.assertEqual(self.registry.names('Arm'), set(['arm_L']))
+        self.assertEqual((self.registry.misses, self.registry.hits), (1, 1))
+
+
+    def testFollowsScene(self):
+        self.Arm.create('arm_L')
+        self.Leg.create('leg_L')
+        names = self.registry.names('Arm')
+        self.registry.names('Leg')
+
+        self.Arm.create('arm_R')
+        self.assertEqual(names, set(['arm_L', 'arm_R']))
+
+        self.scene.rename('arm_R', 'arm_C')
+        self.assertEqual(names, set(['arm_L', 'arm_C']))
+
+        self.scene.delete('arm_L')
+        self.assertEqual(names, set(['arm_C']))
+
+        self.scene.addTag('leg_L', TAG, 'Arm')
+        self.assertEqual(names, set(['arm_C', 'leg_L']))
+        self.assertEqual(self.registry.names('Leg'), set())
+
+        # answered from the cache, without querying the scene again
+        #
+        self.assertEqual(self.registry.misses, 2)
+
+
+    def testDataFollowsComponent(self):
+        arm = self.Arm.create('arm_L')
+        data = arm.data
+        self.assertIs(self.Arm('arm_L').data, data)
+
+        self.scene.rename('arm_L', 'arm_R')
+        self.assertIs(self.Arm('arm_R').data, data)
+        self.assertEqual(data.name, 'arm_R')
+
+        self.scene.delete('arm_R')
+        self.assertEqual(self.registry.allData(), [])
+
+
+    def testRenameUsesRecordedClass(self):
+        # another class of the same type, keeping its data elsewhere
+        #
+        other_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_directory)
+        _classes(other_directory)
+
+        self.writeJson('arm_L', {'a': 1})
+        self.Arm.create('arm_L')
+        self.scene.rename('arm_L', 'arm_R')
+
+        self.assertEqual(self.readJson('arm_R'), {'a': 1})
+
+
+class ComponentDataTest(_SceneTest):
+    def testLazyLoad(self):
+        self.writeJson('arm_L', {'a': 1})
+        data = self.Arm.create('arm_L').data
+
+        self.assertFalse(data.loaded)
+        self.assertEqual(data.a, 1)
+        self.assertTrue(data.loaded)
+        self.assertFalse(data.dirty)
+        self.assertRaises(AttributeError, getattr, data, 'missing')
+
+
+    def testSetKeepsSavedValues(self):
+        self.writeJson('arm_L', {'a': 1, 'b': 2})
+        arm = self.Arm.create('arm_L')
+        arm.data.a = 5
+
+        self.assertTrue(arm.saveData())
+        self.assertEqual(self.readJson('arm_L'), {'a': 5, 'b': 2})
+        self.assertFalse(arm.saveData())
+
+
+    def testNewData(self):
+        arm = self.Arm.create('arm_L')
+        self.assertFalse(hasattr(arm.data, 'a'))
+
+        arm.data.a = 1
+        arm.saveData()
+        self.assertEqual(self.readJson('arm_L'), {'a': 1})
+
+
+    def testSkipsUnchanged(self):
+        arm = self.Arm.create('arm_L')
+        arm.data.a = 1
+        arm.saveData()
+        arm.data.a = 1
+        arm.saveData()
+
+        size = os.path.getsize(os.path.join(self.directory, 'arm_L.json'))
+        self.assertEqual((manifest.stats.written, manifest.stats.skipped), (1, 1))
+        self.assertEqual((manifest.stats.bytes_written, manifest.stats.bytes_avoided),
+                         (size, size))
+        self.assertEqual(arm.data.savedHash(), arm.data.contentHash({'a': 1}))
+
+
+    def testReload(self):
+        self.writeJson('arm_L', {'a': 1})
+        arm = self.Arm.create('arm_L')
+        arm.data.a = 2
+        arm.data.b = 3
+        arm.loadData()
+
+        self.assertEqual(arm.data.a, 1)
+        self.assertFalse(hasattr(arm.data, 'b'))
+        self.assertFalse(arm.data.dirty)
+
+
+    def testRenameMovesFile(self):
+        self.writeJson('arm_L', {'a': 1})
+        self.Arm.create('arm_L')
+
+        self.scene.rename('arm_L', 'arm_R')
+        self.assertEqual(self.Arm.saveAllDirty(), [])
+
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'arm_L.json')))
+        self.assertEqual(self.readJson('arm_R'), {'a': 1})
+
+
+    def testSaveAllDirty(self):
+        self.Arm.create('arm_L').data.a = 1
+        self.Hand.create('hand_L').data.a = 2
+        self.Arm.create('arm_R').data
+
+        saved = self.Arm.saveAllDirty()
+        self.assertEqual([str(found) for found in saved], ['arm_L', 'hand_L'])
+        self.assertEqual(self.readJson('hand_L'), {'a': 2})
+
+
+    def testSaveLoadMany(self):
+        ArmData = self.Arm.Data
+        datas = [ArmData('arm{}'.format(index)) for index in range(20)]
+        for index, data in enumerate(datas):
+            data.value = index
+
+        progress = []
+        errors = ArmData.saveMany(datas, max_in_flight=4,
+                                  progress=lambda done, total, data: progress.append(data))
+        self.assertEqual(errors, [])
+        self.assertEqual(progress, datas)
+        self.assertFalse(any(data.dirty for data in datas))
+
+        loaded = [ArmData(data.name) for data in datas] + [ArmData('missing')]
+        errors = ArmData.loadMany(loaded)
+        self.assertEqual([data.value for data in loaded[:-1]], list(range(20)))
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from majic_tools.maya.lib import manifest
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manifest = manifest.get(self.directory)
+        self.content_hash = manifest.contentHash({'a': 1})
+        self.size = self.writeFile('arm_L.json', b'{"a": 1}')
+
+
+    def tearDown(self):
+        manifest.clear()
+        shutil.rmtree(self.directory)
+
+
+    def writeFile(self, filename, payload):
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            f.write(payload)
+        return len(payload)
+
+
+    def readManifest(self):
+        with open(self.manifest.filepath) as f:
+            return json.load(f)
+
+
+    def testContentHash(self):
+        self.assertEqual(manifest.contentHash({'a': 1, 'b': [1, 2]}),
+                         manifest.contentHash({'b': [1, 2], 'a': 1}))
+        self.assertNotEqual(manifest.contentHash({'a': 1}), manifest.contentHash({'a': 2}))
+        self.assertTrue(self.content_hash.startswith(manifest.HASH_NAME + ':'))
+
+
+    def testRecord(self):
+        self.assertIsNone(self.manifest.unchanged('arm_L', 'arm_L.json'))
+
+        self.manifest.record('arm_L', self.content_hash, self.size)
+        self.assertEqual(self.manifest.unchanged('arm_L', 'arm_L.json'), self.content_hash)
+        self.assertEqual(self.manifest.size('arm_L'), self.size)
+        self.assertEqual(self.readManifest(), {'arm_L': [self.content_hash, self.size]})
+
+        # read back by a new manifest of the directory
+        #
+        manifest.clear()
+        self.assertEqual(manifest.get(self.directory).unchanged('arm_L', 'arm_L.json'),
+                         self.content_hash)
+
+
+    def testChangedFile(self):
+        self.manifest.record('arm_L', self.content_hash, self.size)
+
+        self.writeFile('arm_L.json', b'{"a": 10}')
+        self.assertIsNone(self.manifest.unchanged('arm_L', 'arm_L.json'))
+
+        os.remove(os.path.join(self.directory, 'arm_L.json'))
+        self.assertIsNone(self.manifest.unchanged('arm_L', 'arm_L.json'))
+
+
+    def testRename(self):
+        self.manifest.record('arm_L', self.content_hash, self.size)
+        os.rename(os.path.join(self.directory, 'arm_L.json'),
+                  os.path.join(self.directory, 'arm_R.json'))
+        self.manifest.rename('arm_L', 'arm_R')
+
+        self.assertEqual(self.manifest.unchanged('arm_R', 'arm_R.json'), self.content_hash)
+        self.assertEqual(self.manifest.size('arm_L'), 0)
+        self.assertEqual(self.readManifest(), {'arm_R': [self.content_hash, self.size]})
+
+
+    def testDeferred(self):
+        with manifest.deferred():
+            self.manifest.record('arm_L', self.content_hash, self.size)
+            with manifest.deferred():
+                self.manifest.record('arm_R', self.content_hash, self.size)
+            self.assertFalse(os.path.exists(self.manifest.filepath))
+
+        self.assertEqual(sorted(self.readManifest()), ['arm_L', 'arm_R'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+from majic_tools.maya.lib import naming, scene
+from majic_tools.maya.utils import constants
+
+
+class NamingTest(unittest.TestCase):
+    def tearDown(self):
+        naming.clearCaches()
+
+
+    def testParse(self):
+        self.assertEqual(naming.parse('L_upperArm_CTRL_ZERO'),
+                         ('', constants.LEFT, 'upperArm', (constants.CONTROL, constants.ZERO)))
+        self.assertEqual(naming.parse('rig:C_spine01_JNT'),
+                         ('rig:', constants.CENTER, 'spine01', (constants.JOINT,)))
+        self.assertEqual(naming.parse('body_GEO'), ('', None, 'body', (constants.GEO,)))
+        self.assertEqual(naming.parse('L_arm'), ('', constants.LEFT, 'arm', ()))
+
+        self.assertRaises(naming.NamingError, naming.parse, '')
+
+
+    def testParseLongestSuffix(self):
+        # INV isn't read as IN followed by V
+        #
+        self.assertEqual(naming.parse('C_scale_INV').suffixes, (constants.INV,))
+
+
+    def testParseCache(self):
+        naming.parse('L_arm_CTRL')
+        hits = naming._parse_cache.hits
+        naming.parse('L_arm_CTRL')
+        self.assertEqual(naming._parse_cache.hits, hits + 1)
+
+
+    def testParseMany(self):
+        errors = []
+        parsed = naming.parseMany(['L_arm_CTRL', '', 'body_GEO', 'L_arm_CTRL'], errors)
+
+        self.assertEqual([name.base if name else None for name in parsed],
+                         ['arm', None, 'body', 'arm'])
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], naming.NamingError)
+
+        # errors are optional
+        #
+        self.assertEqual(naming.parseMany(['']), [None])
+
+
+    def testBuild(self):
+        name = naming.build('upperArm', constants.LEFT, [constants.CONTROL], 'rig:')
+        self.assertEqual(name, 'rig:L_upperArm_CTRL')
+        self.assertEqual(str(naming.parse(name)), name)
+
+        self.assertRaises(naming.NamingError, naming.build, '')
+        self.assertRaises(naming.NamingError, naming.build, 'arm', 'X')
+        self.assertRaises(naming.NamingError, naming.build, 'arm', None, ['NOPE'])
+
+
+    def testMirror(self):
+        self.assertEqual(naming.mirror('L_arm_CTRL'), 'R_arm_CTRL')
+        self.assertEqual(naming.mirror('rig:R_arm_JNT'), 'rig:L_arm_JNT')
+        self.assertEqual(naming.mirror('C_spine_JNT'), 'C_spine_JNT')
+        self.assertEqual(naming.mirror('body_GEO'), 'body_GEO')
+
+
+    def testBoundedCache(self):
+        cache = naming.BoundedCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        # b was the least recently used
+        #
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(len(cache), 2)
+
+
+class MirrorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.scene = scene.MemoryScene()
+        for name in ('L_arm_CTRL', 'R_arm_CTRL', 'L_leg_CTRL', 'C_spine_JNT'):
+            self.scene.createNode(name)
+
+        self.index = naming.MirrorIndex.fromScene(self.scene)
+
+
+    def tearDown(self):
+        self.index.detach()
+        naming.clearCaches()
+
+
+    def testCounterpart(self):
+        self.assertEqual(self.index.counterpart('L_arm_CTRL'), 'R_arm_CTRL')
+        self.assertEqual(self.index.counterpart('R_arm_CTRL'), 'L_arm_CTRL')
+        self.assertIsNone(self.index.counterpart('L_leg_CTRL'))
+        self.assertIsNone(self.index.counterpart('C_spine_JNT'))
+        self.assertNotIn('C_spine_JNT', self.index)
+        self.assertEqual(self.index.pairs(), [('L_arm_CTRL', 'R_arm_CTRL')])
+
+
+    def testFollowsScene(self):
+        self.scene.createNode('R_leg_CTRL')
+        self.assertEqual(self.index.counterpart('L_leg_CTRL'), 'R_leg_CTRL')
+
+        self.scene.rename('R_arm_CTRL', 'R_hand_CTRL')
+        self.assertIsNone(self.index.counterpart('L_arm_CTRL'))
+
+        self.scene.delete('R_leg_CTRL')
+        self.assertIsNone(self.index.counterpart('L_leg_CTRL'))
+        self.assertEqual(len(self.index), 3)
+
+
+    def testDetach(self):
+        self.index.detach()
+        self.scene.createNode('R_leg_CTRL')
+
+        self.assertEqual(len(self.index), 0)
+        self.assertIsNone(self.index.scene)
+
+
+if __name__ == '__main__':
+    unittest.main()
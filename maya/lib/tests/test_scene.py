@@ -0,0 +1,131 @@
+import unittest
+
+from majic_tools.maya.lib import scene
+
+
+class MemorySceneTest(unittest.TestCase):
+    def setUp(self):
+        self.scene = scene.MemoryScene()
+        self.events = []
+        for event in (scene.NODE_ADDED, scene.NODE_REMOVED, scene.NODE_RENAMED,
+                      scene.TAG_CHANGED):
+            self.scene.addCallback(event, self._recorder(event))
+
+
+    def _recorder(self, event):
+        def record(*args):
+            self.events.append((event,) + args)
+        return record
+
+
+    def testCreateNode(self):
+        self.scene.createNode('root')
+        self.scene.createNode('joint', 'joint', 'root')
+
+        self.assertTrue(self.scene.exists('joint'))
+        self.assertEqual(self.scene.ls('joint'), ['joint'])
+        self.assertEqual(sorted(self.scene.ls()), ['joint', 'root'])
+        self.assertEqual(self.scene.parent('joint'), 'root')
+        self.assertEqual(self.scene.children('root'), ['joint'])
+        self.assertEqual(self.events, [(scene.NODE_ADDED, 'root'), (scene.NODE_ADDED, 'joint')])
+
+        self.assertRaises(scene.SceneError, self.scene.createNode, 'root')
+        self.assertRaises(scene.SceneError, self.scene.createNode, 'orphan', parent='missing')
+
+
+    def testDeleteRemovesChildren(self):
+        self.scene.createNode('root')
+        self.scene.createNode('child', parent='root')
+        self.scene.addTag('child', 'tag', 'value')
+        del self.events[:]
+
+        self.scene.delete('root')
+
+        self.assertEqual(len(self.scene), 0)
+        self.assertEqual(self.scene.nodesWithTag('tag'), [])
+        self.assertEqual(self.events, [(scene.NODE_REMOVED, 'child'),
+                                       (scene.NODE_REMOVED, 'root')])
+
+
+    def testRenameMovesIndexes(self):
+        self.scene.createNode('root')
+        self.scene.createNode('child', parent='root')
+        self.scene.addTag('root', 'tag', 'value')
+        del self.events[:]
+
+        self.scene.rename('root', 'top')
+
+        self.assertFalse(self.scene.exists('root'))
+        self.assertEqual(self.scene.nodesWithTag('tag', 'value'), ['top'])
+        self.assertEqual(self.scene.ls(scene.TRANSFORM).count('top'), 1)
+        self.assertEqual(self.scene.parent('child'), 'top')
+        self.assertEqual(self.events, [(scene.NODE_RENAMED, 'root', 'top')])
+
+        self.assertRaises(scene.SceneError, self.scene.rename, 'top', 'child')
+
+
+    def testTags(self):
+        self.scene.createNode('a')
+        self.scene.createNode('b')
+        self.scene.addTag('a', 'type', 'Arm')
+        self.scene.addTag('b', 'type', 'Leg')
+        self.scene.addTag('b', 'type', 'Leg')
+
+        self.assertEqual(sorted(self.scene.nodesWithTag('type')), ['a', 'b'])
+        self.assertEqual(self.scene.nodesWithTag('type', 'Arm'), ['a'])
+        self.assertEqual(self.scene.getTag('a', 'type'), 'Arm')
+        self.assertIsNone(self.scene.getTag('a', 'missing'))
+
+        self.scene.removeTag('a', 'type')
+        self.assertEqual(self.scene.nodesWithTag('type', 'Arm'), [])
+
+        # setting a tag to the value it has doesn't report a change
+        #
+        tag_events = [event for event in self.events if event[0] == scene.TAG_CHANGED]
+        self.assertEqual(tag_events, [(scene.TAG_CHANGED, 'a', 'type', None, 'Arm'),
+                                      (scene.TAG_CHANGED, 'b', 'type', None, 'Leg'),
+                                      (scene.TAG_CHANGED, 'a', 'type', 'Arm', None)])
+
+
+    def testSetParentRefusesCycles(self):
+        self.scene.createNode('a')
+        self.scene.createNode('b', parent='a')
+
+        self.assertRaises(scene.SceneError, self.scene.setParent, 'a', 'b')
+        self.assertRaises(scene.SceneError, self.scene.setParent, 'a', 'a')
+
+        self.scene.setParent('b')
+        self.assertIsNone(self.scene.parent('b'))
+        self.assertEqual(self.scene.children('a'), [])
+
+
+    def testAttrs(self):
+        self.scene.createNode('a')
+        self.scene.setAttr('a', 'visibility', False)
+
+        self.assertIs(self.scene.getAttr('a', 'visibility'), False)
+        self.assertEqual(self.scene.listAttrs('a'), ['visibility'])
+        self.assertRaises(scene.SceneError, self.scene.getAttr, 'a', 'missing')
+
+
+    def testRemoveCallback(self):
+        callback = self._recorder('extra')
+        self.scene.addCallback(scene.NODE_ADDED, callback)
+        self.scene.removeCallback(scene.NODE_ADDED, callback)
+        self.scene.createNode('a')
+
+        self.assertEqual(self.events, [(scene.NODE_ADDED, 'a')])
+
+
+class CurrentSceneTest(unittest.TestCase):
+    def testSetCurrent(self):
+        memory_scene = scene.MemoryScene()
+        previous = scene.setCurrent(memory_scene)
+        try:
+            self.assertIs(scene.current(), memory_scene)
+        finally:
+            self.assertIs(scene.setCurrent(previous), memory_scene)
+
+
+if __name__ == '__main__':
+    unittest.main()